@@ -0,0 +1,194 @@
+# cli.py
+"""
+Generación de constancias desde la línea de comandos, sin interfaz gráfica.
+Usa el mismo motor que el botón "Generar Constancias" (GenerationEngine), sin
+importar Qt ni requerir pantalla, para ejecutarse en un servidor.
+
+Ejemplo:
+    python cli.py --plantilla plantilla.pdf --excel participantes.xlsx --salida constancias \\
+        --campo "{{TEXT_1}}=Nombre" --campo "{{TEXT_2}}=Evento" --estilos estilos.json --procesos 8
+
+Códigos de salida: 0 = todo generado, 1 = hubo registros con error o un error
+crítico, 2 = argumentos inválidos, 130 = cancelado con Ctrl+C.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from data_handler import open_records, RecordSource, RecordTable
+from signature import ALG_RSA_PSS, ALG_ED25519, set_validation_text
+from generation_engine import GenerationEngine
+
+EXPORT_MODES = {
+    "individual": "Individual",
+    "combinado": "Un solo PDF combinado",
+}
+ALGORITHMS = {
+    "rsa": ALG_RSA_PSS,
+    "ed25519": ALG_ED25519,
+}
+# Mismos valores por defecto que style_manager
+DEFAULT_MAIN_STYLE = {'font_family': 'Arial', 'font_size': 12, 'font_color': '#000000', 'bold': False}
+DEFAULT_FOLIO_STYLE = {'font_family': 'Arial', 'font_size': 10, 'font_color': '#6c757d', 'bold': True}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Genera constancias de RallyCert sin interfaz gráfica.",
+    )
+    parser.add_argument("--plantilla", required=True, help="Plantilla de constancia (PDF, DOCX o PPTX)")
+    parser.add_argument("--excel", required=True, help="Lista de participantes (Excel, CSV o Parquet)")
+    parser.add_argument("--salida", required=True, help="Carpeta de destino (se crea si no existe)")
+    parser.add_argument("--campo", action="append", default=[], metavar="PLACEHOLDER=COLUMNA",
+                        help='Asigna una columna a un placeholder, p. ej. "{{TEXT_1}}=Nombre" (repetible)')
+    parser.add_argument("--estilos", help="JSON de estilos guardado con style_manager.save_styles")
+    parser.add_argument("--modo", choices=sorted(EXPORT_MODES), default="individual", help="Modo de exportación")
+    parser.add_argument("--columna-archivo", help="Columna para nombrar los archivos (por defecto, el valor de {{TEXT_1}})")
+    parser.add_argument("--sin-firma", action="store_true", help="No firmar digitalmente las constancias")
+    parser.add_argument("--firma-lotes", action="store_true", help="Firma por lotes (una sola firma con árbol de Merkle)")
+    parser.add_argument("--algoritmo", choices=sorted(ALGORITHMS), default="rsa", help="Algoritmo de firma")
+    parser.add_argument("--leyenda", help="Leyenda de validación personalizada")
+    parser.add_argument("--sin-folio", action="store_true", help="No agregar folio")
+    parser.add_argument("--columna-folio", help="Columna con el folio (por defecto, o si la celda está vacía, se genera FOLIO-000001, FOLIO-000002...)")
+    parser.add_argument("--procesos", type=int, default=None,
+                        help="Procesos en paralelo para plantillas PDF (por defecto, uno por núcleo)")
+    parser.add_argument("--reanudar", action="store_true", help="Reanudar el trabajo anterior de la carpeta de salida")
+    parser.add_argument("--silencioso", action="store_true", help="Mostrar solo el progreso y el resumen")
+    return parser.parse_args(argv)
+
+
+def parse_placeholder_map(fields):
+    """Convierte ["{{TEXT_1}}=Nombre", ...] en {"{{TEXT_1}}": "Nombre", ...}"""
+    placeholder_map = {}
+    for field in fields:
+        placeholder, sep, column = field.partition("=")
+        if not sep or not placeholder.strip() or not column.strip():
+            raise ValueError(f'Campo inválido "{field}"; use PLACEHOLDER=COLUMNA')
+        placeholder_map[placeholder.strip()] = column.strip()
+    return placeholder_map
+
+
+def _font_info(style: dict) -> dict:
+    """Estilo de style_manager -> font_info que usa el Worker"""
+    return {
+        'family': style.get('font_family', 'Arial'),
+        'size': style.get('font_size', 12),
+        'bold': style.get('bold', False),
+        'color': style.get('font_color', '#000000'),
+    }
+
+
+def load_font_maps(styles_path, placeholders, enable_folio):
+    """
+    Construye font_map y folio_font_map a partir del JSON de estilos
+    ({'main': {...}, 'folio': {...}}). El estilo 'main' se aplica a todos los placeholders.
+    """
+    main_style, folio_style = DEFAULT_MAIN_STYLE, DEFAULT_FOLIO_STYLE
+    if styles_path:
+        with open(styles_path, 'r', encoding='utf-8') as f:
+            styles = json.load(f)
+        main_style = {**DEFAULT_MAIN_STYLE, **styles.get('main', {})}
+        folio_style = {**DEFAULT_FOLIO_STYLE, **styles.get('folio', {})}
+
+    font_map = {placeholder: _font_info(main_style) for placeholder in placeholders}
+    folio_font_map = _font_info(folio_style) if enable_folio else {}
+    if enable_folio:
+        font_map["{{FOLIO}}"] = folio_font_map
+    return font_map, folio_font_map
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    try:
+        placeholder_map = parse_placeholder_map(args.campo)
+        if not placeholder_map:
+            raise ValueError('Indique al menos un campo, p. ej. --campo "{{TEXT_1}}=Nombre"')
+        if not os.path.isfile(args.plantilla):
+            raise ValueError(f"No existe la plantilla: {args.plantilla}")
+        if args.procesos is not None and args.procesos < 1:
+            raise ValueError("--procesos debe ser 1 o mayor")
+
+        enable_folio = not args.sin_folio
+        font_map, folio_font_map = load_font_maps(args.estilos, placeholder_map.keys(), enable_folio)
+
+        columns, excel_data = open_records(args.excel)
+        requested = list(placeholder_map.values()) + [c for c in (args.columna_archivo, args.columna_folio) if c]
+        missing = [c for c in requested if c not in columns]
+        if missing:
+            raise ValueError(f"Columnas que no existen en el Excel: {', '.join(missing)}")
+        if isinstance(excel_data, (RecordSource, RecordTable)):
+            # Solo se leen las columnas que se usan
+            excel_data = excel_data.select(list(dict.fromkeys(requested)))
+        if not excel_data:
+            raise ValueError("El archivo Excel no tiene registros")
+    except (ValueError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.salida, exist_ok=True)
+    if args.leyenda:
+        set_validation_text(args.leyenda)
+
+    last_progress = [-1]
+
+    def on_progress(value):
+        # Sin interfaz: se informa cada 10 %
+        if args.silencioso and value // 10 != last_progress[0] // 10:
+            print(f"⏳ {value}%", flush=True)
+        last_progress[0] = value
+
+    enable_signature = not args.sin_firma
+    engine = GenerationEngine(
+        args.plantilla,
+        excel_data,
+        args.salida,
+        font_map,
+        placeholder_map,
+        EXPORT_MODES[args.modo],
+        args.columna_archivo,
+        enable_signature,
+        enable_folio,
+        args.columna_folio if enable_folio else None,
+        folio_font_map,
+        args.procesos,
+        enable_signature and args.firma_lotes,
+        ALGORITHMS[args.algoritmo],
+        args.reanudar,
+        on_log=None if args.silencioso else (lambda message: print(message, flush=True)),
+        on_progress=on_progress,
+        on_finished=lambda message: print(message, flush=True),
+    )
+
+    start = time.perf_counter()
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        print("⏹️ Proceso cancelado con Ctrl+C", file=sys.stderr)
+        return 130
+    elapsed = time.perf_counter() - start
+
+    generated = engine.success_count - engine.skipped_count
+    rate = generated / elapsed if elapsed > 0 else 0.0
+    print(f"📊 {generated} constancias generadas en {elapsed:.1f} s "
+          f"({rate:.1f} constancias/s, {1000 * elapsed / max(generated, 1):.0f} ms por constancia)")
+    if engine.skipped_count:
+        print(f"⏭️ {engine.skipped_count} constancias omitidas (ya generadas en el trabajo anterior)")
+    if engine.error_count or engine.sign_error_count:
+        print(f"❌ {engine.error_count} registros con error, {engine.sign_error_count} constancias sin firma",
+              file=sys.stderr)
+
+    if engine.critical_error or engine.error_count or engine.sign_error_count:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Necesario para la generación en paralelo en ejecutables de PyInstaller (Windows)
+    multiprocessing.freeze_support()
+    sys.exit(main())
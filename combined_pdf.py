@@ -0,0 +1,150 @@
+# combined_pdf.py
+"""
+Escritura del PDF combinado por partes. Las constancias se insertan directamente
+desde memoria (sin archivos temporales) y el documento se guarda de forma
+incremental cada cierto número de constancias, para que la memoria no crezca
+con el tamaño del trabajo.
+
+Los objetos que se repiten entre constancias (imágenes y fuentes de la plantilla,
+la marca de agua estática) se guardan una sola vez: cada objeto nuevo se compara
+por contenido con los ya escritos y, si es idéntico, se reutiliza el existente.
+"""
+
+import os
+import re
+import hashlib
+import fitz  # PyMuPDF
+
+# Constancias que se acumulan en memoria antes de escribirlas al archivo
+DEFAULT_CHUNK_SIZE = 200
+
+# Referencia indirecta dentro de la definición de un objeto ("12 0 R")
+_REF_PATTERN = re.compile(r"(?<![\d.])(\d+) 0 R(?![A-Za-z0-9])")
+
+
+class CombinedPdfWriter:
+    def __init__(self, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.output_path = output_path
+        self.chunk_size = max(1, chunk_size)
+        self.doc = fitz.open()
+        self.pending = 0          # Constancias insertadas desde el último guardado
+        self.saved = False        # Si el archivo ya existe en disco con una parte del trabajo
+        self.count = 0            # Total de constancias insertadas
+        self._known_objects = {}  # hash del contenido -> xref del objeto ya guardado
+        self.duplicates_removed = 0
+        self.bytes_saved = 0
+
+    def add_document(self, source_doc):
+        """Inserta todas las páginas de un documento PyMuPDF abierto"""
+        first_new_xref = self.doc.xref_length()
+        self.doc.insert_pdf(source_doc)
+        self._deduplicate(first_new_xref)
+        self.pending += 1
+        self.count += 1
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def add_bytes(self, pdf_bytes: bytes):
+        """Inserta una constancia serializada (ver PdfProcessor.to_bytes)"""
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as source_doc:
+            self.add_document(source_doc)
+
+    def add_file(self, pdf_path: str):
+        """Inserta una constancia ya guardada en disco (plantillas Word/PowerPoint)"""
+        with fitz.open(pdf_path) as source_doc:
+            self.add_document(source_doc)
+
+    def _deduplicate(self, first_new_xref: int):
+        """
+        Reemplaza los objetos recién insertados que son idénticos a uno ya existente.
+        Un objeto es idéntico si su definición (con las referencias ya resueltas a los
+        objetos compartidos) y su stream coinciden byte por byte. Las páginas nunca se
+        comparten. Los duplicados quedan como null y no ocupan espacio en el archivo.
+        """
+        doc = self.doc
+        canonical = {}   # xref nuevo -> xref que lo sustituye (él mismo si es único)
+        rewritten = {}   # xref nuevo -> definición con referencias actualizadas
+        in_progress = set()
+
+        def resolve(xref):
+            if xref < first_new_xref or xref >= doc.xref_length():
+                return xref
+            if xref in canonical:
+                return canonical[xref]
+            if xref in in_progress:
+                # Referencia circular (p. ej. anotación -> página): se deja sin compartir
+                return xref
+            in_progress.add(xref)
+            definition = doc.xref_object(xref, compressed=True)
+            definition = _REF_PATTERN.sub(lambda m: f"{resolve(int(m.group(1)))} 0 R", definition)
+            in_progress.discard(xref)
+            rewritten[xref] = definition
+
+            target = xref
+            if doc.xref_get_key(xref, "Type") != ("name", "/Page"):
+                raw = doc.xref_stream_raw(xref) if doc.xref_is_stream(xref) else b""
+                key = hashlib.sha256(definition.encode("utf-8", "surrogatepass") + b"\0" + raw).digest()
+                target = self._known_objects.setdefault(key, xref)
+                if target != xref:
+                    self.duplicates_removed += 1
+                    self.bytes_saved += len(definition) + len(raw)
+            canonical[xref] = target
+            return target
+
+        for xref in range(first_new_xref, doc.xref_length()):
+            resolve(xref)
+
+        for xref, target in canonical.items():
+            if target != xref:
+                doc.update_object(xref, "null")
+            elif rewritten[xref] != doc.xref_object(xref, compressed=True):
+                doc.update_object(xref, rewritten[xref])
+
+    def flush(self):
+        """
+        Escribe al archivo lo acumulado y vuelve a abrirlo. Al reabrir, PyMuPDF solo
+        carga los objetos que se usan, así que las partes ya guardadas salen de memoria.
+        """
+        if not self.pending:
+            return
+        self._save()
+        self.doc.close()
+        self.doc = fitz.open(self.output_path)
+        self.pending = 0
+
+    def finish(self, before_save=None):
+        """
+        Guarda la última parte y cierra el documento.
+
+        Args:
+            before_save: función opcional que recibe el documento abierto justo antes
+                         del guardado final (por ejemplo, para estampar la firma).
+        """
+        try:
+            if before_save is not None:
+                before_save(self.doc)
+            self._save()
+        finally:
+            self.close()
+
+    def abort(self):
+        """Descarta el trabajo: cierra el documento y elimina las partes ya guardadas"""
+        self.close()
+        if self.saved and os.path.exists(self.output_path):
+            try:
+                os.remove(self.output_path)
+            except Exception:
+                pass
+
+    def close(self):
+        if not self.doc.is_closed:
+            self.doc.close()
+
+    def _save(self):
+        if self.saved:
+            # Solo se agregan al final del archivo los objetos nuevos o modificados
+            self.doc.save(self.output_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+        else:
+            # garbage=1 descarta los duplicados sin renumerar los objetos ya registrados
+            self.doc.save(self.output_path, garbage=1, deflate=True)
+            self.saved = True
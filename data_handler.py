@@ -1,17 +1,1051 @@
 # data_handler.py
+"""
+Lectura de listas de participantes. Formatos: Excel (.xlsx/.xlsm fila por fila,
+.xls con pandas), CSV (fila por fila) y Parquet (solo las columnas que se usan).
+Todos entregan registros {columna: texto} con la misma normalización de valores;
+las listas ya cargadas se guardan por columnas en un RecordTable. Para llenar los
+selectores de columnas basta read_header; la lista completa se lee en segundo plano.
+"""
+
+import os
+import re
+import sys
+import csv
+import copy
+import codecs
+import marshal
+import hashlib
+import zipfile
+import posixpath
+import threading
+from abc import ABC, abstractmethod
+from itertools import islice
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Iterator
+from xml.etree.ElementTree import fromstring, iterparse
+
 import pandas as pd
-from typing import List, Dict, Tuple
+from openpyxl import load_workbook
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601, MAC_EPOCH, WINDOWS_EPOCH
+
+# Formatos que openpyxl lee en modo de solo lectura (fila por fila, sin cargar el libro)
+STREAMING_EXTENSIONS = ('.xlsx', '.xlsm')
+CSV_EXTENSIONS = ('.csv', '.tsv', '.txt')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+# Filtro para los diálogos de selección de archivo
+FILE_DIALOG_FILTER = ("Listas de participantes (*.xlsx *.xlsm *.xls *.csv *.tsv *.parquet);;"
+                      "Excel (*.xlsx *.xlsm *.xls);;CSV (*.csv *.tsv *.txt);;Parquet (*.parquet *.pq);;"
+                      "Todos los archivos (*)")
+# Etiqueta de fila en el XML de la hoja (con o sin prefijo de espacio de nombres)
+_ROW_TAG = re.compile(rb"<(?:\w+:)?row[\s>/]")
+_CSV_DELIMITERS = ",;\t|"
+_SAMPLE_SIZE = 64 * 1024
+# Valores distintos por columna que RecordTable comparte como un solo objeto str
+_SHARED_VALUES_LIMIT = 65536
+
+# Caché de listas ya leídas (ver get_excel_data)
+MEMORY_CACHE_SIZE = 4      # Listas que se conservan en memoria
+DISK_CACHE_FILES = 16      # Listas que se conservan en disco (si está habilitado)
+_DISK_CACHE_VERSION = 2  # Subir cuando cambie la normalización de valores
+_DISK_CACHE_SEPARATOR = "\0"
+# Formatos lentos de interpretar, los únicos que vale la pena guardar en disco
+_DISK_CACHE_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_disk_cache_dir = None
+
+# Lecturas completas en segundo plano (ver load_in_background)
+BACKGROUND_LOADERS = 2
+_loader = None
+_pending_loads = {}
+
+
+def normalize_value(value) -> str:
+    """
+    Convierte el valor de una celda al texto que se usa en las constancias.
+    Vacío -> '', números enteros sin ".0" (folios, matrículas), fechas como las mostraba
+    pandas: solo la fecha ("2024-03-01") si no tienen hora, si no "2024-03-01 14:30:00".
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ''
+        if value.is_integer():
+            return str(int(value))
+        return str(value)
+    # pandas representa las celdas vacías como NaT/NA en columnas de fechas o enteros
+    if value is pd.NaT or value is pd.NA:
+        return ''
+    if isinstance(value, datetime) and value.tzinfo is None \
+            and not (value.hour or value.minute or value.second or value.microsecond):
+        return value.date().isoformat()
+    return str(value)
+
+
+def _is_blank_row(row) -> bool:
+    return all(value is None or value == '' for value in row)
+
+
+def _count_sheet_rows(workbook, sheet) -> int:
+    """
+    Cuenta las filas de una hoja sin dimensión guardada buscando las etiquetas <row>
+    en su XML, sin interpretar las celdas (mucho más rápido que recorrerla con openpyxl).
+    """
+    count = 0
+    tail = b""
+    with workbook._archive.open(sheet._worksheet_path) as xml:
+        for chunk in iter(lambda: xml.read(1024 * 1024), b""):
+            data = tail + chunk
+            # Las coincidencias que terminan dentro de tail ya se contaron en el bloque anterior
+            count += sum(1 for m in _ROW_TAG.finditer(data) if m.end() > len(tail))
+            tail = data[-16:]
+    return count
+
+
+def _unique_headers(raw_headers) -> List[str]:
+    """Nombres de columna como los genera pandas: "Unnamed: N" para vacíos y "Col.1" para repetidos"""
+    headers = []
+    seen = {}
+    for i, raw in enumerate(raw_headers):
+        name = normalize_value(raw) or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        headers.append(name)
+    return headers
+
+
+class RecordSource(ABC):
+    """
+    Lista de participantes que se lee al recorrerla, sin cargarla completa en memoria.
+    Se puede pasar directamente al Worker en lugar de la lista de registros.
+
+    - columns: todas las columnas del archivo
+    - select(columnas): la misma fuente entregando solo esas columnas (no vuelve a abrir el archivo)
+    - len(): número de filas conocido desde el principio, para el progreso (en Excel y CSV
+      puede incluir filas vacías, que no se entregan como registros)
+    - iter(): registros {columna: texto}; cada recorrido vuelve a leer el archivo
+    """
+    format_name = "archivo"
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.columns = []
+        self.selected_columns = []
+        self.total_rows = 0
+        self._positions = []
+
+    def _select(self, columns: List[str]):
+        missing = [c for c in columns if c not in self.columns]
+        if missing:
+            raise ValueError(f"Columnas que no existen en el {self.format_name}: {', '.join(missing)}")
+        self.selected_columns = list(columns)
+        self._positions = [(name, self.columns.index(name)) for name in self.selected_columns]
+
+    def select(self, columns: List[str]) -> "RecordSource":
+        """Misma fuente, leyendo solo las columnas indicadas"""
+        source = copy.copy(self)
+        source._select(columns)
+        return source
+
+    def __len__(self) -> int:
+        return self.total_rows
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        pass
+
+
+class ExcelRecordStream(RecordSource):
+    """
+    Registros de un archivo .xlsx leídos fila por fila (openpyxl en modo de solo
+    lectura), sin cargar el libro completo en memoria.
+
+    Args:
+        file_path: Archivo .xlsx
+        columns: Columnas que se incluyen en cada registro (None = todas)
+        sheet: Nombre de la hoja (None = la hoja activa)
+    """
+    format_name = "Excel"
+
+    def __init__(self, file_path: str, columns: Optional[List[str]] = None, sheet: Optional[str] = None):
+        super().__init__(file_path)
+        self.sheet = sheet
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = self._sheet(workbook)
+            header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            self.columns = _unique_headers(header_row)
+            # Número de filas según la dimensión guardada en la hoja (no requiere leerla)
+            max_row = sheet.max_row
+            if max_row is None:
+                # Algunos programas no guardan la dimensión
+                max_row = _count_sheet_rows(workbook, sheet)
+        finally:
+            workbook.close()
+
+        self.total_rows = max(0, max_row - 1)
+        self._select(self.columns if columns is None else columns)
+
+    def _sheet(self, workbook):
+        if self.sheet is None:
+            return workbook.active
+        if self.sheet not in workbook.sheetnames:
+            raise ValueError(f"El archivo no tiene la hoja '{self.sheet}'")
+        return workbook[self.sheet]
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            for row in self._sheet(workbook).iter_rows(min_row=2, values_only=True):
+                # Filas completamente vacías (p. ej. con formato al final de la hoja) no son registros
+                if _is_blank_row(row):
+                    continue
+                yield {
+                    name: normalize_value(row[pos]) if pos < len(row) else ''
+                    for name, pos in self._positions
+                }
+        finally:
+            workbook.close()
+
+
+class RecordView:
+    """
+    Fila de un RecordTable. Se comporta como el dict {columna: texto} de antes
+    (get, [], in, keys, items), pero no copia los valores: los lee de las columnas.
+    """
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "RecordTable", index: int):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, column: str) -> str:
+        return self._table._data[column][self._index]
+
+    def get(self, column: str, default=None):
+        values = self._table._data.get(column)
+        return default if values is None else values[self._index]
+
+    def __contains__(self, column) -> bool:
+        return column in self._table._data
+
+    def __iter__(self):
+        return iter(self._table.columns)
+
+    def __len__(self) -> int:
+        return len(self._table.columns)
+
+    def keys(self):
+        return list(self._table.columns)
+
+    def values(self):
+        return [self._table._data[c][self._index] for c in self._table.columns]
+
+    def items(self):
+        return [(c, self._table._data[c][self._index]) for c in self._table.columns]
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self.items())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (RecordView, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"RecordView({self.to_dict()!r})"
+
+
+class RecordTable:
+    """
+    Lista de participantes cargada en memoria, guardada por columnas: una lista de
+    textos por columna, y los valores repetidos (evento, escuela, '') se comparten como
+    un solo objeto. Se recorre y se indexa como la lista de registros de antes, pero
+    cada fila es un RecordView. La aceptan directamente el Worker y el EmailSender.
+    """
+    def __init__(self, columns: List[str], data: Optional[Dict[str, List[str]]] = None):
+        self.columns = list(columns)
+        self._data = data if data is not None else {c: [] for c in self.columns}
+        self._length = len(self._data[self.columns[0]]) if self.columns else 0
+
+    @classmethod
+    def from_records(cls, records, columns: Optional[List[str]] = None) -> "RecordTable":
+        """Construye la tabla a partir de registros {columna: texto} (lista, RecordSource...)"""
+        if columns is None:
+            columns = getattr(records, "selected_columns", None)
+        if columns is None:
+            records = list(records)
+            columns = list(dict.fromkeys(c for record in records for c in record.keys()))
+
+        data = {c: [] for c in columns}
+        shared = {c: {} for c in columns}
+        length = 0
+        for record in records:
+            for column in columns:
+                value = record.get(column, '')
+                value = value if isinstance(value, str) else normalize_value(value)
+                pool = shared[column]
+                if pool is not None:
+                    value = pool.setdefault(value, value)
+                    if len(pool) > _SHARED_VALUES_LIMIT:
+                        # Columna casi sin repetidos (nombres, correos): no vale la pena compartir
+                        shared[column] = None
+                data[column].append(value)
+            length += 1
+        table = cls(columns, data)
+        table._length = length
+        return table
+
+    @classmethod
+    def from_dataframe(cls, df) -> "RecordTable":
+        """Construye la tabla a partir de un DataFrame de pandas, con la misma normalización"""
+        columns = _unique_headers(df.columns.tolist())
+        values = [[normalize_value(value) for value in df.iloc[:, i].tolist()] for i in range(len(columns))]
+        # Filas completamente vacías no son registros
+        keep = [i for i in range(len(df)) if any(column[i] for column in values)]
+        if len(keep) != len(df):
+            values = [[column[i] for i in keep] for column in values]
+        table = cls(columns, dict(zip(columns, values)))
+        table._length = len(keep)
+        return table
+
+    def column(self, name: str) -> List[str]:
+        """Todos los valores de una columna"""
+        return self._data[name]
+
+    def select(self, columns: List[str]) -> "RecordTable":
+        """Tabla con solo las columnas indicadas (comparte las listas, no copia)"""
+        missing = [c for c in columns if c not in self._data]
+        if missing:
+            raise ValueError(f"Columnas que no existen en la lista: {', '.join(missing)}")
+        table = RecordTable(columns, {c: self._data[c] for c in columns})
+        table._length = self._length
+        return table
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> RecordView:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("índice de registro fuera de rango")
+        return RecordView(self, index)
+
+    def __iter__(self) -> Iterator[RecordView]:
+        for index in range(self._length):
+            yield RecordView(self, index)
+
+
+def _detect_csv_encoding(file_path: str) -> str:
+    """UTF-8 (con o sin BOM) si todo el archivo es válido; si no, Windows-1252 (exportaciones de Excel)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _sniff_dialect(file_path: str, sample: str):
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=_CSV_DELIMITERS)
+    except csv.Error:
+        # Una sola columna o muestra ambigua
+        return csv.excel_tab if os.path.splitext(file_path)[1].lower() == '.tsv' else csv.excel
+
+
+def _count_lines(file_path: str) -> int:
+    """Líneas del archivo (un campo entre comillas con saltos de línea cuenta de más)"""
+    with open(file_path, "rb") as f:
+        lines = 0
+        last = b"\n"
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+        if last != b"\n":
+            lines += 1
+    return lines
+
+
+class CsvRecordSource(RecordSource):
+    """
+    Registros de un archivo CSV leídos fila por fila con el módulo csv. El separador
+    (coma, punto y coma, tabulador o barra) y la codificación se detectan solos.
+    Los valores se entregan como texto tal cual: "00123" sigue siendo "00123".
+    """
+    format_name = "CSV"
+
+    def __init__(self, file_path: str, columns: Optional[List[str]] = None):
+        super().__init__(file_path)
+        self.encoding = _detect_csv_encoding(file_path)
+        with open(file_path, "r", encoding=self.encoding, newline="") as f:
+            self.dialect = _sniff_dialect(file_path, f.read(_SAMPLE_SIZE))
+
+        with open(file_path, "r", encoding=self.encoding, newline="") as f:
+            self.columns = _unique_headers(next(csv.reader(f, self.dialect), []))
+
+        self.total_rows = max(0, _count_lines(file_path) - 1)
+        self._select(self.columns if columns is None else columns)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        with open(self.file_path, "r", encoding=self.encoding, newline="") as f:
+            reader = csv.reader(f, self.dialect)
+            next(reader, None)
+            for row in reader:
+                if _is_blank_row(row):
+                    continue
+                yield {
+                    name: row[pos] if pos < len(row) else ''
+                    for name, pos in self._positions
+                }
+
+
+class ParquetRecordSource(RecordSource):
+    """
+    Registros de un archivo Parquet (requiere pyarrow). Solo se leen del disco las
+    columnas seleccionadas, por bloques; el número de filas viene en los metadatos.
+    """
+    format_name = "Parquet"
+    BATCH_SIZE = 10000
+
+    def __init__(self, file_path: str, columns: Optional[List[str]] = None):
+        super().__init__(file_path)
+        parquet = self._parquet_module()
+        parquet_file = parquet.ParquetFile(file_path)
+        self._field_names = parquet_file.schema_arrow.names
+        self.columns = _unique_headers(self._field_names)
+        self.total_rows = parquet_file.metadata.num_rows
+        self._select(self.columns if columns is None else columns)
+
+    @staticmethod
+    def _parquet_module():
+        # Importación diferida: pyarrow solo es necesario para leer Parquet
+        try:
+            import pyarrow.parquet as parquet
+        except ImportError:
+            raise ValueError("Para leer archivos Parquet instale pyarrow (pip install pyarrow)")
+        return parquet
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        parquet_file = self._parquet_module().ParquetFile(self.file_path)
+        names = [name for name, _ in self._positions]
+        fields = [self._field_names[pos] for _, pos in self._positions]
+        if not fields:
+            return
+        try:
+            for batch in parquet_file.iter_batches(batch_size=self.BATCH_SIZE, columns=fields):
+                columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+                for values in zip(*columns):
+                    yield {name: normalize_value(value) for name, value in zip(names, values)}
+        finally:
+            parquet_file.close()
+
+
+def _source_class(file_path: str):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in STREAMING_EXTENSIONS:
+        return ExcelRecordStream
+    if ext in CSV_EXTENSIONS:
+        return CsvRecordSource
+    if ext in PARQUET_EXTENSIONS:
+        return ParquetRecordSource
+    return None
+
+
+def _format_name(file_path: str) -> str:
+    source_class = _source_class(file_path)
+    return source_class.format_name if source_class else "Excel"
+
+
+def open_record_source(file_path: str, columns: Optional[List[str]] = None, sheet: Optional[str] = None) -> RecordSource:
+    """Fuente de registros para el archivo según su extensión (.xls no se puede leer por partes)"""
+    source_class = _source_class(file_path)
+    if source_class is None:
+        raise ValueError(f"Formato no soportado para lectura por partes: {os.path.basename(file_path)}")
+    if source_class is ExcelRecordStream:
+        return ExcelRecordStream(file_path, columns, sheet)
+    return source_class(file_path, columns)
+
+
+def _read_table(file_path: str, sheet: Optional[str]) -> RecordTable:
+    if _source_class(file_path) is not None:
+        return RecordTable.from_records(open_record_source(file_path, sheet=sheet))
+    # .xls y otros formatos que solo lee pandas, con la misma normalización que las demás fuentes
+    return RecordTable.from_dataframe(pd.read_excel(file_path, sheet_name=sheet or 0, dtype=object))
+
+
+# --- Caché de listas leídas ---
+
+def default_disk_cache_dir() -> str:
+    """Carpeta de caché de la plataforma: %APPDATA% en Windows, Library/Caches en macOS, XDG en Linux"""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Roaming")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "RallyCert", "listas")
 
-def get_excel_data(file_path: str) -> Tuple[List[str], List[Dict[str, str]]]:
+
+def enable_disk_cache(directory: Optional[str] = None):
+    """
+    Guarda también en disco las listas de Excel ya leídas, para que abrir el mismo
+    archivo en otra sesión sea inmediato. Los archivos contienen los datos de la lista
+    sin cifrar, por eso la caché solo se activa si el usuario lo pide.
+    Por defecto en default_disk_cache_dir().
+    """
+    global _disk_cache_dir
+    if directory is None:
+        directory = default_disk_cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _disk_cache_dir = directory
+    except OSError as e:
+        print(f"[data] Warning: no se pudo crear la caché de listas: {e}")
+        _disk_cache_dir = None
+
+
+def disable_disk_cache():
+    """
+    Deja de usar la caché en disco. Si su carpeta quedó vacía (clear_cache(disk=True))
+    se elimina, para que disk_cache_exists() la dé por desactivada en la siguiente sesión.
+    """
+    global _disk_cache_dir
+    if _disk_cache_dir:
+        try:
+            os.rmdir(_disk_cache_dir)
+        except OSError:
+            pass  # Aún tiene archivos o ya no existe
+    _disk_cache_dir = None
+
+
+def disk_cache_exists(directory: Optional[str] = None) -> bool:
+    """
+    La carpeta de la caché en disco existe: el usuario la activó en una sesión anterior
+    y no la desactivó. Así la preferencia se conserva sin otro archivo de configuración.
+    """
+    return os.path.isdir(directory or default_disk_cache_dir())
+
+
+def clear_cache(disk: bool = False):
+    """Vacía la caché en memoria y, si se indica, los archivos de la caché en disco"""
+    with _cache_lock:
+        _memory_cache.clear()
+    if disk and _disk_cache_dir:
+        for name in os.listdir(_disk_cache_dir):
+            if name.endswith(".cache"):
+                try:
+                    os.remove(os.path.join(_disk_cache_dir, name))
+                except OSError:
+                    pass
+
+
+def _cache_key(file_path: str, sheet: Optional[str]):
+    """Clave en memoria: el archivo cambió si cambian su fecha de modificación o su tamaño"""
+    stat = os.stat(file_path)
+    return (os.path.normcase(os.path.abspath(file_path)), stat.st_mtime_ns, stat.st_size, sheet)
+
+
+def _disk_cache_path(file_path: str, sheet: Optional[str]) -> str:
+    """Archivo en disco nombrado por el hash del contenido (sirve aunque se copie o se mueva)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(f"\0{sheet or ''}".encode("utf-8"))
+    return os.path.join(_disk_cache_dir, digest.hexdigest() + ".cache")
+
+
+def _share_values(values: List[str]) -> List[str]:
+    """Vuelve a compartir los valores repetidos de una columna como un solo objeto str"""
+    pool = {}
+    shared = []
+    for value in values:
+        if len(pool) <= _SHARED_VALUES_LIMIT:
+            value = pool.setdefault(value, value)
+        shared.append(value)
+    return shared
+
+
+def _load_from_disk(path: str) -> Optional[RecordTable]:
+    try:
+        with open(path, "rb") as f:
+            version, columns, joined, length = marshal.load(f)
+        if version != _DISK_CACHE_VERSION:
+            return None
+        values = [_share_values(column.split(_DISK_CACHE_SEPARATOR)) if length else [] for column in joined]
+        table = RecordTable(columns, dict(zip(columns, values)))
+        table._length = length
+        os.utime(path)  # Los archivos usados recientemente son los últimos en descartarse
+        return table
+    except (OSError, EOFError, ValueError, TypeError):
+        # Caché de otra versión de Python o dañada: se vuelve a leer la lista
+        return None
+
+
+def _save_to_disk(path: str, table: RecordTable):
+    # Cada columna se guarda como un solo texto separado por \0: marshal lo lee de un
+    # golpe y split() lo divide en C, mucho más rápido que una lista de miles de textos
+    joined = []
+    for column in table.columns:
+        values = table.column(column)
+        if any(_DISK_CACHE_SEPARATOR in value for value in values):
+            return  # Caso extremo: un valor con \0 no se puede guardar así
+        joined.append(_DISK_CACHE_SEPARATOR.join(values))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            marshal.dump((_DISK_CACHE_VERSION, table.columns, joined, len(table)), f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"[data] Warning: no se pudo guardar la lista en la caché: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return
+
+    # Conservar solo las DISK_CACHE_FILES listas usadas más recientemente
+    try:
+        cached = [os.path.join(_disk_cache_dir, n) for n in os.listdir(_disk_cache_dir) if n.endswith(".cache")]
+        cached.sort(key=os.path.getmtime, reverse=True)
+        for old in cached[DISK_CACHE_FILES:]:
+            os.remove(old)
+    except OSError:
+        pass
+
+
+def _in_disk_cache(file_path: str, sheet: Optional[str] = None) -> bool:
+    if _disk_cache_dir is None or os.path.splitext(file_path)[1].lower() not in _DISK_CACHE_EXTENSIONS:
+        return False
+    try:
+        return os.path.exists(_disk_cache_path(file_path, sheet))
+    except OSError:
+        return False
+
+
+def get_excel_data(file_path: str, sheet: Optional[str] = None) -> Tuple[List[str], RecordTable]:
+    """
+    Lee la lista completa: columnas y un RecordTable con todos los registros.
+    El resultado se guarda en caché (memoria y, si está habilitado, disco): volver a
+    pedir el mismo archivo sin cambios no lo vuelve a interpretar.
+    """
+    try:
+        key = _cache_key(file_path, sheet)
+        with _cache_lock:
+            table = _memory_cache.get(key)
+            if table is not None:
+                _memory_cache.move_to_end(key)
+                return table.columns, table
+
+        use_disk = _disk_cache_dir is not None and os.path.splitext(file_path)[1].lower() in _DISK_CACHE_EXTENSIONS
+        disk_path = _disk_cache_path(file_path, sheet) if use_disk else None
+        table = _load_from_disk(disk_path) if disk_path and os.path.exists(disk_path) else None
+        if table is None:
+            table = _read_table(file_path, sheet)
+            if disk_path:
+                _save_to_disk(disk_path, table)
+
+        with _cache_lock:
+            _memory_cache[key] = table
+            _memory_cache.move_to_end(key)
+            while len(_memory_cache) > MEMORY_CACHE_SIZE:
+                _memory_cache.popitem(last=False)
+        return table.columns, table
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el archivo {_format_name(file_path)}: {e}")
+
+
+def get_cached_data(file_path: str, sheet: Optional[str] = None) -> Optional[Tuple[List[str], RecordTable]]:
+    """Lista ya leída en memoria si el archivo no cambió; None si habría que leerla"""
+    try:
+        key = _cache_key(file_path, sheet)
+    except OSError:
+        return None
+    with _cache_lock:
+        table = _memory_cache.get(key)
+    return (table.columns, table) if table is not None else None
+
+
+def open_records(file_path: str):
+    """
+    Igual que get_excel_data, pero sin leer los registros todavía: devuelve una
+    RecordSource que se recorre cuando se generan las constancias (.xls se carga completo).
+    Si la lista ya está en caché se devuelve directamente.
+    """
+    cached = get_cached_data(file_path)
+    if cached is not None:
+        return cached
+    if _source_class(file_path) is None or _in_disk_cache(file_path):
+        return get_excel_data(file_path)
+    try:
+        source = open_record_source(file_path)
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el archivo {_format_name(file_path)}: {e}")
+    return source.columns, source
+
+
+# --- Lectura rápida de encabezados y carga en segundo plano ---
+
+def _local_name(tag: str) -> str:
+    """Nombre de la etiqueta o atributo XML sin el espacio de nombres"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _rich_text(element) -> str:
+    """Texto de un <si> o <is>: sus <t> y los de cada tramo <r> (sin la fonética <rPh>)"""
+    parts = []
+    for child in element:
+        name = _local_name(child.tag)
+        if name == "t":
+            parts.append(child.text or "")
+        elif name == "r":
+            parts.extend(sub.text or "" for sub in child if _local_name(sub.tag) == "t")
+    return "".join(parts)
+
+
+def _xlsx_sheet_path(archive, sheet: Optional[str]):
+    """Ruta del XML de la hoja dentro del .xlsx (la activa si sheet es None) y la época de sus fechas"""
+    workbook = fromstring(archive.read("xl/workbook.xml"))
+    entries = []
+    active = None
+    epoch = WINDOWS_EPOCH
+    for element in workbook.iter():
+        name = _local_name(element.tag)
+        if name == "sheet":
+            rel_id = next((v for k, v in element.attrib.items() if _local_name(k) == "id"), None)
+            entries.append((element.get("name"), rel_id))
+        elif name == "workbookView" and active is None:
+            active = int(element.get("activeTab", 0))
+        elif name == "workbookPr" and element.get("date1904") in ("1", "true"):
+            epoch = MAC_EPOCH
+
+    if sheet is None:
+        rel_id = entries[min(active or 0, len(entries) - 1)][1]
+    else:
+        rel_id = next((rel for name, rel in entries if name == sheet), None)
+        if rel_id is None:
+            raise ValueError(f"El archivo no tiene la hoja '{sheet}'")
+
+    rels = fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    target = next(r.get("Target") for r in rels if r.get("Id") == rel_id)
+    if target.startswith("/"):
+        return target[1:], epoch
+    return posixpath.normpath(posixpath.join("xl", target)), epoch
+
+
+def _xlsx_head_rows(archive, path: str, sample_rows: int):
+    """
+    Primeras filas de la hoja como (número, {columna: (tipo, valor, estilo)}): la del
+    encabezado y hasta sample_rows con datos. Deja de leer el XML en cuanto las tiene.
+    También devuelve la última fila y la última columna según <dimension> (None si la
+    hoja no la guarda).
+    """
+    rows = []
+    data_rows = 0
+    last_row = last_column = None
+    next_index = 1
+    with archive.open(path) as xml:
+        for _, element in iterparse(xml):
+            name = _local_name(element.tag)
+            if name == "dimension":
+                last = element.get("ref", "").split(":")[-1].replace("$", "")
+                letters = last.rstrip("0123456789")
+                digits = last[len(letters):]
+                last_row = int(digits) if digits else None
+                last_column = column_index_from_string(letters) if letters.isalpha() else None
+            elif name == "row":
+                index = int(element.get("r", next_index))
+                next_index = index + 1
+                cells = {}
+                column = 0
+                for cell in element:
+                    if _local_name(cell.tag) != "c":
+                        continue
+                    ref = cell.get("r")
+                    column = column_index_from_string(ref.rstrip("0123456789").lstrip("$")) if ref else column + 1
+                    value = None
+                    for child in cell:
+                        child_name = _local_name(child.tag)
+                        if child_name == "v":
+                            value = child.text or None
+                        elif child_name == "is":
+                            value = _rich_text(child)
+                    cells[column] = (cell.get("t", "n"), value, cell.get("s"))
+                element.clear()
+                rows.append((index, cells))
+                if index > 1 and any(value is not None for _, value, _ in cells.values()):
+                    data_rows += 1
+                if data_rows >= sample_rows:
+                    break
+            elif name == "sheetData":
+                break
+    return rows, last_row, last_column
+
+
+def _xlsx_shared_strings(archive, needed) -> Dict[int, str]:
+    """Solo los textos compartidos indicados: se deja de leer al llegar al último"""
+    strings = {}
+    if not needed:
+        return strings
+    last = max(needed)
+    index = 0
+    with archive.open("xl/sharedStrings.xml") as xml:
+        for _, element in iterparse(xml):
+            if _local_name(element.tag) != "si":
+                continue
+            if index in needed:
+                strings[index] = _rich_text(element)
+            element.clear()
+            index += 1
+            if index > last:
+                break
+    return strings
+
+
+def _xlsx_date_styles(archive) -> Dict[int, bool]:
+    """Estilos de celda con formato de fecha -> True si es una duración ([h]:mm)"""
     try:
-        df = pd.read_excel(file_path)
-        df.fillna('', inplace=True)
-        
-        for col in df.columns:
-            df[col] = df[col].astype(str)
+        styles = fromstring(archive.read("xl/styles.xml"))
+    except KeyError:
+        return {}
+    custom = {}
+    cell_xfs = None
+    for element in styles.iter():
+        name = _local_name(element.tag)
+        if name == "numFmt":
+            custom[int(element.get("numFmtId"))] = element.get("formatCode", "")
+        elif name == "cellXfs":
+            cell_xfs = element
+    date_styles = {}
+    xfs = [xf for xf in cell_xfs if _local_name(xf.tag) == "xf"] if cell_xfs is not None else []
+    for i, xf in enumerate(xfs):
+        fmt_id = int(xf.get("numFmtId", 0))
+        code = custom.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id)
+        if code and is_date_format(code):
+            date_styles[i] = is_timedelta_format(code)
+    return date_styles
+
+
+def _xlsx_value(kind: str, text: Optional[str], style: Optional[str], strings, date_styles, epoch):
+    """Valor de la celda con los mismos tipos que entrega openpyxl"""
+    if text is None:
+        return None
+    if kind == "s":
+        return strings.get(int(text), "")
+    if kind == "b":
+        return bool(int(text))
+    if kind == "d":
+        return from_ISO8601(text)
+    if kind != "n":
+        return text  # str, inlineStr y errores (#N/A)
+    number = float(text) if any(c in text for c in ".eE") else int(text)
+    if style and int(style) in date_styles:
+        try:
+            return from_excel(number, epoch, timedelta=date_styles[int(style)])
+        except (OverflowError, ValueError):
+            return "#VALUE!"
+    return number
+
+
+def _read_xlsx_head(file_path: str, sample_rows: int, sheet: Optional[str]):
+    """
+    Encabezados, filas de muestra y filas de la hoja (None si no guarda su dimensión)
+    leyendo directamente el XML del .xlsx. openpyxl carga siempre todos los textos
+    compartidos (y sin dimensión recorre la hoja completa) aunque solo se pida la primera fila.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        path, epoch = _xlsx_sheet_path(archive, sheet)
+        rows, last_row, last_column = _xlsx_head_rows(archive, path, sample_rows)
+        cells = [cell for _, row in rows for cell in row.values()]
+        strings = _xlsx_shared_strings(archive, {int(text) for kind, text, _ in cells if kind == "s" and text})
+        date_styles = _xlsx_date_styles(archive) if any(kind == "n" and style for kind, _, style in cells) else {}
+
+    def values(row, width):
+        return [_xlsx_value(*row[c], strings, date_styles, epoch) if c in row else None
+                for c in range(1, width + 1)]
+
+    header = next((row for index, row in rows if index == 1), {})
+    # Como openpyxl, el ancho es el de <dimension>: una última columna con datos pero sin
+    # encabezado también cuenta (Unnamed: N). Sin dimensión, la fila más ancha leída.
+    width = max([last_column or 0] + [max(row, default=0) for _, row in rows])
+    columns = _unique_headers(values(header, width))
+    sample = []
+    for index, row in rows:
+        if index == 1:
+            continue
+        row_values = values(row, len(columns))
+        if not _is_blank_row(row_values):
+            sample.append({name: normalize_value(value) for name, value in zip(columns, row_values)})
+    total_rows = max(0, last_row - 1) if last_row is not None else None
+    return columns, sample[:sample_rows], total_rows
+
+
+def _read_csv_head(file_path: str, sample_rows: int):
+    # Misma codificación que CsvRecordSource: revisar el archivo completo es solo leerlo
+    # (sin interpretarlo) y evita nombres de columna distintos si cambia más adelante
+    encoding = _detect_csv_encoding(file_path)
+    with open(file_path, "r", encoding=encoding, newline="") as f:
+        dialect = _sniff_dialect(file_path, f.read(_SAMPLE_SIZE))
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        columns = _unique_headers(next(reader, []))
+        rows = islice((row for row in reader if not _is_blank_row(row)), sample_rows)
+        sample = [{name: row[i] if i < len(row) else '' for i, name in enumerate(columns)} for row in rows]
+    return columns, sample
 
-        columns = df.columns.tolist()
-        records = df.to_dict('records')
-        return columns, records
+
+def _read_parquet_head(file_path: str, sample_rows: int):
+    parquet_file = ParquetRecordSource._parquet_module().ParquetFile(file_path)
+    try:
+        columns = _unique_headers(parquet_file.schema_arrow.names)
+        sample = []
+        if sample_rows:
+            batch = next(parquet_file.iter_batches(batch_size=sample_rows), None)
+            if batch is not None:
+                values = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+                sample = [{name: normalize_value(value) for name, value in zip(columns, row)} for row in zip(*values)]
+        return columns, sample
+    finally:
+        parquet_file.close()
+
+
+def read_header(file_path: str, sample_rows: int = 0, sheet: Optional[str] = None) -> Tuple[List[str], List[Dict[str, str]]]:
+    """
+    Columnas de la lista y, si se piden, sus primeros sample_rows registros (para vistas
+    previas), sin leer el resto del archivo: tarda milisegundos aunque la lista sea enorme.
+    Los nombres de columna son los mismos que entrega get_excel_data.
+    """
+    cached = get_cached_data(file_path, sheet)
+    if cached is not None:
+        columns, table = cached
+        return columns, [table[i].to_dict() for i in range(min(sample_rows, len(table)))]
+
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext in STREAMING_EXTENSIONS:
+            try:
+                columns, sample, _ = _read_xlsx_head(file_path, sample_rows, sheet)
+                return columns, sample
+            except ValueError:
+                raise
+            except Exception as e:
+                # Libro con una estructura poco común: se lee con openpyxl
+                print(f"[data] Warning: lectura rápida de encabezados no disponible ({e}), se usa openpyxl")
+                source = ExcelRecordStream(file_path, sheet=sheet)
+                return source.columns, list(islice(source, sample_rows))
+        if ext in CSV_EXTENSIONS:
+            return _read_csv_head(file_path, sample_rows)
+        if ext in PARQUET_EXTENSIONS:
+            return _read_parquet_head(file_path, sample_rows)
+        # .xls: pandas lee el libro completo de todos modos, pero solo convierte las filas pedidas
+        df = pd.read_excel(file_path, sheet_name=sheet or 0, dtype=object, nrows=sample_rows)
+        table = RecordTable.from_dataframe(df)
+        return table.columns, [row.to_dict() for row in table]
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el archivo {_format_name(file_path)}: {e}")
+
+
+def count_records(file_path: str, sheet: Optional[str] = None) -> Optional[int]:
+    """
+    Número de filas de la lista sin leer los registros (como len() de una RecordSource,
+    puede incluir filas vacías). None si no se puede saber sin leer el archivo completo:
+    .xls o un .xlsx que no guarda su dimensión.
+    """
+    cached = get_cached_data(file_path, sheet)
+    if cached is not None:
+        return len(cached[1])
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext in STREAMING_EXTENSIONS:
+            return _read_xlsx_head(file_path, 0, sheet)[2]
+        if ext in CSV_EXTENSIONS:
+            return max(0, _count_lines(file_path) - 1)
+        if ext in PARQUET_EXTENSIONS:
+            return ParquetRecordSource(file_path).total_rows
     except Exception as e:
-        raise ValueError(f"No se pudo leer el archivo Excel: {e}")
\ No newline at end of file
+        print(f"[data] Warning: no se pudo contar las filas de la lista: {e}")
+    return None
+
+
+def load_in_background(file_path: str, sheet: Optional[str] = None) -> Future:
+    """
+    Empieza a leer la lista completa (get_excel_data) en un hilo aparte y devuelve un
+    Future con (columnas, RecordTable). Si ya se está leyendo el mismo archivo, se
+    devuelve esa misma lectura.
+    """
+    global _loader
+    key = _cache_key(file_path, sheet)
+    with _cache_lock:
+        future = _pending_loads.get(key)
+        if future is not None:
+            return future
+        if _loader is None:
+            _loader = ThreadPoolExecutor(max_workers=BACKGROUND_LOADERS, thread_name_prefix="lista")
+        future = _loader.submit(get_excel_data, file_path, sheet)
+        _pending_loads[key] = future
+
+    def forget(_):
+        with _cache_lock:
+            if _pending_loads.get(key) is future:
+                del _pending_loads[key]
+    future.add_done_callback(forget)
+    return future
+
+
+class DeferredRecords(RecordSource):
+    """
+    Lista que se lee completa en segundo plano (load_in_background, para la caché) a
+    partir de las columnas de read_header. Se pasa al Worker o al EmailSender como
+    cualquier RecordSource: si la lectura completa ya terminó se recorre esa tabla; si
+    no, iter() lee los registros del archivo a medida que se piden (open_record_source)
+    en lugar de esperarla, y len() es el número de filas de la hoja (count_records).
+    Un .xls no se puede leer por partes: ahí se espera la lectura completa.
+    Solo se usa desde el hilo de trabajo, nunca desde la interfaz.
+    """
+    def __init__(self, file_path: str, columns: List[str], sheet: Optional[str] = None):
+        super().__init__(file_path)
+        self.format_name = _format_name(file_path)
+        self.sheet = sheet
+        self.columns = list(columns)
+        self._select(self.columns)
+        self._future = load_in_background(file_path, sheet)
+
+    def _loaded(self) -> bool:
+        return self._future.done() and not self._future.cancelled() and self._future.exception() is None
+
+    def table(self) -> RecordTable:
+        """Espera la lectura y devuelve el RecordTable con las columnas seleccionadas"""
+        _, table = self._future.result()
+        return table.select(self.selected_columns)
+
+    def __len__(self) -> int:
+        if not self._loaded():
+            count = count_records(self.file_path, self.sheet)
+            if count is not None:
+                return count
+        return len(self.table())
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        if self._loaded() or _source_class(self.file_path) is None:
+            return iter(self.table())
+        return iter(open_record_source(self.file_path, self.selected_columns, self.sheet))
+
+    def __getitem__(self, index: int) -> RecordView:
+        return self.table()[index]
@@ -6,12 +6,139 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from pptx import Presentation
 from pptx.util import Pt as PptxPt
 from pptx.dml.color import RGBColor as PptxRGBColor
-import comtypes.client
 import os
 import tempfile
+import threading
 import time
 from abc import ABC, abstractmethod
 
+# Cache de plantillas PDF: ruta absoluta -> ((mtime, tamaño), bytes)
+_template_cache = {}
+# Índices de placeholders: ruta absoluta -> PlaceholderIndex
+_index_cache = {}
+
+def load_template_bytes(template_path: str) -> bytes:
+    """
+    Lee los bytes de una plantilla PDF una sola vez.
+    Solo se vuelve a leer del disco si el archivo cambió (mtime o tamaño).
+    """
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _template_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    _template_cache[path] = (key, data)
+    return data
+
+def clear_template_cache():
+    """Libera las plantillas guardadas en memoria"""
+    _template_cache.clear()
+    _index_cache.clear()
+
+class PlaceholderIndex:
+    """
+    Ubicaciones de los placeholders de una plantilla PDF.
+    Las posiciones no cambian entre registros, así que cada placeholder se busca
+    una sola vez por plantilla y después solo se consulta el diccionario.
+    """
+    def __init__(self, template_bytes: bytes):
+        self.template_bytes = template_bytes
+        self._locations = {}  # placeholder -> [(page_num, rect, is_widget)]
+        self._prepared = {}   # frozenset(placeholders) -> bytes de la plantilla ya redactada
+        self._lock = threading.Lock()
+
+    def analyze(self, placeholders):
+        """Busca de una vez todos los placeholders indicados que aún no estén indexados"""
+        with self._lock:
+            missing = [p for p in placeholders if p not in self._locations]
+            if not missing:
+                return
+            doc = fitz.open(stream=self.template_bytes, filetype="pdf")
+            try:
+                for placeholder in missing:
+                    self._locations[placeholder] = self._search(doc, placeholder)
+            finally:
+                doc.close()
+
+    def _search(self, doc, placeholder):
+        locations = []
+        for page in doc:
+            # Buscar en texto normal
+            for rect in page.search_for(placeholder):
+                locations.append((page.number, rect, False))
+
+            # Buscar en cuadros de texto (widget annotations)
+            try:
+                for widget in page.widgets():
+                    if widget.field_type == fitz.PDF_WIDGET_TYPE_TEXT:
+                        if placeholder in widget.field_value or placeholder in widget.field_name:
+                            locations.append((page.number, fitz.Rect(widget.rect), True))
+            except Exception:
+                pass
+        return locations
+
+    def locate(self, placeholder: str):
+        """Devuelve [(page_num, rect, is_widget)] para el placeholder"""
+        if placeholder not in self._locations:
+            self.analyze([placeholder])
+        return [(page_num, fitz.Rect(rect), is_widget) for page_num, rect, is_widget in self._locations[placeholder]]
+
+    def by_page(self, placeholders):
+        """Agrupa las ubicaciones por página: {page_num: {placeholder: [rect, ...]}}"""
+        self.analyze(placeholders)
+        pages = {}
+        for placeholder in placeholders:
+            for page_num, rect, _ in self.locate(placeholder):
+                pages.setdefault(page_num, {}).setdefault(placeholder, []).append(rect)
+        return pages
+
+    def prepared_template(self, placeholders) -> bytes:
+        """
+        Plantilla con los placeholders indicados ya borrados.
+        La redacción es idéntica para todos los registros, así que se aplica una sola vez
+        por juego de placeholders; cada constancia solo inserta sus textos. Además, la
+        redacción de imágenes de PyMuPDF retiene memoria en cada llamada, y así no crece
+        con el número de constancias.
+        """
+        key = frozenset(placeholders)
+        prepared = self._prepared.get(key)
+        if prepared is not None:
+            return prepared
+
+        placeholders_by_page = self.by_page(list(placeholders))
+        doc = fitz.open(stream=self.template_bytes, filetype="pdf")
+        try:
+            for page_num, all_text_instances in sorted(placeholders_by_page.items()):
+                page = doc[page_num]
+
+                # 1. Marcar todas las áreas de los placeholders de la página
+                for instances in all_text_instances.values():
+                    for inst in instances:
+                        page.add_redact_annot(inst)
+
+                # 2. Aplicar todas las redacciones en una sola pasada (el contenido se reescribe una vez)
+                page.apply_redactions()
+            prepared = doc.tobytes(garbage=3, deflate=True)
+        finally:
+            doc.close()
+
+        with self._lock:
+            self._prepared[key] = prepared
+        return prepared
+
+def get_placeholder_index(template_path: str, template_bytes: bytes) -> PlaceholderIndex:
+    """Obtiene el índice de placeholders de la plantilla (uno por versión del archivo)"""
+    path = os.path.abspath(template_path)
+    index = _index_cache.get(path)
+    if index is None or (index.template_bytes is not template_bytes and index.template_bytes != template_bytes):
+        index = PlaceholderIndex(template_bytes)
+        _index_cache[path] = index
+    return index
+
 class BaseProcessor(ABC):
     def __init__(self, template_path):
         self.template_path = template_path
@@ -40,9 +167,15 @@ class BaseProcessor(ABC):
         self.temp_files = []
 
 class PdfProcessor(BaseProcessor):
-    def __init__(self, template_path):
+    def __init__(self, template_path, template_bytes=None):
         super().__init__(template_path)
-        self.doc = fitz.open(template_path)
+        # Bytes compartidos de la plantilla; cada registro abre su propia copia en memoria
+        self.template_bytes = template_bytes if template_bytes is not None else load_template_bytes(template_path)
+        self.placeholder_index = get_placeholder_index(template_path, self.template_bytes)
+
+    def _open_template(self):
+        """Abre una copia en memoria de la plantilla (sin acceso a disco)"""
+        return fitz.open(stream=self.template_bytes, filetype="pdf")
 
     def _get_text_fit_info(self, rect, text, font_info, align_center=True):
         """
@@ -78,29 +211,15 @@ class PdfProcessor(BaseProcessor):
         return x_insert, y_insert, final_font_size, font_name
 
     def process(self, data_map: dict, font_map: dict):
-        self.doc = fitz.open(self.template_path)
-        for page in self.doc:
-            # Buscar TODOS los placeholders, incluyendo en cuadros de texto
-            all_text_instances = {}
-            
-            for placeholder in data_map.keys():
-                # Buscar en texto normal
-                text_instances = page.search_for(placeholder)
-                if text_instances:
-                    all_text_instances[placeholder] = text_instances
-                
-                # Buscar en cuadros de texto (widget annotations)
-                try:
-                    for widget in page.widgets():
-                        if widget.field_type == fitz.PDF_WIDGET_TYPE_TEXT:
-                            if placeholder in widget.field_value or placeholder in widget.field_name:
-                                # Crear un rectángulo aproximado para el cuadro de texto
-                                rect = widget.rect
-                                all_text_instances.setdefault(placeholder, []).append(rect)
-                except Exception:
-                    pass
-            
-            # Procesar cada placeholder encontrado
+        # Las posiciones de los placeholders vienen del índice precalculado de la plantilla,
+        # y la copia que se abre ya tiene los placeholders borrados (ver prepared_template)
+        placeholders = list(data_map.keys())
+        self.doc = fitz.open(stream=self.placeholder_index.prepared_template(placeholders), filetype="pdf")
+        placeholders_by_page = self.placeholder_index.by_page(placeholders)
+        for page_num, all_text_instances in sorted(placeholders_by_page.items()):
+            page = self.doc[page_num]
+
+            # Insertar los textos de reemplazo
             for placeholder, instances in all_text_instances.items():
                 value = data_map[placeholder]
                 font_info = font_map.get(placeholder, {'family': 'Arial', 'size': 12, 'bold': False, 'color': (0, 0, 0)})
@@ -111,9 +230,6 @@ class PdfProcessor(BaseProcessor):
                 
                 for inst in instances:
                     try:
-                        page.add_redact_annot(inst)
-                        page.apply_redactions()
-                        
                         x_insert, y_insert, final_size, font_name = self._get_text_fit_info(
                             inst, value, font_info, align_center=align_center
                         )
@@ -156,22 +272,41 @@ class PdfProcessor(BaseProcessor):
         try:
             self.doc.save(output_path, garbage=4, deflate=True, clean=True)
         finally:
+            self.close()
+
+    def to_bytes(self) -> bytes:
+        """Serializa la constancia en memoria (para enviarla de un proceso a otro sin tocar el disco)"""
+        try:
+            return self.doc.tobytes(garbage=4, deflate=True, clean=True)
+        finally:
+            self.close()
+
+    def close(self):
+        """Cierra el documento generado sin guardarlo"""
+        if self.doc is not None and not self.doc.is_closed:
             self.doc.close()
-            # Limpiar archivos temporales (aunque PDF no crea muchos)
-            self._cleanup_temp_files()
+        # Limpiar archivos temporales (aunque PDF no crea muchos)
+        self._cleanup_temp_files()
 
     def get_preview_pixmap(self, data_map: dict, font_map: dict):
-        temp_doc = fitz.open(self.template_path)
+        temp_doc = self._open_template()
         try:
             page = temp_doc.load_page(0)
             
-            # Buscar todos los placeholders para la previsualización
+            # Placeholders de texto de la primera página (desde el índice de la plantilla)
             all_instances = {}
             for placeholder in data_map.keys():
-                instances = page.search_for(placeholder)
+                instances = [rect for page_num, rect, is_widget in self.placeholder_index.locate(placeholder)
+                             if page_num == 0 and not is_widget]
                 if instances:
                     all_instances[placeholder] = instances
             
+            # Redactar todos los placeholders en una sola pasada
+            for instances in all_instances.values():
+                page.add_redact_annot(instances[0])
+            if all_instances:
+                page.apply_redactions()
+            
             for placeholder, instances in all_instances.items():
                 value = data_map[placeholder]
                 font_info = font_map.get(placeholder, {'family': 'Arial', 'size': 12, 'bold': False, 'color': (0, 0, 0)})
@@ -180,18 +315,14 @@ class PdfProcessor(BaseProcessor):
                 is_folio = placeholder == "{{FOLIO}}"
                 align_center = not is_folio
                 
-                if instances:
-                    inst = instances[0]
-                    page.add_redact_annot(inst)
-                    page.apply_redactions()
-                    
-                    x_insert, y_insert, final_size, font_name = self._get_text_fit_info(
-                        inst, value, font_info, align_center=align_center
-                    )
-                    
-                    color = self._parse_color(font_info.get('color', (0, 0, 0)))
-                    
-                    page.insert_text((x_insert, y_insert), value, fontsize=final_size, fontname=font_name, color=color)
+                inst = instances[0]
+                x_insert, y_insert, final_size, font_name = self._get_text_fit_info(
+                    inst, value, font_info, align_center=align_center
+                )
+                
+                color = self._parse_color(font_info.get('color', (0, 0, 0)))
+                
+                page.insert_text((x_insert, y_insert), value, fontsize=final_size, fontname=font_name, color=color)
 
             pix = page.get_pixmap()
             return pix
@@ -201,12 +332,12 @@ class PdfProcessor(BaseProcessor):
     def _get_pdf_font(self, family, bold):
         family_lower = family.lower()
         if "arial" in family_lower or "helvetica" in family_lower: 
-            return "helv-bold" if bold else "helv"
+            return "hebo" if bold else "helv"
         if "times" in family_lower: 
             return "tibo" if bold else "timo"
         if "courier" in family_lower: 
             return "cobo" if bold else "cour"
-        return "helv-bold" if bold else "helv"
+        return "hebo" if bold else "helv"
 
 class OfficeProcessor(BaseProcessor):
     def _convert_to_pdf_with_com(self, input_path: str, output_path: str, app_name: str, format_type: int):
@@ -215,6 +346,10 @@ class OfficeProcessor(BaseProcessor):
         max_retries = 3
         retry_delay = 2
         
+        # comtypes solo existe en Windows; se importa aquí para que el resto del módulo
+        # (plantillas PDF) funcione también en Linux, p. ej. desde cli.py
+        import comtypes.client
+
         for attempt in range(max_retries):
             try:
                 app = comtypes.client.CreateObject(app_name)
@@ -414,10 +549,10 @@ class PptxProcessor(OfficeProcessor):
                 else:
                     print(f"❌ No se pudieron eliminar algunos archivos temporales: {e}")
 
-def get_processor(template_path: str):
+def get_processor(template_path: str, template_bytes: bytes = None):
     ext = os.path.splitext(template_path)[1].lower()
     if ext == '.pdf':
-        return PdfProcessor(template_path)
+        return PdfProcessor(template_path, template_bytes)
     elif ext == '.docx':
         return DocxProcessor(template_path)
     elif ext == '.pptx':
@@ -0,0 +1,359 @@
+# email_async.py
+"""
+Motor de envío de correos con asyncio (EmailSender con config['engine'] = ENGINE_ASYNCIO).
+Un solo hilo atiende todas las conexiones SMTP: mientras una espera la respuesta del
+servidor o el saludo TLS, las demás siguen enviando; buscar y leer los adjuntos se hace
+en hilos auxiliares. El cliente SMTP usa solo la biblioteca estándar (STARTTLS,
+AUTH PLAIN/LOGIN) y falla con las mismas excepciones de smtplib que el motor con hilos.
+"""
+
+import io
+import re
+import ssl
+import base64
+import socket
+import asyncio
+import smtplib
+import itertools
+from email.generator import BytesGenerator
+from email.utils import getaddresses
+
+from email_sender import SMTP_TIMEOUT
+
+# Correos preparados (adjuntos ya leídos) por conexión, esperando su turno
+MESSAGES_PER_CONNECTION = 4
+_LEADING_DOT = re.compile(rb"(?m)^\.")
+_local_hostname = None
+
+
+def _hostname() -> bytes:
+    """Nombre con el que el cliente se presenta en EHLO (el mismo que usa smtplib)"""
+    global _local_hostname
+    if _local_hostname is None:
+        _local_hostname = socket.getfqdn().encode("ascii", "replace")
+    return _local_hostname
+
+
+class AsyncSmtpConnection:
+    """Conexión SMTP autenticada sobre asyncio; STARTTLS y login una sola vez al abrirla"""
+
+    def __init__(self, host, port, tls_context=None):
+        self.host = host
+        self.port = port
+        self.tls_context = tls_context or ssl.create_default_context()
+        self.reader = None
+        self.writer = None
+        self._plain_writer = None  # Conexión sin TLS, solo antes de Python 3.11
+        self.features = {}
+
+    async def connect(self, user, password):
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), SMTP_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise smtplib.SMTPConnectError(-1, str(e))
+        try:
+            code, text = await self._reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, text)
+            await self._ehlo()
+            if "starttls" not in self.features:
+                raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+            await self._expect(b"STARTTLS", 220)
+            await self._start_tls()
+            await self._ehlo()  # Tras STARTTLS el cliente se vuelve a presentar (RFC 3207)
+            await self._login(user, password)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _start_tls(self):
+        if hasattr(self.writer, "start_tls"):  # Python 3.11+
+            await self.writer.start_tls(self.tls_context, server_hostname=self.host)
+            return
+        loop = asyncio.get_running_loop()
+        transport = await loop.start_tls(self.writer.transport, self.writer.transport.get_protocol(),
+                                         self.tls_context, server_hostname=self.host)
+        # Antes de 3.11 StreamWriter no cambia de transporte: flujos nuevos sobre la conexión TLS.
+        # El writer original se conserva: al liberarse cerraría el socket que ahora usa TLS
+        self._plain_writer = self.writer
+        self.reader = asyncio.StreamReader(loop=loop)
+        protocol = asyncio.StreamReaderProtocol(self.reader, loop=loop)
+        transport.set_protocol(protocol)
+        protocol.connection_made(transport)
+        self.writer = asyncio.StreamWriter(transport, protocol, self.reader, loop)
+
+    async def _reply(self):
+        """Respuesta del servidor (código, texto); las de varias líneas se juntan como en smtplib"""
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), SMTP_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.close()
+                raise smtplib.SMTPServerDisconnected(f"Sin respuesta del servidor: {e}")
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b"-":
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            code = -1
+        return code, b"\n".join(lines)
+
+    async def _write(self, data: bytes):
+        if self.writer is None:
+            raise smtplib.SMTPServerDisconnected("please run connect() first")
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except OSError as e:
+            self.close()
+            raise smtplib.SMTPServerDisconnected(f"Server not connected: {e}")
+
+    async def _command(self, line: bytes):
+        await self._write(line + b"\r\n")
+        return await self._reply()
+
+    async def _expect(self, line: bytes, *codes, error=smtplib.SMTPResponseException):
+        code, text = await self._command(line)
+        if code not in codes:
+            raise error(code, text)
+        return text
+
+    async def _ehlo(self):
+        code, text = await self._command(b"EHLO " + _hostname())
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, text)
+        self.features = {}
+        for line in text.decode("latin-1").split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.features[keyword.lower()] = params
+
+    async def _login(self, user, password):
+        mechanisms = self.features.get("auth", "").upper().split()
+        error = smtplib.SMTPAuthenticationError
+        if "PLAIN" in mechanisms:
+            token = base64.b64encode(f"\0{user}\0{password}".encode("utf-8"))
+            await self._expect(b"AUTH PLAIN " + token, 235, error=error)
+        elif "LOGIN" in mechanisms:
+            await self._expect(b"AUTH LOGIN", 334, error=error)
+            await self._expect(base64.b64encode(user.encode("utf-8")), 334, error=error)
+            await self._expect(base64.b64encode(password.encode("utf-8")), 235, error=error)
+        else:
+            raise smtplib.SMTPException("No suitable authentication method found.")
+
+    async def _rset(self):
+        try:
+            await self._command(b"RSET")
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def send_message(self, msg):
+        """Envía un mensaje de email.message como smtplib.SMTP.send_message"""
+        sender = getaddresses([msg["From"]])[0][1]
+        recipients = [address for _, address in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []))]
+        # Direcciones con acentos: solo si el servidor anuncia SMTPUTF8, con el mismo error que smtplib
+        international = not "".join([sender, *recipients]).isascii()
+        options = b""
+        policy = msg.policy
+        if international:
+            if "smtputf8" not in self.features:
+                raise smtplib.SMTPNotSupportedError(
+                    "One or more source or delivery addresses require"
+                    " internationalized email support, but the server"
+                    " does not advertise the required SMTPUTF8 capability")
+            options = b" SMTPUTF8 BODY=8BITMIME"
+            policy = policy.clone(utf8=True)
+        buffer = io.BytesIO()
+        BytesGenerator(buffer, policy=policy.clone(linesep="\r\n")).flatten(msg, linesep="\r\n")
+        data = _LEADING_DOT.sub(b"..", buffer.getvalue())
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+
+        code, text = await self._command(b"MAIL FROM:<" + sender.encode("utf-8") + b">" + options)
+        if code != 250:
+            await self._rset()
+            raise smtplib.SMTPSenderRefused(code, text, sender)
+        refused = {}
+        for recipient in recipients:
+            code, text = await self._command(b"RCPT TO:<" + recipient.encode("utf-8") + b">")
+            if code not in (250, 251):
+                refused[recipient] = (code, text)
+        if len(refused) == len(recipients):
+            await self._rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, text = await self._command(b"DATA")
+        if code != 354:
+            await self._rset()
+            raise smtplib.SMTPDataError(code, text)
+        await self._write(data + b".\r\n")
+        code, text = await self._reply()
+        if code != 250:
+            await self._rset()
+            raise smtplib.SMTPDataError(code, text)
+
+    async def quit(self):
+        try:
+            await self._command(b"QUIT")
+        except (smtplib.SMTPException, OSError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class _ConnectionPool:
+    """Conexiones abiertas hacia el servidor, hasta limit a la vez; se reutilizan entre correos"""
+
+    def __init__(self, engine, limit):
+        self.engine = engine
+        self.limit = limit
+        self.opened = 0
+        self._idle = []
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> AsyncSmtpConnection:
+        async with self._changed:
+            while not self._idle and self.opened >= self.limit:
+                await self._changed.wait()
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        try:
+            return await self.engine._open_connection()
+        except Exception as e:
+            async with self._changed:
+                self.opened -= 1
+                self._changed.notify()
+                if self.opened == 0:
+                    raise
+                # El servidor no admite más conexiones simultáneas: se sigue con las que hay
+                self.limit = self.opened
+            self.engine.sender.log.emit(f"⚠️ No se pudo abrir otra conexión ({e}); se continúa con {self.limit}")
+            return await self.acquire()
+
+    async def release(self, connection: AsyncSmtpConnection):
+        async with self._changed:
+            self._idle.append(connection)
+            self._changed.notify()
+
+    async def discard(self, connection: AsyncSmtpConnection):
+        """Cierra una conexión que ya no sirve; el siguiente correo puede abrir otra"""
+        connection.close()
+        async with self._changed:
+            self.opened -= 1
+            self._changed.notify()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(connection.quit() for connection in idle))
+
+
+class AsyncDeliveryEngine:
+    """
+    Envía los correos de un EmailSender con asyncio, desde el hilo del propio EmailSender.
+
+    - connections: conexiones simultáneas, ya limitadas por el servidor (get_smtp_config)
+    - A lo más connections * MESSAGES_PER_CONNECTION correos en curso a la vez, para no
+      leer los adjuntos de toda la lista por adelantado
+    - Resultados, progreso y cancelación pasan por el EmailSender, igual que con hilos
+    """
+
+    def __init__(self, sender, smtp_config, connections, tls_context=None):
+        self.sender = sender
+        self.smtp_config = smtp_config
+        self.connections = connections
+        self.tls_context = tls_context
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _open_connection(self) -> AsyncSmtpConnection:
+        connection = AsyncSmtpConnection(self.smtp_config['server'], self.smtp_config['port'], self.tls_context)
+        await connection.connect(self.sender.config['email'], self.sender.config['password'])
+        return connection
+
+    async def _run(self):
+        pool = _ConnectionPool(self, self.connections)
+        try:
+            # La primera conexión se abre antes de empezar: un error de credenciales detiene el envío
+            await pool.release(await pool.acquire())
+            self.sender._log_connected()
+
+            slots = asyncio.Semaphore(self.connections * MESSAGES_PER_CONNECTION)
+            pending = set()
+
+            def done(task):
+                pending.discard(task)
+                slots.release()
+
+            async for row in self._rows():
+                await slots.acquire()
+                if not self.sender.is_running:
+                    slots.release()
+                    break
+                task = asyncio.ensure_future(self._deliver(pool, row))
+                pending.add(task)
+                task.add_done_callback(done)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            await pool.close()
+
+    async def _rows(self):
+        """
+        Registros de la lista leídos en un hilo auxiliar, por bloques: una lista diferida
+        (DeferredRecords) se lee del archivo mientras se itera y no debe detener las conexiones.
+        """
+        loop = asyncio.get_running_loop()
+        chunk = self.connections * MESSAGES_PER_CONNECTION
+        rows = await loop.run_in_executor(None, iter, self.sender.excel_data)
+        while True:
+            block = await loop.run_in_executor(None, list, itertools.islice(rows, chunk))
+            if not block:
+                return
+            for row in block:
+                yield row
+
+    async def _deliver(self, pool, row):
+        loop = asyncio.get_running_loop()
+        try:
+            # Buscar los PDFs y armar el mensaje lee archivos: se hace en un hilo auxiliar
+            participant_name, msg = await loop.run_in_executor(None, self.sender._prepare_message, row)
+            if msg is None or not self.sender.is_running:
+                return
+            await self._send(pool, msg)
+            self.sender.log.emit(f"✅ Enviado a: {participant_name}")
+            self.sender._record_result(row)
+        except Exception as e:
+            self.sender._record_result(row, str(e))
+
+    async def _send(self, pool, msg):
+        """Envía por una conexión del grupo; si el servidor la había cerrado, se reintenta una vez"""
+        for attempt in (1, 2):
+            connection = await pool.acquire()
+            try:
+                await connection.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                await pool.discard(connection)
+                if attempt == 2:
+                    raise
+                self.sender.log.emit("🔄 Conexión cerrada por el servidor, reconectando...")
+            except OSError:
+                await pool.discard(connection)
+                raise
+            except Exception:
+                # Rechazos del servidor (destinatario, tamaño...): la conexión sigue sirviendo
+                await pool.release(connection)
+                raise
+            else:
+                await pool.release(connection)
+                return
@@ -1,6 +1,10 @@
 # email_sender.py
 import smtplib
+import ssl
 import os
+import queue
+import threading
+from collections import deque
 import pandas as pd
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -10,6 +14,27 @@ import glob
 from datetime import datetime
 from PyQt6.QtCore import QThread, pyqtSignal
 import re
+from data_handler import RecordTable, RecordSource
+
+# Conexiones SMTP simultáneas (Office 365 admite 3 por buzón; Gmail algunas más)
+DEFAULT_CONNECTIONS = 3
+MAX_CONNECTIONS = 10
+# Límite de conexiones simultáneas de cada servidor (ver get_smtp_config)
+PROVIDER_CONNECTION_LIMITS = {
+    'smtp.office365.com': 3,
+    'smtp.gmail.com': 10,
+    'smtp.mail.yahoo.com': 5
+}
+# Motores de envío: un hilo por conexión (smtplib) o un solo hilo con asyncio (email_async)
+ENGINE_THREADS = "threads"
+ENGINE_ASYNCIO = "asyncio"
+SMTP_TIMEOUT = 60  # Segundos sin respuesta del servidor antes de dar la conexión por perdida
+
+
+def tls_context() -> ssl.SSLContext:
+    """Política TLS de ambos motores: STARTTLS verificando el certificado y el nombre del servidor"""
+    return ssl.create_default_context()
+
 
 class EmailSender(QThread):
     progress = pyqtSignal(int)
@@ -22,9 +47,11 @@ class EmailSender(QThread):
         self.excel_data = excel_data
         self.pdf_folder = pdf_folder
         self.is_running = True
+        # Mismo contexto TLS para el motor con hilos, el de asyncio y la prueba de conexión
+        self.tls_context = tls_context()
         
-        # CONVERSIÓN SEGURA A DATAFRAME - CORRECCIÓN DEL ERROR
-        self._convert_to_dataframe()
+        # Registros como RecordTable/RecordSource (sin pasar por un DataFrame)
+        self._convert_to_records()
         
         # Configuración SMTP para diferentes proveedores
         self.smtp_config = {
@@ -50,24 +77,27 @@ class EmailSender(QThread):
             }
         }
 
-    def _convert_to_dataframe(self):
-        """Convierte los datos de Excel a DataFrame si es necesario"""
+    def _convert_to_records(self):
+        """
+        Deja los datos como RecordTable (o RecordSource, que se lee al enviar).
+        get_excel_data ya entrega un RecordTable; listas de dicts y DataFrames se convierten una vez.
+        """
         try:
-            if isinstance(self.excel_data, list):
-                # Si es una lista, convertir a DataFrame
-                self.excel_data = pd.DataFrame(self.excel_data)
-                self.log.emit("📊 Datos convertidos de lista a DataFrame")
-            elif isinstance(self.excel_data, pd.DataFrame):
-                # Ya es DataFrame, no hacer nada
-                pass
+            if isinstance(self.excel_data, RecordTable):
+                self.columns = self.excel_data.columns
+            elif isinstance(self.excel_data, RecordSource):
+                self.columns = self.excel_data.selected_columns
             else:
-                # Tipo desconocido, intentar conversión
-                self.excel_data = pd.DataFrame(self.excel_data)
-                self.log.emit("📊 Datos convertidos a DataFrame")
+                if isinstance(self.excel_data, pd.DataFrame):
+                    self.excel_data = RecordTable.from_dataframe(self.excel_data)
+                else:
+                    self.excel_data = RecordTable.from_records(self.excel_data)
+                self.columns = self.excel_data.columns
         except Exception as e:
             self.log.emit(f"⚠️ Error en conversión: {str(e)}")
-            # Crear DataFrame vacío para evitar errores
-            self.excel_data = pd.DataFrame()
+            # Tabla vacía para evitar errores
+            self.excel_data = RecordTable([])
+            self.columns = []
 
     def get_smtp_config(self, email):
         """Obtiene configuración SMTP basada en el dominio del email"""
@@ -83,17 +113,21 @@ class EmailSender(QThread):
             
             # Si es dominio de Outlook o personalizado que usa Outlook
             if any(domain.endswith(outlook_domain) for outlook_domain in outlook_domains):
-                return {
+                config = {
                     'server': 'smtp.office365.com',
                     'port': 587
                 }
-            
-            return self.smtp_config.get(domain, {
-                'server': 'smtp.gmail.com',
-                'port': 587
-            })
+            else:
+                config = dict(self.smtp_config.get(domain, {
+                    'server': 'smtp.gmail.com',
+                    'port': 587
+                }))
         except:
-            return {'server': 'smtp.gmail.com', 'port': 587}
+            config = {'server': 'smtp.gmail.com', 'port': 587}
+        
+        # Conexiones simultáneas que admite el servidor
+        config['max_connections'] = PROVIDER_CONNECTION_LIMITS.get(config['server'], DEFAULT_CONNECTIONS)
+        return config
 
     def run(self):
         """Ejecuta el envío de correos en un hilo separado"""
@@ -109,106 +143,53 @@ class EmailSender(QThread):
         self.log.emit("⏹️ Cancelando envío...")
 
     def send_emails(self):
-        """Envía correos electrónicos con constancias adjuntas"""
-        # VERIFICAR QUE SEA DATAFRAME - CORRECCIÓN CLAVE
-        if not isinstance(self.excel_data, pd.DataFrame):
-            self.excel_data = pd.DataFrame(self.excel_data)
-            
+        """
+        Envía correos electrónicos con constancias adjuntas. Los participantes se reparten
+        entre varias conexiones SMTP autenticadas (config['connections'], por defecto
+        DEFAULT_CONNECTIONS, sin pasar del límite del servidor). Con config['engine'] =
+        ENGINE_THREADS cada conexión tiene su hilo; con ENGINE_ASYNCIO todas se atienden
+        desde un solo hilo con asyncio (email_async).
+        """
         total_emails = len(self.excel_data)
         if total_emails == 0:
             return "error: No hay datos para enviar"
 
-        success_count = 0
-        failed_count = 0
-        errors = []
+        # VERIFICAR COLUMNAS EXISTENTES (una sola vez: todas las filas tienen las mismas)
+        required = [self.config['name_column'], self.config['email_column'], self.config['filename_column']]
+        missing = [column for column in required if column not in self.columns]
+        if missing:
+            return f"error: Columnas no encontradas en la lista: {', '.join(missing)}"
+
+        self._lock = threading.Lock()
+        self._total_emails = total_emails
+        self._done_count = 0
+        self._success_count = 0
+        self._failed_count = 0
+        self._errors = []
 
         try:
             # Obtener configuración SMTP
             smtp_config = self.get_smtp_config(self.config['email'])
+            connections = int(self.config.get('connections', DEFAULT_CONNECTIONS))
+            connections = max(1, min(connections, MAX_CONNECTIONS, smtp_config['max_connections'], total_emails))
             
-            self.log.emit(f"🔗 Conectando a {smtp_config['server']}:{smtp_config['port']}")
-            
-            # Configurar servidor SMTP
-            server = smtplib.SMTP(smtp_config['server'], smtp_config['port'])
-            server.starttls()  # Usar TLS para seguridad
-            server.login(self.config['email'], self.config['password'])
-            
-            self.log.emit(f"✅ Conexión exitosa. Enviando desde: {self.config['email']}")
-            self.log.emit(f"📊 Total de correos a enviar: {total_emails}")
-            
-            # CORRECCIÓN: Verificar que podemos usar iterrows()
-            if not hasattr(self.excel_data, 'iterrows'):
-                return "error: Los datos no son un DataFrame válido de Pandas"
-            
-            # Enviar correos a cada participante
-            for index, row in self.excel_data.iterrows():
-                if not self.is_running:
-                    break
-                    
-                try:
-                    # VERIFICAR COLUMNAS EXISTENTES
-                    if (self.config['name_column'] not in row.index or 
-                        self.config['email_column'] not in row.index or 
-                        self.config['filename_column'] not in row.index):
-                        error_msg = f"❌ Columnas no encontradas en fila {index}"
-                        self.log.emit(error_msg)
-                        errors.append(error_msg)
-                        failed_count += 1
-                        continue
-                        
-                    participant_name = str(row[self.config['name_column']])
-                    participant_email = str(row[self.config['email_column']])
-                    pdf_filenames = str(row[self.config['filename_column']])
-                    
-                    # Calcular progreso
-                    progress = int((index + 1) / total_emails * 100)
-                    self.progress.emit(progress)
-                    
-                    self.log.emit(f"📧 Procesando: {participant_name} -> {participant_email}")
-                    
-                    # Buscar archivos PDF
-                    pdf_paths = self._find_pdf_files(self.pdf_folder, pdf_filenames)
-                    
-                    if not pdf_paths:
-                        error_msg = f"❌ PDFs no encontrados: {pdf_filenames}"
-                        self.log.emit(error_msg)
-                        errors.append(error_msg)
-                        failed_count += 1
-                        continue
-                    
-                    # Crear y enviar mensaje
-                    msg = self._create_email_message(
-                        self.config['email'],
-                        self.config['sender_name'],
-                        participant_email,
-                        participant_name,
-                        self.config['subject'],
-                        self.config['body'],
-                        pdf_paths
-                    )
-                    
-                    server.send_message(msg)
-                    self.log.emit(f"✅ Enviado a: {participant_name}")
-                    success_count += 1
-                    
-                except Exception as e:
-                    participant_name = row.get(self.config['name_column'], 'Desconocido') if hasattr(row, 'get') else 'Desconocido'
-                    error_msg = f"❌ Error con {participant_name}: {str(e)}"
-                    self.log.emit(error_msg)
-                    errors.append(error_msg)
-                    failed_count += 1
+            self.log.emit(f"🔗 Conectando a {smtp_config['server']}:{smtp_config['port']} ({connections} conexiones)")
             
-            server.quit()
+            if self.config.get('engine', ENGINE_THREADS) == ENGINE_ASYNCIO:
+                from email_async import AsyncDeliveryEngine
+                AsyncDeliveryEngine(self, smtp_config, connections, self.tls_context).run()
+            else:
+                self._send_with_threads(smtp_config, connections)
             
             # Resultado final
             if self.is_running:
-                message = f"🎉 Envío completado: {success_count} exitosos, {failed_count} fallidos"
-                if errors and failed_count > 0:
-                    message += f"\n\nErrores encontrados:\n" + "\n".join(errors[:3])
-                    if len(errors) > 3:
-                        message += f"\n... y {len(errors) - 3} errores más"
+                message = f"🎉 Envío completado: {self._success_count} exitosos, {self._failed_count} fallidos"
+                if self._errors and self._failed_count > 0:
+                    message += f"\n\nErrores encontrados:\n" + "\n".join(self._errors[:3])
+                    if len(self._errors) > 3:
+                        message += f"\n... y {len(self._errors) - 3} errores más"
             else:
-                message = f"⏹️ Envío cancelado: {success_count} enviados antes de cancelar"
+                message = f"⏹️ Envío cancelado: {self._success_count} enviados antes de cancelar"
                 
             return message
             
@@ -218,12 +199,178 @@ class EmailSender(QThread):
             return f"error: Error SMTP: {str(e)}"
         except Exception as e:
             return f"error: Error general: {str(e)}"
+
+    def _send_with_threads(self, smtp_config, connections):
+        """Un hilo de envío por conexión, alimentados desde una cola limitada"""
+        self._active_senders = connections
+        self._returned = deque()  # Participantes que devolvió un hilo al retirarse
+        
+        # La primera conexión se abre aquí: un error de credenciales detiene el envío de inmediato
+        server = self._connect(smtp_config)
+        self._log_connected()
+        
+        # Cola limitada: los registros se van leyendo a medida que se envían
+        tasks = queue.Queue(maxsize=connections * 4)
+        senders = [
+            threading.Thread(target=self._sender_loop, args=(server if i == 0 else None, smtp_config, tasks),
+                             name=f"smtp-{i + 1}", daemon=True)
+            for i in range(connections)
+        ]
+        for sender in senders:
+            sender.start()
+        try:
+            for row in self.excel_data:
+                if not self.is_running:
+                    break
+                tasks.put(row)
+        finally:
+            # Una marca de fin por hilo; cada uno cierra su conexión al recibirla
+            for _ in senders:
+                tasks.put(None)
+            for sender in senders:
+                sender.join()
+
+    def _log_connected(self):
+        self.log.emit(f"✅ Conexión exitosa. Enviando desde: {self.config['email']}")
+        self.log.emit(f"📊 Total de correos a enviar: {self._total_emails}")
+
+    def _connect(self, smtp_config):
+        """Abre una conexión SMTP autenticada (STARTTLS y login una sola vez por conexión)"""
+        server = smtplib.SMTP(smtp_config['server'], smtp_config['port'], timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls(context=self.tls_context)  # Usar TLS para seguridad
+            server.login(self.config['email'], self.config['password'])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _sender_loop(self, server, smtp_config, tasks):
+        """Hilo de envío: toma participantes de la cola y los envía por su propia conexión"""
+        finished = False
+        try:
+            while True:
+                # Primero los participantes devueltos: pueden haber quedado detrás de las
+                # marcas de fin de la cola. Al terminar, el hilo deja de contar como activo
+                # bajo el mismo candado, así nadie devuelve uno cuando ya no queda quien lo envíe
+                with self._lock:
+                    row = self._returned.popleft() if self._returned else None
+                    if row is None and finished:
+                        self._active_senders -= 1
+                        break
+                if row is None:
+                    row = tasks.get()
+                    if row is None:
+                        finished = True
+                        continue
+                if not self.is_running:
+                    continue  # Cancelado: se vacía la cola sin enviar
+
+                if server is None:
+                    try:
+                        server = self._connect(smtp_config)
+                    except Exception as e:
+                        with self._lock:
+                            # Si quedan otros hilos, este se retira (p. ej. el servidor limita
+                            # las conexiones simultáneas) y devuelve el participante a los demás
+                            leave = self._active_senders > 1
+                            if leave:
+                                self._active_senders -= 1
+                                self._returned.append(row)
+                        if leave:
+                            self.log.emit(f"⚠️ No se pudo abrir otra conexión ({e}); se continúa con menos conexiones")
+                            return
+                        self._record_result(row, f"no se pudo conectar: {e}")
+                        continue
+
+                server = self._send_to_participant(server, smtp_config, row)
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+
+    def _send_to_participant(self, server, smtp_config, row):
+        """Envía el correo de un participante; devuelve la conexión a usar para el siguiente"""
+        try:
+            participant_name, msg = self._prepare_message(row)
+            if msg is None:
+                return server
+            
+            try:
+                server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # El servidor cerró la conexión (inactividad, límite de mensajes): se reconecta una vez
+                self.log.emit("🔄 Conexión cerrada por el servidor, reconectando...")
+                server.close()
+                server = None
+                server = self._connect(smtp_config)
+                server.send_message(msg)
+            
+            self.log.emit(f"✅ Enviado a: {participant_name}")
+            self._record_result(row)
+            
+        except Exception as e:
+            self._record_result(row, str(e))
+            if server is not None and isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                # Conexión inutilizable: el siguiente envío abre una nueva
+                server.close()
+                server = None
+        return server
+
+    def _prepare_message(self, row):
+        """
+        Busca los PDFs del participante y arma su correo. Devuelve (nombre, mensaje);
+        el mensaje es None si no hay PDFs (ya se contó como fallido).
+        """
+        participant_name = str(row[self.config['name_column']])
+        participant_email = str(row[self.config['email_column']])
+        pdf_filenames = str(row[self.config['filename_column']])
+        
+        self.log.emit(f"📧 Procesando: {participant_name} -> {participant_email}")
+        
+        # Buscar archivos PDF
+        pdf_paths = self._find_pdf_files(self.pdf_folder, pdf_filenames)
+        
+        if not pdf_paths:
+            self._record_result(row, f"❌ PDFs no encontrados: {pdf_filenames}")
+            return participant_name, None
+        
+        # Crear mensaje
+        msg = self._create_email_message(
+            self.config['email'],
+            self.config['sender_name'],
+            participant_email,
+            participant_name,
+            self.config['subject'],
+            self.config['body'],
+            pdf_paths
+        )
+        return participant_name, msg
+
+    def _record_result(self, row, error=None):
+        """Cuenta el resultado de un participante y actualiza el progreso (desde cualquier hilo)"""
+        if error is not None and not error.startswith("❌"):
+            participant_name = row.get(self.config['name_column'], 'Desconocido')
+            error = f"❌ Error con {participant_name}: {error}"
+        with self._lock:
+            self._done_count += 1
+            if error is None:
+                self._success_count += 1
+            else:
+                self._failed_count += 1
+                self._errors.append(error)
+            progress = int(self._done_count / self._total_emails * 100)
+        if error is not None:
+            self.log.emit(error)
+        self.progress.emit(progress)
     
     def _find_pdf_files(self, pdf_folder: str, filenames: str) -> list:
         """Busca múltiples archivos PDF en la carpeta especificada"""
         pdf_paths = []
         
-        if not filenames or pd.isna(filenames):
+        if not filenames:
             return pdf_paths
             
         # Separar por comas, punto y coma o saltos de línea
@@ -442,8 +589,8 @@ class EmailSender(QThread):
             
             self.log.emit(f"🔗 Probando conexión con {smtp_config['server']}:{smtp_config['port']}")
             
-            server = smtplib.SMTP(smtp_config['server'], smtp_config['port'])
-            server.starttls()
+            server = smtplib.SMTP(smtp_config['server'], smtp_config['port'], timeout=SMTP_TIMEOUT)
+            server.starttls(context=self.tls_context)
             server.login(email, password)
             server.quit()
             
@@ -0,0 +1,516 @@
+# generation_engine.py
+"""
+Motor de generación de constancias, independiente de Qt. Se puede usar desde la
+interfaz (worker.Worker), desde la línea de comandos (cli.py) o desde otro proceso.
+"""
+
+import os
+import copy
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from signature import sign_pdf_document, get_validation_text, Signer, MerkleBatch, ALG_RSA_PSS
+from parallel_generator import init_process, render_certificate, default_worker_count
+from combined_pdf import CombinedPdfWriter
+from job_manifest import JobManifest, record_key
+
+# Tareas enviadas por proceso que esperan a ser recogidas (ver run_parallel)
+IN_FLIGHT_PER_WORKER = 2
+
+
+class FilenameAllocator:
+    """
+    Asigna nombres de archivo únicos en la carpeta de salida con la misma regla de
+    siempre: "Nombre", "Nombre (1)", "Nombre (2)"... tomando el primero libre.
+    La carpeta se lee una sola vez y cada nombre base guarda su último sufijo, así
+    que resolver un nombre no depende de cuántos participantes se llaman igual.
+    """
+    def __init__(self, output_dir, extension=".pdf"):
+        self.extension = extension
+        try:
+            existing = os.listdir(output_dir)
+        except OSError:
+            existing = []
+        # normcase: en Windows los nombres no distinguen mayúsculas, igual que os.path.exists
+        self._taken = {os.path.normcase(name) for name in existing}
+        self._next_suffix = {}  # nombre base -> primer sufijo que falta probar
+
+    def _key(self, stem):
+        return os.path.normcase(f"{stem}{self.extension}")
+
+    def reserve(self, stem):
+        """Aparta un nombre (sin extensión) para que nadie más lo use"""
+        self._taken.add(self._key(stem))
+
+    def allocate(self, base_name):
+        """Devuelve el primer nombre libre para base_name (sin extensión) y lo aparta"""
+        base_key = os.path.normcase(base_name)
+        count = self._next_suffix.get(base_key, 0)
+        candidate = base_name if count == 0 else f"{base_name} ({count})"
+        while self._key(candidate) in self._taken:
+            count += 1
+            candidate = f"{base_name} ({count})"
+        # Los sufijos anteriores ya están ocupados; la siguiente búsqueda empieza aquí
+        self._next_suffix[base_key] = count
+        self._taken.add(self._key(candidate))
+        return candidate
+
+
+class GenerationEngine:
+    """
+    Generación de constancias en Python puro (sin Qt): planifica los registros,
+    los genera en uno o varios procesos y reporta el avance mediante callbacks.
+    La interfaz la ejecuta a través de worker.Worker; cli.py la usa directamente.
+
+    Callbacks (todos opcionales, se llaman desde el hilo que ejecuta run()):
+        on_log(mensaje), on_progress(porcentaje), on_finished(mensaje final)
+    """
+    def __init__(self, template_path, excel_data, output_dir, font_map, placeholder_map, export_mode, filename_column=None, enable_signature=True, enable_folio=True, folio_column=None, folio_font_map=None, num_workers=None, batch_signing=False, signature_algorithm=ALG_RSA_PSS, resume=False, on_log=None, on_progress=None, on_finished=None):
+        self.template_path = template_path
+        self.excel_data = excel_data
+        self.output_dir = output_dir
+        self.font_map = font_map
+        self.placeholder_map = placeholder_map
+        self.filename_column = filename_column
+        self.export_mode = export_mode
+        self.enable_signature = enable_signature
+        self.enable_folio = enable_folio
+        self.folio_column = folio_column
+        self.folio_font_map = folio_font_map or {}
+        self.num_workers = num_workers if num_workers else default_worker_count()
+        self.batch_signing = batch_signing
+        self.signature_algorithm = signature_algorithm
+        self.resume = resume
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.is_cancelled = False
+        self.signer = None
+        self.manifest = None
+        self.skipped_count = 0  # Constancias de un trabajo anterior que no se vuelven a generar
+        self.issue_date = None  # Fecha de emisión, la misma para todo el trabajo
+        # Registros leídos al planificar; con una lista de Excel leída fila por fila,
+        # len(excel_data) es solo el número de filas de la hoja
+        self.total_records = 0
+        # Resultado del trabajo (para quien ejecuta la generación sin interfaz, ver cli.py)
+        self.success_count = 0
+        self.error_count = 0
+        self.sign_error_count = 0
+        self.critical_error = None
+
+        # Ensure keys exist y cargar la llave una sola vez (solo si la firma está habilitada)
+        if self.enable_signature:
+            try:
+                self.signer = Signer(algorithm=self.signature_algorithm)
+            except Exception as e:
+                print(f"[signature] Warning: no se pudieron generar/validar llaves: {e}")
+
+    def run(self):
+        try:
+            total_files = len(self.excel_data)
+            mode_text = "con firma digital" if self.enable_signature else "sin firma digital"
+            folio_text = "con folio" if self.enable_folio else "sin folio"
+            self._log(f"Iniciando generación de {total_files} constancias {mode_text} {folio_text}...")
+            if self._can_run_parallel(total_files):
+                self.run_parallel(total_files)
+            else:
+                self.run_single_thread(total_files)
+        except Exception as e:
+            self.critical_error = str(e)
+            self._finished(f"Ocurrió un error crítico: {e}")
+
+    def _log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def _progress(self, value):
+        if self.on_progress:
+            self.on_progress(value)
+
+    def _finished(self, message):
+        if self.on_finished:
+            self.on_finished(message)
+
+    def _can_run_parallel(self, total_files):
+        """Solo las plantillas PDF se procesan en paralelo (Word/PowerPoint usan COM)"""
+        is_pdf = os.path.splitext(self.template_path)[1].lower() == '.pdf'
+        return is_pdf and self.num_workers > 1 and total_files > 1
+
+    def _plan_record(self, i, record, filenames, reserved_name=None):
+        """
+        Prepara la tarea de un registro: datos, fuentes, nombre de archivo y folio.
+        Se ejecuta siempre en este hilo y en orden, para que los nombres de archivo
+        y los folios sean deterministas sin importar cuántos procesos se usen.
+
+        Args:
+            reserved_name: Nombre de archivo asignado a este registro por un trabajo
+                           anterior (reanudación); se reutiliza si los datos no cambiaron.
+        """
+        data_map = {
+            placeholder: record.get(column_name, '')
+            for placeholder, column_name in self.placeholder_map.items()
+        }
+
+        # AGREGAR FOLIO AL DATA_MAP SI ESTÁ HABILITADO
+        # Sin columna de folio (o con la celda vacía) se genera uno secuencial
+        if self.enable_folio:
+            folio_value = record.get(self.folio_column, '') if self.folio_column else ''
+            if folio_value:
+                data_map["{{FOLIO}}"] = str(folio_value)
+            else:
+                data_map["{{FOLIO}}"] = f"FOLIO-{i+1:06d}"
+
+        # COMBINAR FONT_MAP CON FOLIO_FONT_MAP
+        combined_font_map = self.font_map.copy()
+        if self.enable_folio and self.folio_font_map:
+            combined_font_map["{{FOLIO}}"] = self.folio_font_map
+
+        if getattr(self, 'filename_column', None) and self.filename_column:
+            name_for_file = record.get(self.filename_column, '') or data_map.get('{{TEXT_1}}', f'Constancia_{i+1}')
+        else:
+            name_for_file = data_map.get('{{TEXT_1}}', f'Constancia_{i+1}')
+
+        clean_name = "".join(c for c in str(name_for_file) if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+        if not clean_name:
+            clean_name = f'Constancia_{i+1}'
+
+        key = record_key(data_map)
+        if reserved_name and reserved_name[1] == key:
+            # Reanudación: el registro conserva el nombre que ya tenía (se sobrescribe si quedó incompleto)
+            output_filename = os.path.join(self.output_dir, reserved_name[0])
+        else:
+            candidate = filenames.allocate(clean_name)
+            output_filename = os.path.join(self.output_dir, f"{candidate}.pdf")
+
+        # Preparar datos para el código QR con soporte para caracteres especiales
+        cert_data = None
+        if self.enable_signature:
+            cert_data = {
+                "nombre": data_map.get("{{TEXT_1}}", ""),
+                "evento": data_map.get("{{TEXT_2}}", ""),
+                "folio": data_map.get("{{FOLIO}}", f"RALLY-{int(i+1):06d}"),
+                "fecha_emision": self.issue_date,
+                "institucion": "Universidad de Sonora"
+            }
+
+        return {
+            "index": i,
+            "data_map": data_map,
+            "font_map": combined_font_map,
+            "output_filename": output_filename,
+            "name_for_file": name_for_file,
+            "cert_data": cert_data,
+            "combine": self.export_mode == "Un solo PDF combinado",
+            "key": key,
+        }
+
+    def _iter_tasks(self):
+        """
+        Planifica los registros en orden a medida que se leen de la lista: la primera
+        constancia se genera sin esperar a leer (ni planificar) el resto, y una
+        cancelación se atiende de inmediato. Con firma por lotes la lista se recorre
+        dos veces (ver _sign_batch): la primera solo guarda las hojas del árbol.
+        """
+        self.issue_date = datetime.now().strftime('%Y-%m-%d')
+        manifest = self._load_manifest()
+        resuming = manifest is not None and manifest.header is not None
+        reserved = {}
+        if resuming:
+            reserved = {i: (plan["output"], plan["key"]) for i, plan in manifest.planned.items()}
+
+        # La carpeta de salida se lee una sola vez; los nombres del trabajo anterior
+        # quedan apartados para sus registros
+        filenames = FilenameAllocator(self.output_dir)
+        for name, _ in reserved.values():
+            filenames.reserve(os.path.splitext(name)[0])
+
+        batch, skipped = None, None
+        if self.enable_signature and self.batch_signing:
+            # Con una copia del asignador: la segunda pasada asigna los mismos nombres
+            batch, skipped = self._sign_batch(copy.deepcopy(filenames), reserved, manifest if resuming else None)
+            if self.is_cancelled:
+                return
+
+        if manifest is not None:
+            if resuming:
+                manifest.resume()
+                self._log("⏭️ Reanudando trabajo anterior: se omiten las constancias ya generadas (hash verificado)")
+            else:
+                manifest.start(self.template_path, len(self.excel_data), self.export_mode, self._job_options())
+            self.manifest = manifest
+
+        position = 0  # Hoja del lote que corresponde a la siguiente tarea
+        for i, record in enumerate(self.excel_data):
+            if self.is_cancelled:
+                return
+            self.total_records = i + 1
+            try:
+                task = self._plan_record(i, record, filenames, reserved.get(i))
+                if resuming and (i in skipped if skipped is not None else
+                                 manifest.verified_output(i, task["key"], require_signed=self.enable_signature)):
+                    self.skipped_count += 1
+                    continue
+                if batch is not None:
+                    position += 1
+                    try:
+                        task["signed_metadata"] = batch.metadata(position - 1, task["cert_data"])
+                    except (ValueError, IndexError) as e:
+                        # La lista cambió entre las dos pasadas: esta constancia se firma sola
+                        self._log(f"⚠️ Registro {i+1} fuera del lote ({e}); se firmará individualmente")
+                if manifest is not None:
+                    manifest.plan(task)
+            except Exception as e:
+                self.error_count += 1
+                self._log(f"❌ Error en registro {i+1}: {str(e)}")
+                continue
+            yield task
+
+        if resuming and self.skipped_count:
+            self._log(f"⏭️ {self.skipped_count} constancias del trabajo anterior se omitieron")
+
+    def _sign_batch(self, filenames, reserved, manifest):
+        """
+        Primera pasada de la firma por lotes: planifica cada registro solo para calcular
+        la hoja de su payload y firma la raíz una sola vez. No se conservan las tareas,
+        solo las hojas del árbol (y los registros que se omiten al reanudar).
+        Devuelve (lote, omitidos) o (None, None) si no se pudo firmar por lotes.
+        """
+        batch = MerkleBatch(self.signer)
+        skipped = set()
+        try:
+            for i, record in enumerate(self.excel_data):
+                if self.is_cancelled:
+                    return None, None
+                try:
+                    task = self._plan_record(i, record, filenames, reserved.get(i))
+                except Exception:
+                    continue  # El error se informa en la segunda pasada
+                if manifest is not None and manifest.verified_output(i, task["key"], require_signed=True):
+                    skipped.add(i)
+                    continue
+                batch.add(task["cert_data"])
+            if not len(batch):
+                return None, skipped
+            batch.sign()
+            self._log(f"🔐 Firma por lotes: {len(batch)} constancias cubiertas por una sola firma (árbol de Merkle)")
+            return batch, skipped
+        except Exception as e:
+            self._log(f"⚠️ No se pudo firmar por lotes, se firmará cada constancia: {e}")
+            return None, None
+
+    def _job_options(self):
+        """Opciones que cambian el contenido de las constancias; reanudar exige que sean las mismas"""
+        return {
+            "signature": self.enable_signature,
+            "algorithm": self.signature_algorithm if self.enable_signature else None,
+            "batch_signing": bool(self.enable_signature and self.batch_signing),
+            "validation_text": get_validation_text() if self.enable_signature else None,
+            "folio": self.enable_folio,
+            "folio_column": self.folio_column if self.enable_folio else None,
+            "folio_font_map": self.folio_font_map if self.enable_folio else None,
+            "font_map": self.font_map,
+            "placeholder_map": self.placeholder_map,
+        }
+
+    def _load_manifest(self):
+        """
+        Manifiesto del trabajo (solo en exportación individual). En modo reanudación
+        se carga el del trabajo anterior si corresponde a la misma plantilla y lista.
+        """
+        if self.export_mode == "Un solo PDF combinado":
+            if self.resume:
+                self._log("⚠️ La reanudación solo aplica a constancias individuales; se generará el PDF combinado completo")
+            return None
+
+        manifest = JobManifest(self.output_dir)
+        if self.resume:
+            if manifest.load() and manifest.matches(self.template_path, len(self.excel_data), self.export_mode,
+                                                    self._job_options()):
+                return manifest
+            self._log("⚠️ No hay un trabajo anterior compatible en la carpeta de salida; se inicia uno nuevo")
+            manifest = JobManifest(self.output_dir)
+        return manifest
+
+    def _handle_result(self, task, result, total_files, done_count, combined, temp_files_to_cleanup):
+        """Registra el resultado de una constancia generada (en este hilo)"""
+        output_filename = result["output_filename"]
+        data_map = task["data_map"]
+
+        # Registrar la constancia terminada para poder reanudar el trabajo
+        if self.manifest is not None:
+            self.manifest.mark_done(task, result)
+
+        # --- FIRMAR Y EMBEDIR AUTOMÁTICAMENTE (SOLO SI ESTÁ HABILITADO) ---
+        if self.enable_signature:
+            if result["signed"]:
+                folio_display = data_map.get("{{FOLIO}}", "N/A")
+                self._log(f"🔐 Firma añadida: {os.path.basename(output_filename)} (Folio: {folio_display})")
+            else:
+                self.sign_error_count += 1
+                self._log(f"⚠️ No se pudo firmar {os.path.basename(output_filename)}: {result['sign_error']}")
+        else:
+            folio_display = data_map.get("{{FOLIO}}", "N/A") if self.enable_folio else "N/A"
+            self._log(f"📄 Generado sin firma: {os.path.basename(output_filename)} (Folio: {folio_display})")
+
+        # Si estamos combinando PDFs, insertar después de procesar
+        if combined is not None:
+            if "pdf_bytes" in result:
+                # Constancia generada en otro proceso: llega serializada, sin archivo temporal
+                combined.add_bytes(result["pdf_bytes"])
+            elif not result.get("combined"):
+                # Word/PowerPoint: Office genera el PDF en disco
+                combined.add_file(output_filename)
+                temp_files_to_cleanup.append(output_filename)
+
+        # Log con información del folio
+        folio_info = f" | Folio: {data_map.get('{{FOLIO}}', 'N/A')}" if self.enable_folio else ""
+        self._log(f"✅ ({task['index']+1}/{total_files}) Generada para: {task['name_for_file']}{folio_info}")
+        # total_files es el número de filas de la hoja (puede incluir filas vacías)
+        self._progress(min(100, int((done_count / max(total_files, 1)) * 100)))
+
+    def _open_combined(self):
+        """Escritor del PDF combinado (None si se exportan archivos individuales)"""
+        if self.export_mode != "Un solo PDF combinado":
+            return None
+        return CombinedPdfWriter(os.path.join(self.output_dir, "Constancias_Combinadas.pdf"))
+
+    def run_single_thread(self, total_files):
+        combined = self._open_combined()
+        success_count = 0
+        temp_files_to_cleanup = []
+
+        try:
+            init_process(self.template_path, self.enable_signature, signer=self.signer)
+            for task in self._iter_tasks():
+                try:
+                    # Las constancias PDF se insertan en el combinado directamente desde memoria
+                    result = render_certificate(task, combined.add_document if combined else None)
+                    self._handle_result(task, result, total_files, task["index"] + 1, combined, temp_files_to_cleanup)
+                    success_count += 1
+
+                except Exception as e:
+                    self.error_count += 1
+                    self._log(f"❌ Error en registro {task['index']+1}: {str(e)}")
+            if self.is_cancelled:
+                self._log("Proceso cancelado por el usuario.")
+
+            success_count += self.skipped_count
+            self._finish(success_count, self.total_records, combined)
+
+        finally:
+            self._cleanup(temp_files_to_cleanup, combined)
+
+    def run_parallel(self, total_files):
+        """
+        Reparte los registros entre varios procesos. Los nombres de archivo y folios
+        se asignan aquí antes de enviar cada tarea; los resultados se recogen en el
+        orden original para que los logs y el PDF combinado sean deterministas.
+        """
+        combined = self._open_combined()
+        success_count = 0
+        temp_files_to_cleanup = []
+        workers = min(self.num_workers, total_files)
+        self._log(f"⚙️ Generación en paralelo con {workers} procesos")
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_process,
+                initargs=(self.template_path, self.enable_signature, get_validation_text(), None,
+                          self.signature_algorithm),
+            ) as executor:
+                # Solo hay IN_FLIGHT_PER_WORKER tareas por proceso enviadas a la vez: cada Future
+                # conserva su resultado (en modo combinado, el PDF completo), así que se planifica
+                # y envía una nueva tarea por cada resultado consumido y el Future se descarta
+                queued = self._iter_tasks()
+                pending = deque()
+                for task in queued:
+                    pending.append((task, executor.submit(render_certificate, task)))
+                    if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                        break
+
+                while pending:
+                    if self.is_cancelled:
+                        for _, remaining in pending:
+                            remaining.cancel()
+                        pending.clear()
+                        break
+
+                    task, future = pending.popleft()
+                    try:
+                        result = future.result()
+                        self._handle_result(task, result, total_files, task["index"] + 1, combined, temp_files_to_cleanup)
+                        success_count += 1
+                    except Exception as e:
+                        self.error_count += 1
+                        self._log(f"❌ Error en registro {task['index']+1}: {str(e)}")
+
+                    next_task = next(queued, None)
+                    if next_task is not None:
+                        pending.append((next_task, executor.submit(render_certificate, next_task)))
+                if self.is_cancelled:
+                    self._log("Proceso cancelado por el usuario.")
+
+            success_count += self.skipped_count
+            self._finish(success_count, self.total_records, combined)
+
+        finally:
+            self._cleanup(temp_files_to_cleanup, combined)
+
+    def _finish(self, success_count, total_files, combined):
+        self.success_count = success_count
+        if not self.is_cancelled:
+            self._progress(100)
+            if self.export_mode == "Un solo PDF combinado":
+                def sign_combined(doc):
+                    # Agregar firma al PDF combinado si está habilitado (antes del último guardado)
+                    if not self.enable_signature:
+                        return
+                    try:
+                        cert_data = {
+                            "documento": "Constancias Combinadas",
+                            "total_constancias": success_count,
+                            "folio": f"COMBINADO-{datetime.now().strftime('%Y%m%d')}",
+                            "fecha_emision": datetime.now().strftime('%Y-%m-%d'),
+                            "institucion": "Universidad de Sonora"
+                        }
+                        sign_pdf_document(doc, cert_data, signer=self.signer)
+                        self._log(f"🔐 Firma añadida al documento combinado")
+                    except Exception as e:
+                        self._log(f"⚠️ No se pudo firmar documento combinado: {e}")
+
+                combined.finish(sign_combined)
+                if combined.duplicates_removed:
+                    saved_mb = combined.bytes_saved / (1024 * 1024)
+                    self._log(f"♻️ Recursos compartidos: {combined.duplicates_removed} objetos repetidos "
+                                  f"se guardaron una sola vez ({saved_mb:.1f} MB ahorrados)")
+
+                mode_text = "con firma digital" if self.enable_signature else "sin firma digital"
+                folio_text = "con folio" if self.enable_folio else "sin folio"
+                self._finished(f"¡Proceso completado! Se generó 1 PDF combinado {mode_text} {folio_text} con {success_count} constancias.")
+            else:
+                mode_text = "con firma digital" if self.enable_signature else "sin firma digital"
+                folio_text = "con folio" if self.enable_folio else "sin folio"
+                self._finished(f"¡Proceso completado! Se generaron {success_count} de {total_files} constancias {mode_text} {folio_text}.")
+        else:
+            self._finished("Proceso detenido por el usuario.")
+
+    def _cleanup(self, temp_files_to_cleanup, combined):
+        if self.manifest is not None:
+            self.manifest.close()
+        # limpieza de temporales
+        for temp in temp_files_to_cleanup:
+            try:
+                if os.path.exists(temp):
+                    os.remove(temp)
+            except Exception:
+                pass
+        # Si el PDF combinado no se terminó (cancelación o error), se descartan sus partes
+        if combined is not None and not combined.doc.is_closed:
+            combined.abort()
+
+    def stop(self):
+        """Detiene la generación de manera segura"""
+        self.is_cancelled = True
+        self._log("⏹️ Cancelando proceso...")
@@ -0,0 +1,182 @@
+# job_manifest.py
+"""
+Manifiesto de un trabajo de generación. Se escribe junto a las constancias y se
+actualiza una línea por constancia terminada (JSON Lines), así que sobrevive a un
+cierre inesperado o a una cancelación y permite reanudar el trabajo sin repetir
+lo que ya está hecho.
+
+Formato:
+    {"type": "job", ...}                          encabezado: plantilla (ruta y hash) y opciones
+    {"type": "plan", "index", "output", "folio", "key"}  nombre asignado a cada registro
+    {"type": "done", "index", "output", "folio", "sha256", "signed", "sign_error"}
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+MANIFEST_FILENAME = "Constancias_manifiesto.jsonl"
+MANIFEST_VERSION = 2
+
+
+def file_sha256(path: str) -> str:
+    """Hash SHA-256 del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_key(data_map: dict) -> str:
+    """Huella de los datos de un registro; si cambian, la constancia anterior ya no sirve"""
+    canonical = json.dumps(data_map, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def job_options(**options) -> dict:
+    """
+    Opciones de generación tal como quedan guardadas en el encabezado (JSON), para
+    compararlas con las del trabajo anterior: firma, algoritmo, folio, estilos...
+    """
+    return json.loads(json.dumps(options, sort_keys=True, ensure_ascii=False, default=str))
+
+
+class JobManifest:
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.header = None
+        # Entradas del trabajo anterior (load); las que se escriben en este no se conservan
+        self.planned = {}    # index -> entrada "plan"
+        self.completed = {}  # index -> entrada "done"
+        self._file = None
+
+    def load(self) -> bool:
+        """
+        Lee el manifiesto de un trabajo anterior. Una última línea incompleta
+        (cierre a mitad de escritura) se ignora. Retorna False si no hay manifiesto.
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry.get("type")
+                if kind == "job":
+                    self.header = entry
+                elif kind == "plan":
+                    # Un plan nuevo para el registro invalida lo generado con el plan anterior
+                    self.planned[entry["index"]] = entry
+                    self.completed.pop(entry["index"], None)
+                elif kind == "done":
+                    self.completed[entry["index"]] = entry
+        return self.header is not None
+
+    def matches(self, template_path: str, total: int, export_mode: str, options: dict) -> bool:
+        """
+        Indica si el manifiesto cargado corresponde al mismo trabajo: misma plantilla
+        (ruta y contenido), lista, modo de exportación y opciones (ver job_options)
+        """
+        if (self.header is None
+                or self.header.get("version") != MANIFEST_VERSION
+                or os.path.abspath(self.header.get("template", "")) != os.path.abspath(template_path)
+                or self.header.get("total") != total
+                or self.header.get("export_mode") != export_mode
+                or self.header.get("options") != job_options(**options)):
+            return False
+        try:
+            return self.header.get("template_sha256") == file_sha256(template_path)
+        except OSError:
+            return False
+
+    def verified_output(self, index: int, key: str, require_signed: bool = False):
+        """
+        Ruta de la constancia ya generada para el registro si sigue siendo válida:
+        los datos del registro no cambiaron, el archivo existe con el mismo hash y,
+        si se pide firma, quedó firmada (una firma fallida se vuelve a intentar).
+        """
+        plan = self.planned.get(index)
+        done = self.completed.get(index)
+        if plan is None or done is None or plan.get("key") != key:
+            return None
+        if require_signed and not done.get("signed"):
+            return None
+        path = os.path.join(self.output_dir, done["output"])
+        try:
+            if file_sha256(path) != done["sha256"]:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def start(self, template_path: str, total: int, export_mode: str, options: dict):
+        """
+        Empieza un manifiesto nuevo (reemplaza el anterior). El plan de cada registro
+        se agrega con plan() a medida que se planifica.
+        """
+        self.close()
+        self.header = {
+            "type": "job",
+            "version": MANIFEST_VERSION,
+            "template": os.path.abspath(template_path),
+            "template_sha256": file_sha256(template_path),
+            "total": total,
+            "export_mode": export_mode,
+            "options": job_options(**options),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.planned = {}
+        self.completed = {}
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write(self.header)
+        self._file.flush()
+
+    def resume(self):
+        """Continúa el manifiesto cargado; plan() agrega los registros que no tenían un plan válido"""
+        self.close()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def plan(self, task: dict):
+        """Registra el nombre de archivo asignado a un registro (si cambió respecto al plan guardado)"""
+        output = os.path.basename(task["output_filename"])
+        current = self.planned.get(task["index"])
+        if current is not None and current.get("output") == output and current.get("key") == task["key"]:
+            return
+        entry = {
+            "type": "plan",
+            "index": task["index"],
+            "output": output,
+            "folio": task["data_map"].get("{{FOLIO}}"),
+            "key": task["key"],
+        }
+        # El plan anterior del registro ya no vale (ni lo generado con él)
+        self.planned.pop(task["index"], None)
+        self.completed.pop(task["index"], None)
+        self._write(entry)
+
+    def mark_done(self, task: dict, result: dict):
+        """Registra una constancia terminada (se escribe de inmediato al disco)"""
+        entry = {
+            "type": "done",
+            "index": task["index"],
+            "output": os.path.basename(result["output_filename"]),
+            "folio": task["data_map"].get("{{FOLIO}}"),
+            "sha256": result["sha256"],
+            "signed": result["signed"],
+            "sign_error": result["sign_error"],
+        }
+        self._write(entry)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
@@ -0,0 +1,71 @@
+# log_buffer.py
+"""
+Registro de actividad con entrega agrupada al panel de la interfaz.
+Los mensajes se acumulan y se agregan al QTextEdit en bloques con un temporizador,
+en lugar de uno por uno; el panel conserva solo las últimas líneas y, si se indica,
+el registro completo se escribe en un archivo.
+"""
+
+from collections import deque
+from datetime import datetime
+from PyQt6.QtCore import QObject, QTimer
+from PyQt6.QtGui import QTextCursor
+
+DEFAULT_MAX_LINES = 5000     # Líneas que conserva el panel
+DEFAULT_INTERVAL_MS = 100    # Cada cuánto se agregan los mensajes pendientes al panel
+LOG_FILENAME = "Constancias_registro.log"
+
+
+class BufferedLog(QObject):
+    def __init__(self, view, max_lines=DEFAULT_MAX_LINES, interval_ms=DEFAULT_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.view = view
+        # El documento descarta las líneas más antiguas al pasar el límite (búfer circular)
+        self.view.document().setMaximumBlockCount(max_lines)
+        # Los mensajes que no cabrían en el panel tampoco se guardan como pendientes
+        self._pending = deque(maxlen=max_lines)
+        self._file = None
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def append(self, message):
+        """Agrega un mensaje con la hora actual; se mostrará en el siguiente bloque"""
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {message}"
+        self._pending.append(line)
+        if self._file is not None:
+            self._file.write(line + "\n")
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """Agrega todos los mensajes pendientes al panel en una sola operación"""
+        self._timer.stop()
+        if self._file is not None:
+            self._file.flush()
+        if not self._pending:
+            return
+        text = "\n".join(self._pending)
+        self._pending.clear()
+
+        cursor = QTextCursor(self.view.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not self.view.document().isEmpty():
+            text = "\n" + text
+        cursor.insertText(text)
+        self.view.verticalScrollBar().setValue(self.view.verticalScrollBar().maximum())
+
+    def open_file(self, path):
+        """Escribe también el registro completo (sin límite de líneas) en path"""
+        self.close_file()
+        try:
+            self._file = open(path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"[log] Warning: no se pudo abrir el archivo de registro: {e}")
+            self._file = None
+        return self._file is not None
+
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,6 +1,7 @@
 # main.py
 import sys
 import os
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from ui import App
 from auto_updater import auto_update, get_local_commit_sha
@@ -56,4 +57,6 @@ def main():
     sys.exit(exit_code)
 
 if __name__ == '__main__':
+    # Necesario para la generación en paralelo en ejecutables de PyInstaller (Windows)
+    multiprocessing.freeze_support()
     main()
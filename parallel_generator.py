@@ -0,0 +1,114 @@
+# parallel_generator.py
+"""
+Tareas de generación de constancias ejecutables en procesos independientes.
+No importa nada de Qt para que los procesos hijos arranquen rápido y
+puedan serializar las tareas con pickle.
+"""
+
+import os
+from document_processor import get_processor, load_template_bytes, PdfProcessor
+from signature import sign_and_embed, sign_pdf_document, set_validation_text, Signer, ALG_RSA_PSS
+from job_manifest import file_sha256
+
+# Contexto del proceso actual (se llena en init_process)
+_context = {}
+
+
+def default_worker_count() -> int:
+    """Número de procesos por defecto: uno por núcleo disponible"""
+    return max(1, os.cpu_count() or 1)
+
+
+def init_process(template_path: str, enable_signature: bool, validation_text=None, signer=None,
+                 signature_algorithm=ALG_RSA_PSS):
+    """
+    Inicializa el contexto de generación en el proceso actual.
+    Se usa como initializer del ProcessPoolExecutor y también en modo de un solo hilo.
+
+    Args:
+        signer: Signer ya cargado (modo de un solo hilo). Los procesos hijos cargan el suyo,
+                porque la llave privada no se puede enviar entre procesos.
+        signature_algorithm: Algoritmo con el que se carga ese Signer (RSA-PSS o Ed25519).
+    """
+    _context["template_path"] = template_path
+    _context["enable_signature"] = enable_signature
+    # La llave privada se carga una vez por proceso, no por constancia
+    _context["signer"] = signer
+    if enable_signature and signer is None:
+        try:
+            _context["signer"] = Signer(algorithm=signature_algorithm)
+        except Exception as e:
+            # Cada constancia reportará el error de firma por separado
+            print(f"[signature] Warning: no se pudo cargar la llave privada: {e}")
+    # La plantilla PDF se lee una sola vez por trabajo; cada registro la clona en memoria
+    is_pdf = os.path.splitext(template_path)[1].lower() == '.pdf'
+    _context["template_bytes"] = load_template_bytes(template_path) if is_pdf else None
+    # Los procesos hijos no heredan la leyenda configurada desde la interfaz
+    if validation_text:
+        set_validation_text(validation_text)
+
+
+def render_certificate(task: dict, combine=None) -> dict:
+    """
+    Genera, guarda y (opcionalmente) firma una constancia.
+
+    Args:
+        task: dict con index, data_map, font_map, output_filename, cert_data
+              y opcionalmente signed_metadata (firma por lotes) y combine
+              (la constancia va al PDF combinado y no se guarda por separado)
+        combine: función que recibe el documento en memoria (mismo proceso). Sin ella,
+                 una constancia para el PDF combinado se devuelve serializada en pdf_bytes.
+    Returns:
+        dict con index, output_filename, signed, sign_error, sha256 del archivo guardado
+        y, si aplica, pdf_bytes o combined
+    """
+    processor = get_processor(_context["template_path"], _context["template_bytes"])
+    processor.process(task["data_map"], task["font_map"])
+
+    result = {
+        "index": task["index"],
+        "output_filename": task["output_filename"],
+        "signed": False,
+        "sign_error": None,
+        "sha256": None,
+    }
+
+    must_sign = _context.get("enable_signature") and task.get("cert_data") is not None
+    in_memory = isinstance(processor, PdfProcessor)
+
+    # PDF: firmar y estampar el documento en memoria antes de la única escritura a disco
+    if must_sign and in_memory:
+        try:
+            sign_pdf_document(processor.doc, task["cert_data"], placeholder_index=processor.placeholder_index,
+                              signer=_context["signer"], metadata=task.get("signed_metadata"))
+            result["signed"] = True
+        except Exception as e:
+            result["sign_error"] = str(e)
+
+    if task.get("combine") and in_memory:
+        # PDF combinado: la constancia nunca se escribe como archivo propio
+        if combine is not None:
+            try:
+                combine(processor.doc)
+            finally:
+                processor.close()
+            result["combined"] = True
+        else:
+            result["pdf_bytes"] = processor.to_bytes()
+        return result
+
+    processor.save_as_pdf(task["output_filename"])
+
+    # Word/PowerPoint: el PDF lo genera Office, así que se firma sobre el archivo guardado
+    if must_sign and not in_memory:
+        try:
+            # Firmar el documento (sobrescribe el mismo archivo)
+            sign_and_embed(task["output_filename"], task["output_filename"], task["cert_data"],
+                           signer=_context["signer"], metadata=task.get("signed_metadata"))
+            result["signed"] = True
+        except Exception as e:
+            result["sign_error"] = str(e)
+
+    # Hash del archivo final para el manifiesto del trabajo (se calcula en el proceso que lo generó)
+    result["sha256"] = file_sha256(task["output_filename"])
+    return result
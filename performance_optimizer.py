@@ -15,5 +15,20 @@ class PerformanceOptimizer:
         try:
             import fitz
             fitz.TOOLS.mupdf_clean()
+        except:
+            pass
+        try:
+            from document_processor import clear_template_cache
+            clear_template_cache()
+        except:
+            pass
+        try:
+            from signature import clear_overlay_cache
+            clear_overlay_cache()
+        except:
+            pass
+        try:
+            from data_handler import clear_cache
+            clear_cache()
         except:
             pass
\ No newline at end of file
@@ -8,22 +8,19 @@ y verifica integridad del documento.
 import json
 import os
 import base64
+import hashlib
+import zlib
 from datetime import datetime
 from io import BytesIO
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ed25519
 import qrcode
 from PIL import Image
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader
 from docx import Document
 from pptx import Presentation
 from pptx.util import Inches
 
-# Importaciones adicionales para la nueva funcionalidad de seguridad en PDF
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from reportlab.lib import colors
-
 # Importación para búsqueda exacta de posición QR
 import fitz  # PyMuPDF
 
@@ -33,20 +30,39 @@ import fitz  # PyMuPDF
 KEYS_DIR = os.path.join(os.path.dirname(__file__), "keys")
 PRIVATE_KEY_PATH = os.path.join(KEYS_DIR, "private_key.pem")
 PUBLIC_KEY_PATH = os.path.join(KEYS_DIR, "public_key.pem")
+ED25519_PRIVATE_KEY_PATH = os.path.join(KEYS_DIR, "private_key_ed25519.pem")
+ED25519_PUBLIC_KEY_PATH = os.path.join(KEYS_DIR, "public_key_ed25519.pem")
+
+# Algoritmos de firma disponibles (se guardan en el campo "alg" de la metadata)
+ALG_RSA_PSS = "RSA-PSS-SHA256"
+ALG_ED25519 = "Ed25519"
+SIGNATURE_ALGORITHMS = (ALG_RSA_PSS, ALG_ED25519)
 ISSUER_STRING = "Firmado por Rally de la Ninez Cientifica y Expo STEM by Universidad de Sonora"
 
 # Variable global para la leyenda personalizable
 VALIDATION_TEXT = "Validado por Rally de la Niñez Científica y EXPO STEM, Universidad de Sonora"
 
 # ==============================================
-# LLAVES RSA
+# LLAVES RSA / ED25519
 # ==============================================
-def ensure_keys(private_path=PRIVATE_KEY_PATH, public_path=PUBLIC_KEY_PATH, bits=2048):
+def key_paths(algorithm=ALG_RSA_PSS):
+    """Rutas (privada, pública) por defecto para cada algoritmo"""
+    if algorithm == ALG_ED25519:
+        return ED25519_PRIVATE_KEY_PATH, ED25519_PUBLIC_KEY_PATH
+    return PRIVATE_KEY_PATH, PUBLIC_KEY_PATH
+
+
+def ensure_keys(private_path=PRIVATE_KEY_PATH, public_path=PUBLIC_KEY_PATH, bits=2048, algorithm=ALG_RSA_PSS):
     os.makedirs(os.path.dirname(private_path), exist_ok=True)
     if os.path.exists(private_path) and os.path.exists(public_path):
         return private_path, public_path
 
-    private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+    if algorithm not in SIGNATURE_ALGORITHMS:
+        raise ValueError(f"Algoritmo de firma no soportado: {algorithm}")
+    if algorithm == ALG_ED25519:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
     priv_pem = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PrivateFormat.PKCS8,
@@ -81,41 +97,405 @@ def canonicalize_payload(payload: dict) -> bytes:
     return json.dumps(payload, separators=(",", ":"), sort_keys=True, ensure_ascii=False).encode("utf-8")
 
 
+def _key_algorithm(key) -> str:
+    """Algoritmo que corresponde a una llave (privada o pública) ya cargada"""
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return ALG_ED25519
+    return ALG_RSA_PSS
+
+
+def _sign_with_key(private_key, data: bytes) -> str:
+    if _key_algorithm(private_key) == ALG_ED25519:
+        signature = private_key.sign(data)
+    else:
+        signature = private_key.sign(
+            data,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+            hashes.SHA256(),
+        )
+    return base64.b64encode(signature).decode("ascii")
+
+
 def sign_bytes(private_key_path: str, data: bytes) -> str:
     priv = load_private_key(private_key_path)
-    signature = priv.sign(
-        data,
-        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-        hashes.SHA256(),
-    )
-    return base64.b64encode(signature).decode("ascii")
+    return _sign_with_key(priv, data)
 
 
-def verify_signature(public_key_path: str, data: bytes, signature_b64: str) -> bool:
+class Signer:
+    """
+    Firmador para trabajos masivos: verifica las llaves y carga la llave privada
+    una sola vez (un Signer por trabajo o por proceso) y después solo firma.
+    Si no se indican rutas, usa las llaves por defecto del algoritmo elegido.
+    """
+    def __init__(self, private_key_path=None, public_key_path=None, algorithm=ALG_RSA_PSS):
+        default_private, default_public = key_paths(algorithm)
+        private_key_path = private_key_path or default_private
+        public_key_path = public_key_path or default_public
+        ensure_keys(private_key_path, public_key_path, algorithm=algorithm)
+        self.private_key_path = private_key_path
+        self.public_key_path = public_key_path
+        self.pubkey_id = os.path.basename(public_key_path)
+        self._private_key = load_private_key(private_key_path)
+        # El algoritmo real lo define la llave guardada en disco
+        self.algorithm = _key_algorithm(self._private_key)
+
+    def sign(self, payload: bytes) -> str:
+        """Firma los bytes (RSA-PSS/SHA256 o Ed25519) y devuelve la firma en base64"""
+        return _sign_with_key(self._private_key, payload)
+
+
+def verify_signature(public_key_path: str, data: bytes, signature_b64: str, algorithm=None) -> bool:
     pub = load_public_key(public_key_path)
     sig = base64.b64decode(signature_b64)
+    # Si la metadata declara un algoritmo, debe coincidir con el tipo de la llave
+    if algorithm and algorithm != _key_algorithm(pub):
+        return False
     try:
-        pub.verify(
-            sig,
-            data,
-            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-            hashes.SHA256(),
-        )
+        if _key_algorithm(pub) == ALG_ED25519:
+            pub.verify(sig, data)
+        else:
+            pub.verify(
+                sig,
+                data,
+                padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                hashes.SHA256(),
+            )
         return True
     except Exception:
         return False
 
 
+def resolve_public_key_path(metadata: dict, public_key_path=PUBLIC_KEY_PATH) -> str:
+    """
+    Elige la llave pública indicada por pubkey_id si existe junto a public_key_path
+    (p. ej. public_key_ed25519.pem); si no, usa public_key_path.
+    """
+    pubkey_id = os.path.basename(str(metadata.get("pubkey_id") or ""))
+    if pubkey_id:
+        candidate = os.path.join(os.path.dirname(public_key_path), pubkey_id)
+        if os.path.exists(candidate):
+            return candidate
+    return public_key_path
+
+
 # ==============================================
-# GENERAR QR - MEJORADO PARA CARACTERES ESPECIALES
+# FIRMA POR LOTES (ÁRBOL DE MERKLE)
 # ==============================================
-def make_qr_image(text: str, box_size: int = 3) -> Image.Image:
+MERKLE_SCHEME = "merkle-sha256-v1"
+# Prefijo de dominio: la firma de una raíz nunca coincide con la de un payload JSON
+MERKLE_ROOT_DOMAIN = b"RallyCert-Merkle-v1:"
+
+
+def _merkle_leaf(payload_bytes: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + payload_bytes).digest()
+
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_merkle_levels(leaves: list) -> list:
     """
-    box_size reducido → QR más pequeño (~2 cm)
-    Mejorado para manejar caracteres especiales
+    Construye el árbol completo, de las hojas a la raíz.
+    Un nodo sin pareja sube al siguiente nivel sin modificarse.
+    """
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        current = levels[-1]
+        upper = []
+        for i in range(0, len(current), 2):
+            if i + 1 < len(current):
+                upper.append(_merkle_node(current[i], current[i + 1]))
+            else:
+                upper.append(current[i])
+        levels.append(upper)
+    return levels
+
+
+def merkle_proof(levels: list, index: int) -> list:
+    """Prueba de inclusión: lista de 'L<hash>' / 'R<hash>' (hash en base64) desde la hoja a la raíz"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            side = "L" if sibling < index else "R"
+            proof.append(side + base64.b64encode(level[sibling]).decode("ascii"))
+        index //= 2
+    return proof
+
+
+def merkle_root_from_proof(payload_bytes: bytes, proof: list) -> bytes:
+    node = _merkle_leaf(payload_bytes)
+    for step in proof:
+        sibling = base64.b64decode(step[1:])
+        node = _merkle_node(sibling, node) if step[0] == "L" else _merkle_node(node, sibling)
+    return node
+
+
+class MerkleBatch:
     """
+    Firma por lotes sin conservar los payloads: add() guarda solo la hoja (hash) de
+    cada constancia, sign() firma la raíz una sola vez con el Signer y metadata()
+    vuelve a armar la metadata de una constancia con su prueba de inclusión.
+    Todas las constancias del lote comparten issued_at, así que el payload se puede
+    reconstruir a partir de los mismos datos.
+    """
+
+    def __init__(self, signer=None):
+        self.signer = signer or Signer()
+        self.issued_at = datetime.utcnow().isoformat() + "Z"
+        self.signature = None
+        self._leaves = []
+        self._levels = None
+        self._root_b64 = None
+
+    def __len__(self):
+        return len(self._levels[0]) if self._levels is not None else len(self._leaves)
+
+    def payload(self, cert_data: dict) -> dict:
+        return build_payload(cert_data, issued_at=self.issued_at)
+
+    def add(self, cert_data: dict):
+        self._leaves.append(_merkle_leaf(canonicalize_payload(self.payload(cert_data))))
+
+    def sign(self):
+        """Construye el árbol y firma su raíz (una sola firma para todo el lote)"""
+        if not self._leaves:
+            raise ValueError("El lote no tiene constancias")
+        self._levels = build_merkle_levels(self._leaves)
+        self._leaves = None
+        root = self._levels[-1][0]
+        self.signature = self.signer.sign(MERKLE_ROOT_DOMAIN + root)
+        self._root_b64 = base64.b64encode(root).decode("ascii")
+
+    def metadata(self, index: int, cert_data: dict) -> dict:
+        """Metadata de la constancia index; los datos deben ser los mismos que se agregaron"""
+        payload = self.payload(cert_data)
+        if _merkle_leaf(canonicalize_payload(payload)) != self._levels[0][index]:
+            raise ValueError("Los datos de la constancia cambiaron después de firmar el lote")
+        return {
+            "payload": payload,
+            "signature": self.signature,
+            "pubkey_id": self.signer.pubkey_id,
+            "alg": self.signer.algorithm,
+            "encoding": "UTF-8",
+            "batch": {
+                "scheme": MERKLE_SCHEME,
+                "root": self._root_b64,
+                "index": index,
+                "size": len(self),
+                "proof": merkle_proof(self._levels, index),
+            },
+        }
+
+
+def sign_batch(cert_data_list: list, signer=None) -> list:
+    """
+    Firma un lote completo con una sola firma (RSA-PSS o Ed25519, según el signer) sobre la raíz del árbol de Merkle.
+    Cada metadata lleva su payload, la firma de la raíz y su prueba de inclusión.
+
+    Returns:
+        Lista de metadata en el mismo orden que cert_data_list
+    """
+    if not cert_data_list:
+        return []
+    batch = MerkleBatch(signer)
+    for cert_data in cert_data_list:
+        batch.add(cert_data)
+    batch.sign()
+    return [batch.metadata(index, cert_data) for index, cert_data in enumerate(cert_data_list)]
+
+
+def verify_signed_metadata(metadata: dict, public_key_path=PUBLIC_KEY_PATH) -> bool:
+    """
+    Verifica la metadata de una constancia en cualquiera de los dos formatos:
+    firma individual del payload o firma por lotes (raíz de Merkle + prueba de inclusión).
+    Respeta el algoritmo ("alg", RSA-PSS si no existe) y la llave indicada en pubkey_id.
+    """
+    payload = metadata.get("payload")
+    signature_b64 = metadata.get("signature")
+    if not payload or not signature_b64:
+        return False
+
+    algorithm = metadata.get("alg", ALG_RSA_PSS)
+    public_key_path = resolve_public_key_path(metadata, public_key_path)
+    payload_bytes = canonicalize_payload(payload)
+    batch = metadata.get("batch")
+    if not batch:
+        return verify_signature(public_key_path, payload_bytes, signature_b64, algorithm)
+
+    try:
+        if batch.get("scheme") != MERKLE_SCHEME:
+            return False
+        root = base64.b64decode(batch["root"])
+        if merkle_root_from_proof(payload_bytes, batch.get("proof", [])) != root:
+            return False
+    except Exception:
+        return False
+    return verify_signature(public_key_path, MERKLE_ROOT_DOMAIN + root, signature_b64, algorithm)
+
+
+# ==============================================
+# CODIFICACIÓN COMPACTA DEL QR
+# ==============================================
+# Formato "RC1:" + base45(binario). Base45 usa solo el alfabeto alfanumérico del QR,
+# así que el QR se genera en modo alfanumérico y queda de una versión mucho menor.
+#
+# Binario (v1):
+#   u8   algoritmo (0 = RSA-PSS-SHA256, 1 = Ed25519)
+#   u16  longitud de la firma + firma en bytes crudos
+#   u8   número de pasos de la prueba de Merkle (0 = firma individual)
+#        + por paso: u8 lado (0 = L, 1 = R) + 32 bytes del hash
+#   zlib(JSON compacto con datos, fecha, versión, pubkey_id, índice/tamaño del lote)
+# Los valores que coinciden con los predeterminados (emisor, institución) no se incluyen.
+QR_COMPACT_PREFIX = "RC1:"
+_BASE45_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+_QR_ALG_CODES = {ALG_RSA_PSS: 0, ALG_ED25519: 1}
+# Campos estándar de una constancia: en el QR viajan como lista, sin nombres de campo
+_QR_CERT_FIELDS = ("nombre", "evento", "folio", "fecha_emision")
+_QR_DEFAULT_INSTITUTION = "Universidad de Sonora"
+
+
+def base45_encode(data: bytes) -> str:
+    chars = []
+    for i in range(0, len(data) - 1, 2):
+        value = data[i] * 256 + data[i + 1]
+        value, c0 = divmod(value, 45)
+        c2, c1 = divmod(value, 45)
+        chars.extend((_BASE45_ALPHABET[c0], _BASE45_ALPHABET[c1], _BASE45_ALPHABET[c2]))
+    if len(data) % 2:
+        c1, c0 = divmod(data[-1], 45)
+        chars.extend((_BASE45_ALPHABET[c0], _BASE45_ALPHABET[c1]))
+    return "".join(chars)
+
+
+def base45_decode(text: str) -> bytes:
+    values = [_BASE45_ALPHABET.index(c) for c in text]
+    out = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        if len(chunk) == 3:
+            value = chunk[0] + chunk[1] * 45 + chunk[2] * 45 * 45
+            if value > 0xFFFF:
+                raise ValueError("Base45 inválido")
+            out.extend(divmod(value, 256))
+        elif len(chunk) == 2:
+            value = chunk[0] + chunk[1] * 45
+            if value > 0xFF:
+                raise ValueError("Base45 inválido")
+            out.append(value)
+        else:
+            raise ValueError("Base45 inválido")
+    return bytes(out)
+
+
+def encode_qr_payload(metadata: dict) -> str:
+    """
+    Codifica la metadata firmada para el QR en el formato compacto RC1.
+    Si la metadata no tiene la forma esperada, devuelve el JSON completo (formato anterior).
+    """
+    try:
+        payload = metadata["payload"]
+        data = payload["data"]
+        compact = {
+            "t": payload["issued_at"],
+            "v": payload["version"],
+            "k": metadata["pubkey_id"],
+        }
+        if set(data) == set(_QR_CERT_FIELDS) | {"institucion"} and all(isinstance(v, str) for v in data.values()):
+            compact["D"] = [data[field] for field in _QR_CERT_FIELDS]
+            if data["institucion"] != _QR_DEFAULT_INSTITUTION:
+                compact["D"].append(data["institucion"])
+        else:
+            compact["d"] = data
+        if payload["issuer"] != ISSUER_STRING:
+            compact["i"] = payload["issuer"]
+        if set(payload) != {"data", "issued_at", "issuer", "version"} or metadata.get("encoding", "UTF-8") != "UTF-8":
+            raise ValueError("metadata no compactable")
+
+        signature = base64.b64decode(metadata["signature"])
+        alg_code = _QR_ALG_CODES[metadata.get("alg", ALG_RSA_PSS)]
+        binary = bytearray([alg_code])
+        binary += len(signature).to_bytes(2, "big") + signature
+
+        batch = metadata.get("batch")
+        if batch:
+            if batch.get("scheme") != MERKLE_SCHEME:
+                raise ValueError("esquema de lote no soportado")
+            compact["n"] = batch["index"]
+            compact["s"] = batch["size"]
+            proof = batch["proof"]
+            binary.append(len(proof))
+            for step in proof:
+                binary.append(0 if step[0] == "L" else 1)
+                binary += base64.b64decode(step[1:])
+        else:
+            binary.append(0)
+
+        compact_json = json.dumps(compact, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+        binary += zlib.compress(compact_json.encode("utf-8"), 9)
+        return QR_COMPACT_PREFIX + base45_encode(bytes(binary))
+    except Exception:
+        return json.dumps(metadata, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+
+
+def decode_qr_payload(text: str) -> dict:
+    """Reconstruye la metadata firmada a partir del texto leído del QR (formato RC1 o JSON)"""
+    if not text.startswith(QR_COMPACT_PREFIX):
+        return json.loads(text)
+
+    binary = base45_decode(text[len(QR_COMPACT_PREFIX):])
+    algorithm = {code: alg for alg, code in _QR_ALG_CODES.items()}[binary[0]]
+    sig_len = int.from_bytes(binary[1:3], "big")
+    pos = 3 + sig_len
+    signature = binary[3:pos]
+
+    proof = []
+    for _ in range(binary[pos]):
+        side = "L" if binary[pos + 1] == 0 else "R"
+        proof.append(side + base64.b64encode(binary[pos + 2:pos + 34]).decode("ascii"))
+        pos += 33
+    compact = json.loads(zlib.decompress(binary[pos + 1:]).decode("utf-8"))
+
+    if "D" in compact:
+        values = compact["D"]
+        data = dict(zip(_QR_CERT_FIELDS, values))
+        data["institucion"] = values[len(_QR_CERT_FIELDS)] if len(values) > len(_QR_CERT_FIELDS) else _QR_DEFAULT_INSTITUTION
+    else:
+        data = compact["d"]
+    payload = {
+        "data": data,
+        "issued_at": compact["t"],
+        "issuer": compact.get("i", ISSUER_STRING),
+        "version": compact["v"],
+    }
+    metadata = {
+        "payload": payload,
+        "signature": base64.b64encode(signature).decode("ascii"),
+        "pubkey_id": compact["k"],
+        "alg": algorithm,
+        "encoding": "UTF-8",
+    }
+    if "n" in compact:
+        # La raíz no viaja en el QR: se recalcula con la prueba y la firma la valida
+        root = merkle_root_from_proof(canonicalize_payload(payload), proof)
+        metadata["batch"] = {
+            "scheme": MERKLE_SCHEME,
+            "root": base64.b64encode(root).decode("ascii"),
+            "index": compact["n"],
+            "size": compact["s"],
+            "proof": proof,
+        }
+    return metadata
+
+
+# ==============================================
+# GENERAR QR - MEJORADO PARA CARACTERES ESPECIALES
+# ==============================================
+def _build_qr(text: str, box_size: int = 3) -> qrcode.QRCode:
+    """Codifica el texto en un QRCode ya calculado (compartido por la imagen y el vector)"""
     qr = qrcode.QRCode(
-        version=1,
+        version=None,  # La versión se calcula directamente según el tamaño del contenido
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=box_size,
         border=1,
@@ -127,19 +507,74 @@ def make_qr_image(text: str, box_size: int = 3) -> Image.Image:
     
     qr.add_data(text)
     qr.make(fit=True)
-    
+    return qr
+
+
+def make_qr_image(text: str, box_size: int = 3) -> Image.Image:
+    """
+    box_size reducido → QR más pequeño (~2 cm)
+    Mejorado para manejar caracteres especiales.
+    Se usa para Word/PowerPoint; en PDF el QR se dibuja como vector (ver make_qr_matrix).
+    """
+    qr = _build_qr(text, box_size)
     img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
     return img
 
 
+def make_qr_matrix(text: str) -> list:
+    """Matriz de módulos del QR (filas de bool, True = negro), incluyendo el borde"""
+    return _build_qr(text).get_matrix()
+
+
+def _make_qr_vector_document(qr_matrix: list):
+    """
+    Dibuja la matriz del QR como rectángulos vectoriales en un PDF de una página
+    (un punto por módulo), listo para colocarse con show_pdf_page como Form XObject.
+    Los módulos negros contiguos de cada fila se unen en un solo rectángulo.
+    """
+    size = len(qr_matrix)
+    # Fondo blanco: conserva la zona silenciosa aunque la plantilla tenga color
+    ops = [f"1 g 0 0 {size} {size} re f", "0 g"]
+    for row_num, row in enumerate(qr_matrix):
+        y = size - row_num - 1  # El origen de PDF está abajo a la izquierda
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            ops.append(f"{start} {y} {x - start} 1 re")
+    ops.append("f")
+
+    qr_doc = fitz.open()
+    page = qr_doc.new_page(width=size, height=size)
+    contents_xref = qr_doc.get_new_xref()
+    qr_doc.update_object(contents_xref, "<<>>")
+    # Sin comprimir aquí: el guardado final del documento ya aplica deflate una sola vez
+    qr_doc.update_stream(contents_xref, "\n".join(ops).encode("ascii"), compress=False)
+    qr_doc.xref_set_key(page.xref, "Contents", f"{contents_xref} 0 R")
+    return qr_doc
+
+
 # ==============================================
 # BUSCAR POSICIÓN EXACTA DEL QR EN PDF
 # ==============================================
-def find_qr_position_in_pdf(pdf_path):
+def find_qr_position_in_pdf(pdf_path, placeholder_index=None):
     """
     Busca el marcador {{QR}} en el PDF usando PyMuPDF y devuelve su posición exacta.
+    Si se recibe el índice de placeholders de la plantilla (PlaceholderIndex),
+    la posición se toma de ahí sin volver a abrir el PDF.
     Retorna: dict con page, x, y o None si no se encuentra.
     """
+    if placeholder_index is not None:
+        locations = placeholder_index.locate("{{QR}}")
+        if not locations:
+            return None
+        page_num, rect, _ = locations[0]
+        return {"page": page_num, "x": rect.x0, "y": rect.y0}
+
     try:
         doc = fitz.open(pdf_path)
         
@@ -202,126 +637,159 @@ def embed_qr_in_docx(input_docx: str, output_docx: str, qr_img: Image.Image, met
     doc.save(output_docx)
 
 
-def embed_qr_in_pdf(input_pdf: str, output_pdf: str, qr_img: Image.Image, metadata: dict, validation_text=None):
+# Colores de los elementos de seguridad (equivalentes a los de ReportLab usados antes)
+WATERMARK_COLOR = (0.827, 0.827, 0.827)  # lightgrey
+INFO_TEXT_COLOR = (0.663, 0.663, 0.663)  # darkgrey
+LEGEND_COLOR = (0.502, 0.502, 0.502)     # grey
+QR_SIZE = 60  # Tamaño pequeño (~2.1 cm)
+
+
+def _set_signature_metadata(doc, metadata: dict, validation_text: str):
+    """Guarda la firma en el diccionario Info del PDF (legible con PyPDF2 y PyMuPDF)"""
+    # Método 1: Metadatos estándar
+    doc.set_metadata({
+        "title": "Constancia Universitaria",
+        "author": "Universidad de Sonora",
+        "subject": "Constancia de Participación",
+        "creator": "Sistema de Constancias Rally STEM",
+        "producer": "RallyCert v1.0",
+    })
+
+    metadata_json = json.dumps(metadata, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+    info_xref = int(doc.xref_get_key(-1, "Info")[1].split()[0])
+    custom_metadata = {
+        "Signature": metadata_json,
+        "ValidationText": validation_text,  # Guardar también la leyenda en metadatos
+        # Método 2: Copia codificada; hace más difícil la eliminación de metadatos
+        "RallyCert_Signature": base64.b64encode(metadata_json.encode("utf-8")).decode(),
+        "RallyCert_ValidationText": validation_text,
+    }
+    for key, value in custom_metadata.items():
+        doc.xref_set_key(info_xref, key, fitz.get_pdf_str(value))
+
+
+def stamp_pdf_document(doc, qr_matrix: list, metadata: dict, validation_text=None, qr_position=None):
     """
-    Inserta un QR exactamente donde está el marcador {{QR}} en el PDF,
-    con elementos de seguridad que detectan modificaciones.
+    Estampa QR, marca de agua y leyendas directamente en un documento PyMuPDF abierto,
+    sin guardarlo. Así la constancia se escribe a disco una sola vez.
+
+    Args:
+        doc: fitz.Document a modificar
+        qr_matrix: Matriz de módulos del QR (ver make_qr_matrix); se dibuja como vector
+        qr_position: dict con page, x, y (ver find_qr_position_in_pdf) o None
     """
     # Usar texto personalizado o el predeterminado
     if validation_text is None:
         validation_text = VALIDATION_TEXT
-    
-    # Buscar posición exacta del QR
-    qr_position = find_qr_position_in_pdf(input_pdf)
-    
-    # Leer el PDF original
-    with open(input_pdf, "rb") as f:
-        base_bytes = f.read()
-    base_stream = BytesIO(base_bytes)
-    base_reader = PdfReader(base_stream)
-    
-    writer = PdfWriter()
-    
-    for page_num, page in enumerate(base_reader.pages):
-        w, h = float(page.mediabox.width), float(page.mediabox.height)
-        
-        # Crear overlay
-        packet = BytesIO()
-        c = canvas.Canvas(packet, pagesize=(w, h))
-        
-        # 1. MARCA DE AGUA DE SEGURIDAD DISCRETA
-        # Esta marca de agua es visible pero no intrusiva, y sirve para detectar modificaciones
-        c.saveState()
-        c.translate(w / 2, h / 2)
-        c.rotate(45)
-        c.setFont("Helvetica", 36)  # Tamaño moderado
-        c.setFillColor(colors.lightgrey, alpha=0.08)  # Muy transparente
-        watermark_text = "VÁLIDO - UNIVERSIDAD DE SONORA"
-        c.drawCentredString(0, 0, watermark_text)
-        
-        # Agregar texto adicional en otras posiciones para mayor seguridad
-        c.rotate(-90)
-        c.drawCentredString(0, -200, "CONSTANCIA AUTENTICADA")
-        c.restoreState()
-        
-        # 2. Insertar QR
-        qr_reader = ImageReader(qr_img)
-        qr_size = 60  # Tamaño pequeño (~2.1 cm)
-        
+
+    # El QR vectorial se construye una vez; PyMuPDF reutiliza su contenido en todas las páginas
+    qr_doc = _make_qr_vector_document(qr_matrix)
+
+    try:
+        _stamp_pages(doc, qr_doc, validation_text, qr_position)
+    finally:
+        qr_doc.close()
+
+    # Añadir metadatos de firma de manera más robusta
+    if metadata:
+        _set_signature_metadata(doc, metadata, validation_text)
+
+
+def _stamp_pages(doc, qr_doc, validation_text: str, qr_position=None):
+    """Coloca la capa estática (marca de agua y leyendas) y el QR en cada página del documento"""
+    for page_num, page in enumerate(doc):
+        w, h = page.rect.width, page.rect.height
+
+        # Coordenadas de PyMuPDF: origen arriba a la izquierda
         if qr_position and page_num == qr_position["page"]:
             # Posición exacta del marcador
-            qr_x = qr_position["x"]
-            qr_y = h - qr_position["y"] - qr_size  # Ajuste coordenada Y (PDF coordinate system)
+            qr_rect = fitz.Rect(qr_position["x"], qr_position["y"],
+                                qr_position["x"] + QR_SIZE, qr_position["y"] + QR_SIZE)
         else:
             # Posición por defecto (esquina inferior derecha)
-            qr_x = w - qr_size - 30
-            qr_y = 30
-        
-        c.drawImage(qr_reader, qr_x, qr_y, width=qr_size, height=qr_size, mask='auto')
-        
-        # 3. TEXTO DE VALIDACIÓN PERSONALIZABLE
-        c.setFont("Helvetica", 7)
-        c.setFillColor(colors.darkgrey)
-        
-        # Texto informativo
-        info_text = "Constancia verificable mediante código QR - Universidad de Sonora"
-        
-        # Posicionar texto cerca del QR
-        text_x = qr_x
-        text_y = qr_y - 12  # Justo debajo del QR
-        
-        c.drawString(text_x, text_y, info_text)
-        
-        # 4. LEYENDA DE VALIDACIÓN (texto personalizado)
-        c.setFont("Helvetica", 6)
-        c.setFillColor(colors.grey)
-        # Posicionar en la esquina inferior izquierda
-        c.drawString(30, 20, validation_text)
-        
-        c.save()
-        packet.seek(0)
-        overlay_reader = PdfReader(packet)
-        overlay_page = overlay_reader.pages[0]
-        
-        # Fusionar overlay con página original
-        page.merge_page(overlay_page)
-        writer.add_page(page)
-        
-        packet.close()
+            qr_rect = fitz.Rect(w - QR_SIZE - 30, h - 30 - QR_SIZE, w - 30, h - 30)
+
+        # 1. Marca de agua y leyendas: iguales en todas las constancias del trabajo
+        page.show_pdf_page(page.rect, get_static_overlay(w, h, validation_text, qr_rect), 0)
+
+        # 2. QR: lo único que cambia entre constancias
+        page.show_pdf_page(qr_rect, qr_doc, 0)
 
-    # Añadir metadatos de firma de manera más robusta
-    if metadata:
-        # Método 1: Metadatos estándar
-        writer.add_metadata({
-            "/Title": "Constancia Universitaria",
-            "/Author": "Universidad de Sonora",
-            "/Subject": "Constancia de Participación",
-            "/Creator": "Sistema de Constancias Rally STEM",
-            "/Producer": "RallyCert v1.0",
-            "/Signature": json.dumps(metadata, separators=(",", ":"), sort_keys=True, ensure_ascii=False),
-            "/ValidationText": validation_text  # Guardar también la leyenda en metadatos
-        })
-        
-        # Método 2: Metadatos adicionales como campos XMP
-        try:
-            # Esto hace más difícil la eliminación de metadatos
-            from PyPDF2 import PdfFileWriter
-            if hasattr(writer, 'add_metadata'):
-                custom_metadata = {
-                    'RallyCert_Signature': base64.b64encode(
-                        json.dumps(metadata, separators=(",", ":"), sort_keys=True, ensure_ascii=False).encode('utf-8')
-                    ).decode(),
-                    'RallyCert_ValidationText': validation_text
-                }
-                writer.add_metadata(custom_metadata)
-        except Exception:
-            pass
 
-    # Guardar PDF final
+# Capas estáticas ya dibujadas: (ancho, alto, leyenda, rectángulo del QR) -> fitz.Document de una página
+_overlay_cache = {}
+_OVERLAY_CACHE_LIMIT = 32
+
+
+def get_static_overlay(width: float, height: float, validation_text: str, qr_rect):
+    """
+    Dibuja una sola vez por tamaño de página y leyenda la marca de agua y los textos
+    de validación. Cada constancia solo la coloca como Form XObject con show_pdf_page,
+    y dentro de un mismo documento PyMuPDF reutiliza el mismo objeto en todas las páginas.
+    """
+    key = (width, height, validation_text, tuple(qr_rect))
+    overlay = _overlay_cache.get(key)
+    if overlay is not None:
+        return overlay
+
+    overlay = fitz.open()
+    page = overlay.new_page(width=width, height=height)
+    center = fitz.Point(width / 2, height / 2)
+
+    # 1. MARCA DE AGUA DE SEGURIDAD DISCRETA
+    # Esta marca de agua es visible pero no intrusiva, y sirve para detectar modificaciones
+    watermark_text = "VÁLIDO - UNIVERSIDAD DE SONORA"
+    tw = fitz.get_text_length(watermark_text, fontname="helv", fontsize=36)
+    page.insert_text((center.x - tw / 2, center.y), watermark_text, fontname="helv", fontsize=36,
+                     color=WATERMARK_COLOR, fill_opacity=0.08, morph=(center, fitz.Matrix(45)))
+
+    # Agregar texto adicional en otras posiciones para mayor seguridad
+    extra_text = "CONSTANCIA AUTENTICADA"
+    tw = fitz.get_text_length(extra_text, fontname="helv", fontsize=36)
+    page.insert_text((center.x - tw / 2, center.y + 200), extra_text, fontname="helv", fontsize=36,
+                     color=WATERMARK_COLOR, fill_opacity=0.08, morph=(center, fitz.Matrix(-45)))
+
+    # 2. TEXTO DE VALIDACIÓN PERSONALIZABLE
+    # Texto informativo, justo debajo del QR
+    info_text = "Constancia verificable mediante código QR - Universidad de Sonora"
+    page.insert_text((qr_rect.x0, qr_rect.y1 + 12), info_text, fontname="helv", fontsize=7,
+                     color=INFO_TEXT_COLOR)
+
+    # 3. LEYENDA DE VALIDACIÓN (texto personalizado) en la esquina inferior izquierda
+    page.insert_text((30, height - 20), validation_text, fontname="helv", fontsize=6, color=LEGEND_COLOR)
+
+    if len(_overlay_cache) >= _OVERLAY_CACHE_LIMIT:
+        clear_overlay_cache()
+    _overlay_cache[key] = overlay
+    return overlay
+
+
+def clear_overlay_cache():
+    """Libera las capas estáticas guardadas en memoria"""
+    for overlay in _overlay_cache.values():
+        overlay.close()
+    _overlay_cache.clear()
+
+
+def embed_qr_in_pdf(input_pdf: str, output_pdf: str, qr_matrix: list, metadata: dict, validation_text=None,
+                    placeholder_index=None):
+    """
+    Inserta un QR exactamente donde está el marcador {{QR}} en el PDF,
+    con elementos de seguridad que detectan modificaciones.
+    """
+    # Buscar posición exacta del QR
+    qr_position = find_qr_position_in_pdf(input_pdf, placeholder_index)
+
+    doc = fitz.open(input_pdf)
+    try:
+        stamp_pdf_document(doc, qr_matrix, metadata, validation_text, qr_position)
+        pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+    # Guardar PDF final (puede ser el mismo archivo de entrada)
     with open(output_pdf, "wb") as f_out:
-        writer.write(f_out)
-        
-    base_stream.close()
+        f_out.write(pdf_bytes)
 
 
 def embed_qr_in_pptx(input_pptx: str, output_pptx: str, qr_img: Image.Image, metadata: dict,
@@ -386,8 +854,7 @@ def check_document_integrity(pdf_path, public_key_path=PUBLIC_KEY_PATH):
             if not payload or not signature_b64:
                 return False, "Datos de firma incompletos", None
             
-            payload_bytes = canonicalize_payload(payload)
-            is_valid = verify_signature(public_key_path, payload_bytes, signature_b64)
+            is_valid = verify_signed_metadata(signature_data, public_key_path)
             
             if is_valid:
                 return True, "Documento válido y sin modificaciones", original_validation_text
@@ -401,49 +868,96 @@ def check_document_integrity(pdf_path, public_key_path=PUBLIC_KEY_PATH):
 # ==============================================
 # FIRMA PRINCIPAL (MODIFICADA PARA ACEPTAR TEXTO PERSONALIZADO)
 # ==============================================
-def build_payload(cert_data: dict, issuer=ISSUER_STRING):
+def build_payload(cert_data: dict, issuer=ISSUER_STRING, issued_at=None):
     """Construye el payload con soporte para caracteres especiales"""
     return {
         "data": cert_data, 
-        "issued_at": datetime.utcnow().isoformat() + "Z", 
+        "issued_at": issued_at or datetime.utcnow().isoformat() + "Z", 
         "issuer": issuer,
         "version": "2.0"
     }
 
 
+def _sign_certificate(cert_data: dict, private_key_path=PRIVATE_KEY_PATH, public_key_path=PUBLIC_KEY_PATH,
+                      signer=None, metadata=None):
+    """
+    Firma los datos de la constancia y genera el texto de su QR. Retorna (metadata, qr_text).
+    Con un Signer ya cargado no se vuelve a leer la llave del disco; con metadata
+    ya firmada (ver sign_batch) solo se genera el QR.
+    """
+    if metadata is None:
+        if signer is None:
+            signer = Signer(private_key_path, public_key_path)
+        payload = build_payload(cert_data)
+        payload_bytes = canonicalize_payload(payload)
+        signature_b64 = signer.sign(payload_bytes)
+
+        metadata = {
+            "payload": payload,
+            "signature": signature_b64,
+            "pubkey_id": signer.pubkey_id,
+            "alg": signer.algorithm,
+            "encoding": "UTF-8"
+        }
+
+    # El QR lleva la metadata en formato compacto (ver encode_qr_payload)
+    return metadata, encode_qr_payload(metadata)
+
+
+def sign_pdf_document(doc, cert_data: dict,
+                      private_key_path=PRIVATE_KEY_PATH, public_key_path=PUBLIC_KEY_PATH,
+                      validation_text=None, placeholder_index=None, signer=None, metadata=None):
+    """
+    Firma y estampa el QR en un documento PyMuPDF que aún está en memoria.
+    El llamador guarda el documento una sola vez después; no se relee nada del disco.
+
+    Args:
+        doc: fitz.Document ya procesado (ver PdfProcessor.process)
+        placeholder_index: Índice de placeholders de la plantilla PDF de origen,
+                        para ubicar {{QR}} sin buscarlo en el documento.
+        signer: Signer reutilizable del trabajo; si es None se carga la llave.
+        metadata: Metadata ya firmada por lotes (sign_batch); evita firmar de nuevo.
+    """
+    metadata, qr_text = _sign_certificate(cert_data, private_key_path, public_key_path, signer, metadata)
+
+    if placeholder_index is not None:
+        qr_position = find_qr_position_in_pdf(None, placeholder_index)
+    else:
+        qr_position = None
+        for page in doc:
+            text_instances = page.search_for("{{QR}}")
+            if text_instances:
+                rect = text_instances[0]
+                qr_position = {"page": page.number, "x": rect.x0, "y": rect.y0}
+                break
+
+    stamp_pdf_document(doc, make_qr_matrix(qr_text), metadata, validation_text, qr_position)
+    return metadata
+
+
 def sign_and_embed(input_path: str, output_path: str, cert_data: dict,
                    private_key_path=PRIVATE_KEY_PATH, public_key_path=PUBLIC_KEY_PATH,
-                   validation_text=None):
+                   validation_text=None, placeholder_index=None, signer=None, metadata=None):
     """
     Firma y embebe el QR en el documento, con texto de validación personalizable.
     
     Args:
         validation_text: Texto personalizado para la leyenda de validación.
                         Si es None, usa el texto por defecto.
+        placeholder_index: Índice de placeholders de la plantilla PDF de origen;
+                        evita buscar {{QR}} de nuevo en el documento generado.
+        signer: Signer reutilizable del trabajo; si es None se carga la llave.
+        metadata: Metadata ya firmada por lotes (sign_batch); evita firmar de nuevo.
     """
-    ensure_keys(private_key_path, public_key_path)
-    payload = build_payload(cert_data)
-    payload_bytes = canonicalize_payload(payload)
-    signature_b64 = sign_bytes(private_key_path, payload_bytes)
-
-    metadata = {
-        "payload": payload,
-        "signature": signature_b64,
-        "pubkey_id": os.path.basename(public_key_path),
-        "encoding": "UTF-8"
-    }
-
-    # Convertir metadata a JSON con soporte para caracteres especiales
-    metadata_json = json.dumps(metadata, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
-    qr_img = make_qr_image(metadata_json)
+    metadata, qr_text = _sign_certificate(cert_data, private_key_path, public_key_path, signer, metadata)
 
     ext = os.path.splitext(input_path)[1].lower()
     if ext == ".pdf":
-        embed_qr_in_pdf(input_path, output_path, qr_img, metadata, validation_text)
+        embed_qr_in_pdf(input_path, output_path, make_qr_matrix(qr_text), metadata, validation_text, placeholder_index)
     elif ext == ".docx":
-        embed_qr_in_docx(input_path, output_path, qr_img, metadata)
+        embed_qr_in_docx(input_path, output_path, make_qr_image(qr_text), metadata)
     elif ext in (".pptx", ".ppt"):
-        embed_qr_in_pptx(input_path, output_path, qr_img, metadata)
+        embed_qr_in_pptx(input_path, output_path, make_qr_image(qr_text), metadata)
     else:
         with open(input_path, "rb") as r, open(output_path, "wb") as w:
             w.write(r.read())
@@ -0,0 +1,17 @@
+# conftest.py
+# Los módulos de RallyCert están en la raíz del repositorio (sin paquete)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from signature import Signer, ALG_RSA_PSS, ALG_ED25519
+
+
+@pytest.fixture(scope="session", params=[ALG_RSA_PSS, ALG_ED25519])
+def signer(request, tmp_path_factory):
+    """Signer con llaves nuevas en una carpeta temporal (nunca las de keys/)"""
+    keys = tmp_path_factory.mktemp("keys")
+    return Signer(str(keys / "private_key.pem"), str(keys / "public_key.pem"), algorithm=request.param)
@@ -0,0 +1,185 @@
+# smtp_server.py
+"""
+Servidor SMTP de prueba para los motores de envío: STARTTLS con un certificado propio,
+AUTH PLAIN/LOGIN, latencia por respuesta, límite de conexiones simultáneas y cierre de
+la conexión tras K mensajes (como hacen los proveedores reales).
+"""
+
+import base64
+import datetime
+import ipaddress
+import socketserver
+import ssl
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+def make_certificate(directory):
+    """Certificado autofirmado para localhost; devuelve (certificado, llave)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"),
+            x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = str(directory / "smtp.crt")
+    key_path = str(directory / "smtp.key")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            if server.active >= server.max_connections:
+                self.wfile.write(b"421 4.7.0 Too many connections\r\n")
+                server.refused += 1
+                return
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            self.session()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def session(self):
+        server = self.server
+        sock = self.connection
+        reader, writer = sock.makefile("rb"), sock.makefile("wb")
+
+        def reply(line):
+            time.sleep(server.latency)
+            writer.write(line.encode() + b"\r\n")
+            writer.flush()
+
+        reply("220 localhost ESMTP prueba")
+        tls = False
+        sent = 0
+        envelope = None
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                features = ["AUTH PLAIN LOGIN"] if tls else ["STARTTLS"]
+                if server.smtputf8:
+                    features.append("SMTPUTF8")
+                reply("\r\n".join(f"250-{f}" for f in ["localhost"] + features[:-1]) + f"\r\n250 {features[-1]}")
+            elif verb == "STARTTLS":
+                reply("220 Listo para TLS")
+                sock = server.tls.wrap_socket(sock, server_side=True)
+                reader, writer = sock.makefile("rb"), sock.makefile("wb")
+                tls = True
+            elif verb == "AUTH":
+                parts = command.split(" ")
+                if parts[1].upper() == "PLAIN":
+                    _, user, password = base64.b64decode(parts[2]).decode().split("\0")
+                else:
+                    reply("334 VXNlcm5hbWU6")
+                    user = base64.b64decode(reader.readline()).decode()
+                    reply("334 UGFzc3dvcmQ6")
+                    password = base64.b64decode(reader.readline()).decode()
+                if (user, password) == server.credentials:
+                    reply("235 2.7.0 Autenticado")
+                else:
+                    reply("535 5.7.8 Credenciales incorrectas")
+            elif verb == "MAIL":
+                envelope = {"from": command[10:].split(">")[0].lstrip("<"), "to": []}
+                reply("250 ok")
+            elif verb == "RCPT":
+                envelope["to"].append(command[8:].split(">")[0].lstrip("<"))
+                reply("250 ok")
+            elif verb == "DATA":
+                reply("354 Termine con <CRLF>.<CRLF>")
+                data = []
+                for data_line in iter(reader.readline, b""):
+                    if data_line == b".\r\n":
+                        break
+                    data.append(data_line)
+                envelope["data"] = b"".join(data)
+                with server.lock:
+                    server.messages.append(envelope)
+                sent += 1
+                reply("250 2.0.0 En cola")
+                if server.drop_after and sent >= server.drop_after:
+                    sock.close()  # El servidor cierra la conexión tras K mensajes
+                    return
+            elif verb in ("RSET", "NOOP"):
+                envelope = None
+                reply("250 ok")
+            elif verb == "QUIT":
+                reply("221 Adiós")
+                return
+            else:
+                reply("502 Comando no reconocido")
+
+
+class SmtpTestServer(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP en 127.0.0.1 (puerto libre) atendido en un hilo propio.
+
+    - latency: segundos antes de cada respuesta
+    - max_connections: conexiones simultáneas admitidas; las demás reciben 421
+    - drop_after: mensajes por conexión antes de cerrarla (0 = nunca)
+    - smtputf8: anunciar SMTPUTF8 (direcciones con acentos)
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, cert_path, key_path, credentials=("org@example.mx", "secreto"),
+                 latency=0.0, max_connections=100, drop_after=0, smtputf8=False):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.tls.load_cert_chain(cert_path, key_path)
+        self.credentials = credentials
+        self.latency = latency
+        self.max_connections = max_connections
+        self.drop_after = drop_after
+        self.smtputf8 = smtputf8
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.active = 0
+        self.peak = 0
+        self.refused = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,99 @@
+# test_combined_pdf.py
+"""PDF combinado: recursos repetidos guardados una vez y guardado incremental por partes"""
+
+import fitz
+import pytest
+
+from combined_pdf import CombinedPdfWriter
+
+
+@pytest.fixture(scope="module")
+def logo_png():
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    for x in range(64):
+        for y in range(64):
+            pixmap.set_pixel(x, y, ((x * 4) % 256, (y * 4) % 256, 128))
+    return pixmap.tobytes("png")
+
+
+def certificate(logo_png, i):
+    """Constancia de una página: el mismo logo y fuente en todas, el nombre cambia"""
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=200)
+    page.insert_image(fitz.Rect(10, 10, 74, 74), stream=logo_png)
+    page.insert_text((90, 50), f"Persona {i}", fontname="helv", fontsize=14)
+    return doc
+
+
+def test_repeated_resources_are_stored_once(tmp_path, logo_png):
+    path = tmp_path / "combinado.pdf"
+    writer = CombinedPdfWriter(str(path), chunk_size=3)
+    for i in range(7):
+        with certificate(logo_png, i) as doc:
+            writer.add_document(doc)
+    writer.finish()
+
+    # Sin deduplicar, cada constancia trae su propia copia del logo
+    naive = fitz.open()
+    for i in range(7):
+        with certificate(logo_png, i) as doc:
+            naive.insert_pdf(doc)
+    naive_size = len(naive.tobytes(garbage=1, deflate=True))
+
+    assert writer.duplicates_removed >= 6
+    with fitz.open(str(path)) as result:
+        assert result.page_count == 7
+        assert [result[i].get_text().strip() for i in range(7)] == [f"Persona {i}" for i in range(7)]
+        images = {result[i].get_images()[0][0] for i in range(7)}
+        assert len(images) == 1  # Todas las páginas usan el mismo objeto de imagen
+    assert path.stat().st_size < naive_size
+
+
+def test_chunks_are_saved_incrementally(tmp_path, logo_png):
+    path = tmp_path / "combinado.pdf"
+    writer = CombinedPdfWriter(str(path), chunk_size=2)
+    with certificate(logo_png, 0) as doc:
+        writer.add_document(doc)
+    assert not path.exists()
+
+    with certificate(logo_png, 1) as doc:
+        writer.add_document(doc)
+    # Al llenar una parte se escribe al archivo y se libera de memoria
+    assert path.exists() and writer.saved and writer.pending == 0
+    first_part = path.read_bytes()
+
+    for i in range(2, 5):
+        with certificate(logo_png, i) as doc:
+            writer.add_bytes(doc.tobytes())
+    writer.finish()
+
+    data = path.read_bytes()
+    assert data.startswith(first_part)  # Las partes se agregan al final del archivo
+    assert data.count(b"%%EOF") == 3     # Dos partes completas y el guardado final
+    with fitz.open(str(path)) as result:
+        assert result.page_count == 5
+        assert result[4].get_text().strip() == "Persona 4"
+    assert writer.count == 5
+
+
+def test_finish_calls_before_save_on_the_open_document(tmp_path, logo_png):
+    path = tmp_path / "combinado.pdf"
+    writer = CombinedPdfWriter(str(path), chunk_size=2)
+    for i in range(3):
+        with certificate(logo_png, i) as doc:
+            writer.add_document(doc)
+    writer.finish(lambda doc: doc.set_metadata({"title": "Constancias"}))
+    with fitz.open(str(path)) as result:
+        assert result.metadata["title"] == "Constancias"
+        assert result.page_count == 3
+
+
+def test_abort_removes_saved_parts(tmp_path, logo_png):
+    path = tmp_path / "combinado.pdf"
+    writer = CombinedPdfWriter(str(path), chunk_size=1)
+    with certificate(logo_png, 0) as doc:
+        writer.add_document(doc)
+    assert path.exists()
+    writer.abort()
+    assert not path.exists()
+    assert writer.doc.is_closed
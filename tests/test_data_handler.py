@@ -0,0 +1,114 @@
+# test_data_handler.py
+"""Lectura de listas: mismos textos que la versión original basada en pandas"""
+
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import data_handler
+from data_handler import get_excel_data, open_record_source, read_header, normalize_value, DeferredRecords
+
+
+def baseline_excel_data(file_path):
+    """get_excel_data original (pandas): se usa como referencia de los textos impresos"""
+    df = pd.read_excel(file_path)
+    df.fillna('', inplace=True)
+    for col in df.columns:
+        df[col] = df[col].astype(str)
+    return df.columns.tolist(), df.to_dict('records')
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    data_handler.clear_cache()
+    yield
+    data_handler.clear_cache()
+
+
+@pytest.fixture
+def lista_xlsx(tmp_path):
+    # Columnas sin vacíos para fechas y enteros (con vacíos pandas las convertía a
+    # texto "5.0" / "2024-03-01 00:00:00", un comportamiento que no se conserva).
+    # Tampoco se conserva "10.0" para un entero en una columna con decimales: se lee "10"
+    path = tmp_path / "lista.xlsx"
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Nombre", "Fecha", "Hora", "Folio", "Promedio", "Notas"])
+    ws.append(["Ana", datetime(2024, 3, 1), datetime(2024, 3, 1, 14, 30), 1, 8.5, "ok"])
+    ws.append(["Luis", datetime(2024, 3, 2), datetime(2024, 3, 2, 9, 5), 20, 9.25, None])
+    ws.append(["Eva", datetime(2024, 12, 31), datetime(2024, 12, 31, 0, 0, 1), 300, 9.75, ""])
+    wb.save(path)
+    return str(path)
+
+
+def test_get_excel_data_matches_baseline(lista_xlsx):
+    base_columns, base_records = baseline_excel_data(lista_xlsx)
+    columns, table = get_excel_data(lista_xlsx)
+    assert columns == base_columns
+    assert [row.to_dict() for row in table] == base_records
+
+
+def test_streaming_and_header_match_baseline(lista_xlsx):
+    _, base_records = baseline_excel_data(lista_xlsx)
+    assert [dict(row) for row in open_record_source(lista_xlsx)] == base_records
+    _, sample = read_header(lista_xlsx, sample_rows=2)
+    assert sample == base_records[:2]
+
+
+def test_header_keeps_trailing_unnamed_column(tmp_path):
+    # Última columna con datos pero sin encabezado, escrita por pandas (con <dimension>)
+    path = str(tmp_path / "sin_encabezado.xlsx")
+    pd.DataFrame([["Ana", "a@x.mx", "1", "ok", "extra"]],
+                 columns=["Nombre", "Correo", "Folio", "Notas", ""]).to_excel(path, index=False)
+    columns, sample = read_header(path, sample_rows=1)
+    assert columns == get_excel_data(path)[0] == baseline_excel_data(path)[0]
+    assert len(columns) == 5
+    assert sample[0][columns[-1]] == "extra"
+
+
+def test_header_and_records_share_csv_encoding(tmp_path):
+    # Encabezado en UTF-8 y una fila en Windows-1252 más allá de la muestra: las columnas
+    # de read_header deben existir en los registros (antes "Año" contra "AÃ±o")
+    path = tmp_path / "mixta.csv"
+    head = ["Nombre;Año"] + [f"Persona {i};2024" for i in range(5000)]
+    path.write_bytes("\r\n".join(head).encode("utf-8") + "\r\nJosé Peña;2025".encode("cp1252"))
+    columns, _ = read_header(str(path))
+    records = DeferredRecords(str(path), columns).select(columns)
+    assert [row[columns[1]] for row in records][-1] == "2025"
+
+
+@pytest.mark.parametrize("value, text", [
+    (datetime(2024, 3, 1), "2024-03-01"),
+    (pd.Timestamp("2024-03-01"), "2024-03-01"),
+    (datetime(2024, 3, 1, 14, 30), "2024-03-01 14:30:00"),
+    (12.0, "12"),
+    (12, "12"),
+    (8.5, "8.5"),
+    (None, ""),
+    (float("nan"), ""),
+    (pd.NaT, ""),
+    ("00123", "00123"),
+])
+def test_normalize_value(value, text):
+    assert normalize_value(value) == text
+
+
+def test_disk_cache_setting_survives_until_disabled(lista_xlsx, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert not data_handler.disk_cache_exists(cache_dir)
+    data_handler.enable_disk_cache(cache_dir)
+    try:
+        data_handler.get_excel_data(lista_xlsx)
+        assert any(name.endswith(".cache") for name in os.listdir(cache_dir))
+    finally:
+        data_handler.disable_disk_cache()
+    # Cerrar sin desactivarla: la siguiente sesión la encuentra activa
+    assert data_handler.disk_cache_exists(cache_dir)
+
+    data_handler.enable_disk_cache(cache_dir)
+    data_handler.clear_cache(disk=True)
+    data_handler.disable_disk_cache()
+    assert not data_handler.disk_cache_exists(cache_dir)
@@ -0,0 +1,149 @@
+# test_email_sender.py
+"""Motores de envío (hilos y asyncio) contra el servidor SMTP de prueba: mismos resultados"""
+
+import asyncio
+import ssl
+import threading
+
+import pytest
+from PyQt6.QtCore import QCoreApplication, Qt
+
+from data_handler import RecordTable
+from email_sender import EmailSender, ENGINE_THREADS, ENGINE_ASYNCIO
+from email_async import AsyncDeliveryEngine
+from smtp_server import SmtpTestServer, make_certificate
+
+ENGINES = [ENGINE_THREADS, ENGINE_ASYNCIO]
+
+
+@pytest.fixture(scope="module")
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    return make_certificate(tmp_path_factory.mktemp("tls"))
+
+
+@pytest.fixture
+def pdf_folder(tmp_path):
+    for i in range(10):
+        (tmp_path / f"P{i:04d}.pdf").write_bytes(b"%PDF-1.4 prueba\n%%EOF\n")
+    return str(tmp_path)
+
+
+def make_sender(server, pdf_folder, engine, rows=6, connections=1, password="secreto", emails=None):
+    emails = emails or [f"p{i}@example.com" for i in range(rows)]
+    records = [{"Nombre": f"Participante {i}", "Correo": email, "Archivo": f"P{i:04d}"}
+               for i, email in enumerate(emails)]
+    config = {"email": "org@example.mx", "password": password, "sender_name": "Rally",
+              "subject": "Constancia", "body": "Hola {nombre}", "name_column": "Nombre",
+              "email_column": "Correo", "filename_column": "Archivo",
+              "connections": connections, "engine": engine}
+    sender = EmailSender(config, RecordTable.from_records(records), pdf_folder)
+    sender.smtp_config["example.mx"] = {"server": "localhost", "port": server.port}
+    sender.logs = []
+    # Sin ciclo de eventos: las señales se atienden en el hilo que las emite
+    sender.log.connect(sender.logs.append, Qt.ConnectionType.DirectConnection)
+    return sender
+
+
+def trust(sender, certificate):
+    sender.tls_context = ssl.create_default_context(cafile=certificate[0])
+    return sender
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_sends_every_message(qt_app, certificate, pdf_folder, engine):
+    with SmtpTestServer(*certificate, latency=0.005) as server:
+        sender = trust(make_sender(server, pdf_folder, engine, rows=6, connections=3), certificate)
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 6 exitosos, 0 fallidos")
+    assert sorted(m["to"][0] for m in server.messages) == sorted(f"p{i}@example.com" for i in range(6))
+    assert all(m["from"] == "org@example.mx" for m in server.messages)
+    assert server.peak <= 3
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_wrong_password_stops_sending(qt_app, certificate, pdf_folder, engine):
+    with SmtpTestServer(*certificate) as server:
+        sender = trust(make_sender(server, pdf_folder, engine, password="otra"), certificate)
+        result = sender.send_emails()
+    assert result.startswith("error: Error de autenticación")
+    assert server.messages == []
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_reconnects_when_server_drops_connection(qt_app, certificate, pdf_folder, engine):
+    with SmtpTestServer(*certificate, drop_after=2) as server:
+        sender = trust(make_sender(server, pdf_folder, engine, rows=5), certificate)
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 5 exitosos, 0 fallidos")
+    assert len(server.messages) == 5
+    assert any(line.startswith("🔄") for line in sender.logs)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_continues_when_extra_connection_is_refused(qt_app, certificate, pdf_folder, engine):
+    with SmtpTestServer(*certificate, max_connections=1, latency=0.005) as server:
+        sender = trust(make_sender(server, pdf_folder, engine, rows=6, connections=3), certificate)
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 6 exitosos, 0 fallidos")
+    assert len(server.messages) == 6
+    assert server.refused >= 1 and server.peak == 1
+    assert any(line.startswith("⚠️ No se pudo abrir otra conexión") for line in sender.logs)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_non_ascii_address_fails_like_smtplib(qt_app, certificate, pdf_folder, engine):
+    emails = ["ana@example.com", "josé@example.com", "luis@example.com"]
+    with SmtpTestServer(*certificate) as server:
+        sender = trust(make_sender(server, pdf_folder, engine, emails=emails), certificate)
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 2 exitosos, 1 fallidos")
+    assert "SMTPUTF8" in result
+    assert sorted(m["to"][0] for m in server.messages) == ["ana@example.com", "luis@example.com"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_server_certificate_is_verified(qt_app, certificate, pdf_folder, engine):
+    # Con la política por defecto un certificado desconocido no se acepta en ningún motor
+    with SmtpTestServer(*certificate) as server:
+        sender = make_sender(server, pdf_folder, engine)
+        result = sender.send_emails()
+    assert result.startswith("error:")
+    assert "CERTIFICATE_VERIFY_FAILED" in result
+    assert server.messages == []
+
+
+def test_starttls_without_stream_writer_start_tls(qt_app, certificate, pdf_folder, monkeypatch):
+    # Python 3.10 y anteriores: el cliente arma flujos nuevos sobre el transporte TLS
+    monkeypatch.delattr(asyncio.StreamWriter, "start_tls", raising=False)
+    with SmtpTestServer(*certificate, drop_after=2) as server:
+        sender = trust(make_sender(server, pdf_folder, ENGINE_ASYNCIO, rows=5, connections=2), certificate)
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 5 exitosos, 0 fallidos")
+    assert len(server.messages) == 5
+
+
+class ThreadRecordingTable(RecordTable):
+    """Lista que anota en qué hilo se lee cada registro"""
+
+    def __iter__(self):
+        for row in super().__iter__():
+            self.threads.add(threading.get_ident())
+            yield row
+
+
+def test_async_engine_reads_rows_off_the_event_loop(qt_app, certificate, pdf_folder, monkeypatch):
+    loop_threads = set()
+    run = AsyncDeliveryEngine.run
+    monkeypatch.setattr(AsyncDeliveryEngine, "run", lambda self: (loop_threads.add(threading.get_ident()), run(self)))
+    with SmtpTestServer(*certificate) as server:
+        sender = trust(make_sender(server, pdf_folder, ENGINE_ASYNCIO, rows=8, connections=2), certificate)
+        sender.excel_data.__class__ = ThreadRecordingTable
+        sender.excel_data.threads = set()
+        result = sender.send_emails()
+    assert result.startswith("🎉 Envío completado: 8 exitosos, 0 fallidos")
+    assert sender.excel_data.threads and not sender.excel_data.threads & loop_threads
@@ -0,0 +1,63 @@
+# test_filename_allocator.py
+"""FilenameAllocator debe elegir exactamente los mismos nombres que la búsqueda anterior con os.path.exists"""
+
+import os
+import random
+
+import pytest
+
+from generation_engine import FilenameAllocator
+
+BASES = ["Ana", "Ana (1)", "Ana (2)", "ana", "Luis Pérez", "Luis Pérez (1) (1)", "José", "X"]
+
+
+def old_allocate(output_dir, base_name, used_filenames):
+    """Búsqueda original: prueba "Nombre", "Nombre (1)"... contra el disco y los nombres ya usados"""
+    count = 0
+    candidate = base_name
+    while True:
+        output_candidate = os.path.join(output_dir, f"{candidate}.pdf")
+        if not os.path.exists(output_candidate) and candidate not in used_filenames:
+            break
+        count += 1
+        candidate = f"{base_name} ({count})"
+    used_filenames.add(candidate)
+    return candidate
+
+
+def random_stem(rng):
+    base = rng.choice(BASES)
+    return base if rng.random() < 0.5 else f"{base} ({rng.randint(1, 6)})"
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_matches_old_loop(tmp_path, seed):
+    rng = random.Random(seed)
+    for _ in range(rng.randint(0, 15)):
+        (tmp_path / f"{random_stem(rng)}.pdf").write_bytes(b"")
+    (tmp_path / "Ana (3).docx").write_bytes(b"")  # Otra extensión: no ocupa el nombre
+    output_dir = str(tmp_path)
+
+    reserved = {random_stem(rng) for _ in range(rng.randint(0, 4))}
+    allocator = FilenameAllocator(output_dir)
+    for stem in reserved:
+        allocator.reserve(stem)
+    used_filenames = set(reserved)
+
+    names = [rng.choice(BASES) for _ in range(rng.randint(1, 60))]
+    expected = [old_allocate(output_dir, name, used_filenames) for name in names]
+    assert [allocator.allocate(name) for name in names] == expected
+    assert len(set(expected)) == len(expected)
+
+
+def test_missing_output_dir(tmp_path):
+    allocator = FilenameAllocator(str(tmp_path / "no_existe"))
+    assert [allocator.allocate("Ana") for _ in range(3)] == ["Ana", "Ana (1)", "Ana (2)"]
+
+
+def test_many_repeated_names_reuse_last_suffix(tmp_path):
+    allocator = FilenameAllocator(str(tmp_path))
+    allocator.reserve("Ana (500)")
+    names = [allocator.allocate("Ana") for _ in range(1000)]
+    assert names[0] == "Ana" and names[499] == "Ana (499)" and names[500] == "Ana (501)"
+    assert names[-1] == "Ana (1000)"
@@ -0,0 +1,121 @@
+# test_generation_engine.py
+"""Motor de generación: los registros se leen a medida que se generan las constancias"""
+
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import data_handler
+import generation_engine
+from data_handler import DeferredRecords, RecordSource
+from generation_engine import GenerationEngine
+
+
+class CountingSource(RecordSource):
+    """Fuente en memoria que cuenta cuántos registros se han leído"""
+    format_name = "prueba"
+
+    def __init__(self, rows):
+        super().__init__("lista.csv")
+        self.rows = rows
+        self.read = 0
+        self.columns = list(rows[0])
+        self.total_rows = len(rows)
+        self._select(self.columns)
+
+    def __iter__(self):
+        for row in self.rows:
+            self.read += 1
+            yield dict(row)
+
+
+@pytest.fixture
+def render(monkeypatch):
+    """
+    Sustituye la generación real. Devuelve una función para instalar un espía que
+    se llama con cada tarea antes de "generarla".
+    """
+    def install(spy):
+        def render_certificate(task, combine=None):
+            spy(task)
+            return {"output_filename": task["output_filename"], "sha256": "0" * 64,
+                    "signed": False, "sign_error": None}
+        monkeypatch.setattr(generation_engine, "render_certificate", render_certificate)
+
+    monkeypatch.setattr(generation_engine, "init_process", lambda *args, **kwargs: None)
+    return install
+
+
+def make_engine(source, tmp_path):
+    # Plantilla que no es PDF: siempre en un solo proceso (el manifiesto solo calcula su hash)
+    template = tmp_path / "plantilla.docx"
+    template.write_bytes(b"plantilla")
+    output_dir = tmp_path / "salida"
+    output_dir.mkdir()
+    return GenerationEngine(str(template), source, str(output_dir), {}, {"{{TEXT_1}}": "Nombre"},
+                            "Individual", enable_signature=False, num_workers=1)
+
+
+def test_records_are_read_while_rendering(tmp_path, render):
+    source = CountingSource([{"Nombre": f"Persona {i}"} for i in range(500)])
+    read_at_render = []
+    render(lambda task: read_at_render.append(source.read))
+    engine = make_engine(source, tmp_path)
+    engine.run()
+
+    assert engine.success_count == 500
+    # La primera constancia se genera tras leer un solo registro, no la lista completa
+    assert read_at_render == list(range(1, 501))
+
+
+def test_cancel_stops_reading_the_source(tmp_path, render):
+    source = CountingSource([{"Nombre": f"Persona {i}"} for i in range(500)])
+    engine = make_engine(source, tmp_path)
+    rendered = []
+
+    def cancel_after_ten(task):
+        rendered.append(task["index"])
+        if task["index"] == 9:
+            engine.stop()
+
+    render(cancel_after_ten)
+    engine.run()
+    assert rendered == list(range(10))
+    # A lo más se alcanza a leer el registro siguiente, no el resto de la lista
+    assert source.read <= 11
+
+
+def test_deferred_records_stream_before_full_read(tmp_path, monkeypatch):
+    # La lectura completa en segundo plano nunca termina: iter() y len() no la esperan
+    monkeypatch.setattr(data_handler, "load_in_background", lambda *args: Future())
+    path = tmp_path / "lista.csv"
+    path.write_text("Nombre,Correo\n" + "".join(f"Persona {i},p{i}@x.mx\n" for i in range(50)), encoding="utf-8")
+    records = DeferredRecords(str(path), ["Nombre", "Correo"]).select(["Nombre"])
+    result = {}
+
+    def read():
+        result["len"] = len(records)
+        result["names"] = [row["Nombre"] for row in records]
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(timeout=10)
+    assert not reader.is_alive(), "DeferredRecords esperó la lectura completa"
+    assert result == {"len": 50, "names": [f"Persona {i}" for i in range(50)]}
+
+
+@pytest.mark.parametrize("folio_column, expected", [
+    (None, ["FOLIO-000001", "FOLIO-000002", "FOLIO-000003"]),
+    ("Folio", ["A-7", "FOLIO-000002", "C-9"]),  # Celda vacía: folio secuencial
+])
+def test_folio_is_generated_without_column(tmp_path, render, folio_column, expected):
+    source = CountingSource([{"Nombre": "Ana", "Folio": "A-7"}, {"Nombre": "Luis", "Folio": ""},
+                             {"Nombre": "Eva", "Folio": "C-9"}])
+    folios = []
+    render(lambda task: folios.append((task["data_map"]["{{FOLIO}}"], task["cert_data"]["folio"])))
+    engine = make_engine(source, tmp_path)
+    engine.folio_column = folio_column
+    engine.enable_signature = True
+    engine.run()
+    assert folios == list(zip(expected, expected))
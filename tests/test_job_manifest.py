@@ -0,0 +1,178 @@
+# test_job_manifest.py
+"""Reanudación de trabajos: el manifiesto solo vale para la misma plantilla, opciones y archivos"""
+
+import json
+import os
+
+import pytest
+
+import generation_engine
+from generation_engine import GenerationEngine
+from job_manifest import JobManifest, MANIFEST_FILENAME, file_sha256, record_key
+
+OPTIONS = {"signature": True, "algorithm": "RSA-PSS-SHA256", "folio": True, "font_map": {"{{TEXT_1}}": {"size": 20}}}
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / "plantilla.docx"
+    path.write_bytes(b"plantilla v1")
+    return str(path)
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    path = tmp_path / "salida"
+    path.mkdir()
+    return str(path)
+
+
+def write_job(template, output_dir, signed=True):
+    """Trabajo de dos constancias ya terminadas; devuelve las claves de sus registros"""
+    manifest = JobManifest(output_dir)
+    manifest.start(template, 2, "Individual", OPTIONS)
+    keys = []
+    for i in range(2):
+        data_map = {"{{TEXT_1}}": f"Persona {i}"}
+        task = {"index": i, "data_map": data_map, "key": record_key(data_map),
+                "output_filename": os.path.join(output_dir, f"Persona {i}.pdf")}
+        with open(task["output_filename"], "wb") as f:
+            f.write(f"constancia {i}".encode())
+        manifest.plan(task)
+        manifest.mark_done(task, {"output_filename": task["output_filename"], "signed": signed, "sign_error": None,
+                                  "sha256": file_sha256(task["output_filename"])})
+        keys.append(task["key"])
+    manifest.close()
+    return keys
+
+
+def loaded(output_dir):
+    manifest = JobManifest(output_dir)
+    assert manifest.load()
+    return manifest
+
+
+def test_same_job_matches(template, output_dir):
+    keys = write_job(template, output_dir)
+    manifest = loaded(output_dir)
+    assert manifest.matches(template, 2, "Individual", dict(OPTIONS))
+    assert manifest.verified_output(0, keys[0], require_signed=True) == os.path.join(output_dir, "Persona 0.pdf")
+
+
+@pytest.mark.parametrize("change", [
+    {"signature": False},
+    {"algorithm": "Ed25519"},
+    {"folio": False},
+    {"font_map": {"{{TEXT_1}}": {"size": 22}}},
+])
+def test_changed_options_do_not_match(template, output_dir, change):
+    write_job(template, output_dir)
+    assert not loaded(output_dir).matches(template, 2, "Individual", {**OPTIONS, **change})
+
+
+def test_changed_template_content_does_not_match(template, output_dir):
+    write_job(template, output_dir)
+    with open(template, "wb") as f:
+        f.write(b"plantilla v2")  # Misma ruta, otro contenido (otro sha256)
+    assert not loaded(output_dir).matches(template, 2, "Individual", OPTIONS)
+
+
+@pytest.mark.parametrize("total, export_mode", [(3, "Individual"), (2, "Un solo PDF combinado")])
+def test_changed_list_or_mode_does_not_match(template, output_dir, total, export_mode):
+    write_job(template, output_dir)
+    assert not loaded(output_dir).matches(template, total, export_mode, OPTIONS)
+
+
+def test_older_manifest_version_does_not_match(template, output_dir):
+    write_job(template, output_dir)
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    lines = open(path, encoding="utf-8").read().splitlines()
+    header = json.loads(lines[0])
+    header["version"] = 1
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join([json.dumps(header)] + lines[1:]) + "\n")
+    assert not loaded(output_dir).matches(template, 2, "Individual", OPTIONS)
+
+
+def test_tampered_deleted_or_changed_outputs_are_not_verified(template, output_dir):
+    keys = write_job(template, output_dir)
+    with open(os.path.join(output_dir, "Persona 0.pdf"), "ab") as f:
+        f.write(b"modificada")
+    os.remove(os.path.join(output_dir, "Persona 1.pdf"))
+    manifest = loaded(output_dir)
+    assert manifest.verified_output(0, keys[0]) is None
+    assert manifest.verified_output(1, keys[1]) is None
+
+
+def test_changed_record_or_unsigned_output_is_not_verified(template, output_dir):
+    keys = write_job(template, output_dir, signed=False)
+    manifest = loaded(output_dir)
+    assert manifest.verified_output(0, "otra-clave") is None
+    assert manifest.verified_output(0, keys[0], require_signed=True) is None
+    assert manifest.verified_output(0, keys[0], require_signed=False) is not None
+
+
+def test_truncated_last_line_is_ignored(template, output_dir):
+    keys = write_job(template, output_dir)
+    with open(os.path.join(output_dir, MANIFEST_FILENAME), "a", encoding="utf-8") as f:
+        f.write('{"type": "done", "index": 1, "outp')  # Cierre a mitad de escritura
+    manifest = loaded(output_dir)
+    assert manifest.verified_output(1, keys[1]) is not None
+
+
+# --- Reanudación con el motor de generación ---
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """Generación simulada: escribe un archivo por constancia y registra qué se generó"""
+    calls = []
+
+    def render_certificate(task, combine=None):
+        calls.append(task["index"])
+        with open(task["output_filename"], "wb") as f:
+            f.write(json.dumps(task["data_map"], sort_keys=True).encode())
+        return {"output_filename": task["output_filename"], "sha256": file_sha256(task["output_filename"]),
+                "signed": False, "sign_error": None}
+
+    monkeypatch.setattr(generation_engine, "init_process", lambda *args, **kwargs: None)
+    monkeypatch.setattr(generation_engine, "render_certificate", render_certificate)
+    return calls
+
+
+def run_engine(template, output_dir, records, resume, font_size=20):
+    engine = GenerationEngine(template, records, output_dir, {"{{TEXT_1}}": {"size": font_size}},
+                              {"{{TEXT_1}}": "Nombre"}, "Individual", enable_signature=False,
+                              num_workers=1, resume=resume)
+    engine.run()
+    return engine
+
+
+def test_resume_renders_only_missing_or_invalid_outputs(template, output_dir, rendered):
+    records = [{"Nombre": f"Persona {i % 3}"} for i in range(6)]  # Nombres repetidos: "Persona 0 (1)"...
+    run_engine(template, output_dir, records, resume=False)
+    assert rendered == list(range(6))
+    names = sorted(f for f in os.listdir(output_dir) if f.endswith(".pdf"))
+
+    with open(os.path.join(output_dir, "Persona 1.pdf"), "ab") as f:
+        f.write(b"modificada")
+    os.remove(os.path.join(output_dir, "Persona 2 (1).pdf"))
+    rendered.clear()
+    engine = run_engine(template, output_dir, records, resume=True)
+
+    assert sorted(rendered) == [1, 5]
+    assert engine.skipped_count == 4
+    # Se vuelven a generar con el mismo nombre, sin crear "Persona 1 (2)"
+    assert sorted(f for f in os.listdir(output_dir) if f.endswith(".pdf")) == names
+
+    rendered.clear()
+    assert run_engine(template, output_dir, records, resume=True).skipped_count == 6
+    assert rendered == []
+
+
+def test_resume_with_other_options_starts_a_new_job(template, output_dir, rendered):
+    records = [{"Nombre": f"Persona {i}"} for i in range(3)]
+    run_engine(template, output_dir, records, resume=False)
+    rendered.clear()
+    engine = run_engine(template, output_dir, records, resume=True, font_size=24)
+    assert rendered == [0, 1, 2]
+    assert engine.skipped_count == 0
@@ -0,0 +1,97 @@
+# test_merkle.py
+"""Firma por lotes: árbol de Merkle, pruebas de inclusión y verificación"""
+
+import copy
+
+import pytest
+
+from signature import (MerkleBatch, sign_batch, verify_signed_metadata, build_merkle_levels,
+                       merkle_proof, merkle_root_from_proof, canonicalize_payload, _merkle_leaf)
+
+
+def cert(i):
+    return {"nombre": f"Persona {i}", "evento": "Rally 2026", "folio": f"FOLIO-{i:06d}",
+            "fecha_emision": "2026-10-17", "institucion": "Universidad de Sonora"}
+
+
+def verify(metadata, signer):
+    return verify_signed_metadata(metadata, signer.public_key_path)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 8, 13])
+def test_every_certificate_verifies(signer, size):
+    metadata = sign_batch([cert(i) for i in range(size)], signer)
+    assert len(metadata) == size
+    assert len({m["signature"] for m in metadata}) == 1  # Una sola firma para todo el lote
+    assert all(m["batch"]["size"] == size and m["batch"]["index"] == i for i, m in enumerate(metadata))
+    assert all(verify(m, signer) for m in metadata)
+
+
+@pytest.mark.parametrize("size, index, steps", [(3, 2, 1), (5, 4, 1), (6, 4, 2), (7, 6, 2)])
+def test_unpaired_node_is_promoted(size, index, steps):
+    # El último nodo sin pareja sube sin modificarse: su prueba tiene menos pasos
+    leaves = [_merkle_leaf(bytes([i])) for i in range(size)]
+    levels = build_merkle_levels(leaves)
+    proof = merkle_proof(levels, index)
+    assert len(proof) == steps
+    assert merkle_root_from_proof(bytes([index]), proof) == levels[-1][0]
+
+
+def test_proofs_rebuild_the_root():
+    leaves = [_merkle_leaf(bytes([i])) for i in range(11)]
+    levels = build_merkle_levels(leaves)
+    for index in range(11):
+        assert merkle_root_from_proof(bytes([index]), merkle_proof(levels, index)) == levels[-1][0]
+
+
+def test_single_leaf_is_its_own_root():
+    levels = build_merkle_levels([_merkle_leaf(b"x")])
+    assert merkle_proof(levels, 0) == []
+    assert levels[-1][0] == _merkle_leaf(b"x")
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda m: m["payload"]["data"].update(nombre="Otra Persona"),
+    lambda m: m["payload"].update(issued_at="2000-01-01T00:00:00Z"),
+    lambda m: m["batch"]["proof"].reverse(),
+    lambda m: m["batch"]["proof"].pop(),
+    lambda m: m["batch"]["proof"].__setitem__(0, ("R" if m["batch"]["proof"][0][0] == "L" else "L")
+                                                + m["batch"]["proof"][0][1:]),
+    lambda m: m["batch"].update(root=m["batch"]["proof"][0][1:]),
+    lambda m: m["batch"].update(scheme="otro"),
+])
+def test_tampering_is_detected(signer, tamper):
+    metadata = sign_batch([cert(i) for i in range(5)], signer)
+    tampered = copy.deepcopy(metadata[1])
+    tamper(tampered)
+    assert verify(metadata[1], signer)
+    assert not verify(tampered, signer)
+
+
+def test_proof_of_another_certificate_fails(signer):
+    metadata = sign_batch([cert(i) for i in range(4)], signer)
+    swapped = copy.deepcopy(metadata[0])
+    swapped["batch"]["proof"] = metadata[1]["batch"]["proof"]
+    assert not verify(swapped, signer)
+
+
+def test_root_signed_by_another_key_fails(signer, tmp_path):
+    from signature import Signer
+    other = Signer(str(tmp_path / "otra.pem"), str(tmp_path / "otra_pub.pem"), algorithm=signer.algorithm)
+    metadata = sign_batch([cert(i) for i in range(3)], other)[0]
+    metadata["pubkey_id"] = None
+    assert not verify(metadata, signer)
+
+
+def test_batch_rebuilds_metadata_from_leaves(signer):
+    # MerkleBatch solo guarda las hojas: la metadata se rearma con los mismos datos
+    batch = MerkleBatch(signer)
+    for i in range(6):
+        batch.add(cert(i))
+    batch.sign()
+    metadata = batch.metadata(3, cert(3))
+    assert verify(metadata, signer)
+    assert metadata["payload"]["issued_at"] == batch.issued_at
+    assert canonicalize_payload(metadata["payload"]) == canonicalize_payload(batch.payload(cert(3)))
+    with pytest.raises(ValueError):
+        batch.metadata(3, cert(4))
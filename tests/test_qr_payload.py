@@ -0,0 +1,101 @@
+# test_qr_payload.py
+"""Formato compacto del QR (RC1: base45 + zlib): ida y vuelta y entradas inválidas"""
+
+import json
+import os
+
+import pytest
+
+from signature import (base45_encode, base45_decode, encode_qr_payload, decode_qr_payload,
+                       sign_batch, verify_signed_metadata, _sign_certificate, QR_COMPACT_PREFIX)
+from verify_signature import verify_qr_text
+
+
+def cert(i=0, **changes):
+    data = {"nombre": f"María Ñandú {i}", "evento": "Rally 2026", "folio": f"FOLIO-{i:06d}",
+            "fecha_emision": "2026-10-17", "institucion": "Universidad de Sonora"}
+    data.update(changes)
+    return data
+
+
+@pytest.mark.parametrize("data, text", [
+    # Vectores del borrador de Base45 (draft-faltstrom-base45)
+    (b"AB", "BB8"),
+    (b"Hello!!", "%69 VD92EX0"),
+    (b"base-45", "UJCLQE7W581"),
+    (b"", ""),
+])
+def test_base45_vectors(data, text):
+    assert base45_encode(data) == text
+    assert base45_decode(text) == data
+
+
+def test_base45_round_trip():
+    for size in range(0, 65):
+        data = os.urandom(size)
+        assert base45_decode(base45_encode(data)) == data
+
+
+@pytest.mark.parametrize("text", ["GGW", "ZZZ", "A", "abc", "AB#"])
+def test_base45_rejects_invalid_text(text):
+    with pytest.raises(ValueError):
+        base45_decode(text)
+
+
+def test_individual_signature_round_trip(signer):
+    metadata, qr_text = _sign_certificate(cert(), signer=signer)
+    assert qr_text.startswith(QR_COMPACT_PREFIX)
+    assert decode_qr_payload(qr_text) == metadata
+    assert verify_signed_metadata(decode_qr_payload(qr_text), signer.public_key_path)
+
+
+def test_batch_round_trip(signer):
+    for metadata in sign_batch([cert(i) for i in range(5)], signer):
+        qr_text = encode_qr_payload(metadata)
+        assert qr_text.startswith(QR_COMPACT_PREFIX)
+        # La raíz no viaja en el QR: se recalcula con la prueba
+        assert decode_qr_payload(qr_text) == metadata
+
+
+def test_other_institution_round_trip(signer):
+    metadata, qr_text = _sign_certificate(cert(institucion="Otra Universidad"), signer=signer)
+    assert decode_qr_payload(qr_text) == metadata
+
+
+def test_non_standard_data_falls_back_to_json(signer):
+    metadata, _ = _sign_certificate(cert(), signer=signer)
+    metadata["payload"]["extra"] = "campo nuevo"
+    qr_text = encode_qr_payload(metadata)
+    assert not qr_text.startswith(QR_COMPACT_PREFIX)
+    assert json.loads(qr_text) == metadata
+    assert decode_qr_payload(qr_text) == metadata
+
+
+def test_legacy_json_still_decodes(signer):
+    metadata, _ = _sign_certificate(cert(), signer=signer)
+    assert decode_qr_payload(json.dumps(metadata)) == metadata
+
+
+@pytest.mark.parametrize("text", [
+    "RC1:",
+    "RC1:@@@",
+    "RC1:0",
+    "RC1:" + base45_encode(b"\x07\x00\x01x\x00"),          # algoritmo desconocido
+    "RC1:" + base45_encode(b"\x00\x00\x02ab\x00nozlib"),  # zlib inválido
+    "RC1:" + base45_encode(b"\x00\xff\xff"),              # firma más larga que el QR
+    "no es un qr",
+    "",
+])
+def test_garbage_is_reported_not_raised(signer, text):
+    valid, message, _ = verify_qr_text(text, signer.public_key_path)
+    assert not valid
+    assert "ilegible" in message
+
+
+def test_tampered_qr_is_rejected(signer):
+    _, qr_text = _sign_certificate(cert(), signer=signer)
+    binary = bytearray(base45_decode(qr_text[len(QR_COMPACT_PREFIX):]))
+    binary[5] ^= 0x01  # Un bit de la firma
+    valid, _, _ = verify_qr_text(QR_COMPACT_PREFIX + base45_encode(bytes(binary)), signer.public_key_path)
+    assert not valid
+    assert verify_qr_text(qr_text, signer.public_key_path)[0]
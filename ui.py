@@ -9,12 +9,14 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QPixmap, QImage, QIcon, QTextCursor, QTextCharFormat, QTextBlockFormat, QTextFormat, QFont, QColor
 from PyQt6.QtCore import Qt, QRegularExpression, QSize, pyqtSignal
-from datetime import datetime
 
 # Importaciones de nuestros módulos
 from resource_manager import resource_path
-from data_handler import get_excel_data
+from data_handler import (read_header, count_records, DeferredRecords, enable_disk_cache, disable_disk_cache,
+                          clear_cache, default_disk_cache_dir, disk_cache_exists, FILE_DIALOG_FILTER)
 from worker import Worker
+from log_buffer import BufferedLog, LOG_FILENAME
+from email_sender import DEFAULT_CONNECTIONS, MAX_CONNECTIONS, ENGINE_THREADS, ENGINE_ASYNCIO
 from document_processor import get_processor, PdfProcessor
 
 # Importaciones de las nuevas mejoras
@@ -280,6 +282,18 @@ class EmailSenderDialog(QDialog):
         self.sender_name_entry.setPlaceholderText("Nombre del remitente")
         self.sender_name_entry.textChanged.connect(self.validate_form)
         email_form.addRow("Nombre del remitente:", self.sender_name_entry)
+
+        self.connections_spin = QSpinBox()
+        self.connections_spin.setRange(1, MAX_CONNECTIONS)
+        self.connections_spin.setValue(DEFAULT_CONNECTIONS)
+        self.connections_spin.setToolTip("Conexiones SMTP que envían correos al mismo tiempo (Outlook/Office 365 admite hasta 3)")
+        email_form.addRow("Conexiones simultáneas:", self.connections_spin)
+
+        self.engine_combo = ModernComboBox()
+        self.engine_combo.addItem("Hilos (un hilo por conexión)", ENGINE_THREADS)
+        self.engine_combo.addItem("asyncio (un solo hilo, para listas grandes)", ENGINE_ASYNCIO)
+        self.engine_combo.setToolTip("Forma de atender las conexiones; ambos respetan el límite de conexiones del servidor")
+        email_form.addRow("Motor de envío:", self.engine_combo)
         
         email_section.addLayout(email_form)
         content_layout.addWidget(email_section)
@@ -435,7 +449,7 @@ class EmailSenderDialog(QDialog):
 
     def select_excel_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Seleccionar archivo Excel", "", "Excel (*.xlsx *.xls)"
+            self, "Seleccionar archivo Excel", "", FILE_DIALOG_FILTER
         )
         if file_path:
             self.excel_file_entry.setText(file_path)
@@ -444,8 +458,8 @@ class EmailSenderDialog(QDialog):
 
     def load_excel_columns(self, excel_path):
         try:
-            from data_handler import get_excel_data
-            columns, data = get_excel_data(excel_path)
+            # Solo hacen falta los encabezados; la lista completa se lee al enviar
+            columns, _ = read_header(excel_path)
             
             self.name_column_combo.clear()
             self.email_column_combo.clear()
@@ -599,18 +613,27 @@ class EmailSenderDialog(QDialog):
         if not self.validate_sending():
             return
         
+        # La lista completa se empieza a leer en segundo plano mientras se confirma el envío
+        try:
+            columns, _ = read_header(self.excel_file_entry.text())
+            self.pending_records = DeferredRecords(self.excel_file_entry.text(), columns)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo leer el archivo Excel: {str(e)}")
+            return
+        
         # Confirmar envío
         total_records = self.get_total_records()
         if total_records == 0:
             QMessageBox.warning(self, "Sin datos", "No se encontraron registros en el Excel.")
             return
+        records_text = f"{total_records} registros" if total_records is not None else "registros por contar"
         
         confirm_msg = f"""
 ¿Está seguro de que desea enviar los correos?
 
 📧 Correo remitente: {self.email_entry.text()}
 📁 Carpeta PDFs: {os.path.basename(self.pdf_folder_entry.text())}
-📊 Archivo Excel: {os.path.basename(self.excel_file_entry.text())} ({total_records} registros)
+📊 Archivo Excel: {os.path.basename(self.excel_file_entry.text())} ({records_text})
 📝 Columnas mapeadas:
    • Nombre: {self.name_column_combo.currentText()}
    • Correo: {self.email_column_combo.currentText()}
@@ -666,22 +689,19 @@ class EmailSenderDialog(QDialog):
         return True
 
     def get_total_records(self):
-        """Obtiene el número total de registros en el Excel"""
+        """Número de registros en el Excel sin leerlo completo (None si no se sabe todavía)"""
         try:
-            from data_handler import get_excel_data
-            _, data = get_excel_data(self.excel_file_entry.text())
-            return len(data)
+            return count_records(self.excel_file_entry.text())
         except:
             return 0
 
     def execute_sending(self):
         """Ejecuta el envío real de correos"""
         try:
-            from data_handler import get_excel_data
             from email_sender import EmailSender
             
-            # Cargar datos del Excel
-            columns, excel_data = get_excel_data(self.excel_file_entry.text())
+            # Datos del Excel: se terminan de leer en el hilo del envío
+            excel_data = self.pending_records
             
             # Configuración para el envío
             config = {
@@ -692,7 +712,9 @@ class EmailSenderDialog(QDialog):
                 'body': self.body_text.toHtml() if self.body_text.toHtml().strip() else self.body_text.toPlainText().strip(),
                 'name_column': self.name_column_combo.currentText(),
                 'email_column': self.email_column_combo.currentText(),
-                'filename_column': self.filename_column_combo.currentText()
+                'filename_column': self.filename_column_combo.currentText(),
+                'connections': self.connections_spin.value(),
+                'engine': self.engine_combo.currentData()
             }
             
             # Crear y configurar el enviador de correos
@@ -884,8 +906,9 @@ class App(QMainWindow):
 
         # Estado de la aplicación
         self.template_path = ""
-        self.excel_data = []
+        self.excel_path = ""
         self.excel_columns = []
+        self.excel_rows = None  # None: se sabrá al leer la lista completa
         self.folio_color = QColor("#000000")  # Color por defecto para folio
 
         # Inicializar sistemas mejorados
@@ -1048,6 +1071,8 @@ class App(QMainWindow):
             border-radius: 6px;
         """)
         log_layout.addWidget(self.log_box)
+        # Los mensajes se agregan al panel en bloques (ver log_buffer.py)
+        self.log_buffer = BufferedLog(self.log_box, parent=self)
         
         preview_tabs.addTab(preview_widget, "👁️ Previsualización")
         preview_tabs.addTab(log_widget, "📝 Registro")
@@ -1368,6 +1393,22 @@ class App(QMainWindow):
         """)
         layout.addWidget(self.signature_checkbox)
         
+        # Firma por lotes: una sola firma por trabajo (RSA-PSS o Ed25519) (raíz de Merkle) y prueba de inclusión por constancia
+        self.batch_signing_checkbox = QCheckBox("⚡ Firma por lotes (recomendado para listas grandes)")
+        self.batch_signing_checkbox.setChecked(False)
+        self.batch_signing_checkbox.setToolTip("Firma una sola vez todo el lote; cada constancia incluye su prueba de inclusión")
+        self.signature_checkbox.toggled.connect(self.batch_signing_checkbox.setEnabled)
+        layout.addWidget(self.batch_signing_checkbox)
+        
+        # Algoritmo de firma: Ed25519 firma más rápido y produce un QR más pequeño
+        from signature import ALG_RSA_PSS, ALG_ED25519
+        self.signature_algorithm_combo = ModernComboBox()
+        self.signature_algorithm_combo.addItem("RSA-PSS (SHA-256)", ALG_RSA_PSS)
+        self.signature_algorithm_combo.addItem("Ed25519 (más rápido, QR más pequeño)", ALG_ED25519)
+        self.signature_checkbox.toggled.connect(self.signature_algorithm_combo.setEnabled)
+        layout.addWidget(ModernLabel("Algoritmo de firma:"))
+        layout.addWidget(self.signature_algorithm_combo)
+        
         # Información sobre la función
         info_label = ModernLabel("Cuando está activado: Se inserta código QR con firma digital\nCuando está desactivado: Se genera constancia sin QR ni firma")
         info_label.setStyleSheet("""
@@ -1450,8 +1491,46 @@ class App(QMainWindow):
         layout.addWidget(ModernLabel("Modo de exportación:"))
         layout.addWidget(self.export_mode_combo)
         
+        # Procesos para generación en paralelo (solo plantillas PDF)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1) * 2)
+        self.workers_spin.setValue(max(1, os.cpu_count() or 1))
+        self.workers_spin.setToolTip("Número de procesos para generar constancias PDF en paralelo")
+        layout.addWidget(ModernLabel("Procesos en paralelo:"))
+        layout.addWidget(self.workers_spin)
+        
+        # Reanudar un trabajo interrumpido con el manifiesto guardado en la carpeta de salida
+        self.resume_checkbox = QCheckBox("↩️ Reanudar trabajo anterior (omite constancias ya generadas)")
+        self.resume_checkbox.setChecked(False)
+        self.resume_checkbox.setToolTip("Usa el manifiesto de la carpeta de salida y verifica el hash de cada constancia antes de omitirla")
+        layout.addWidget(self.resume_checkbox)
+        
+        # Registro completo en disco (el panel solo conserva las últimas líneas)
+        self.log_file_checkbox = QCheckBox("📝 Guardar registro completo en la carpeta de salida")
+        self.log_file_checkbox.setChecked(False)
+        self.log_file_checkbox.setToolTip(f"Escribe todos los mensajes del proceso en {LOG_FILENAME}")
+        layout.addWidget(self.log_file_checkbox)
+        
+        # Caché en disco de las listas ya leídas (guarda nombres y correos sin cifrar)
+        self.disk_cache_checkbox = QCheckBox("💾 Recordar listas de Excel entre sesiones")
+        self.disk_cache_checkbox.setChecked(False)
+        self.disk_cache_checkbox.setToolTip(f"Guarda una copia de las listas leídas en {default_disk_cache_dir()} para abrirlas más rápido; "
+                                            "al desmarcarla se borran")
+        self.disk_cache_checkbox.toggled.connect(self.toggle_disk_cache)
+        # La carpeta de la caché recuerda la elección de la sesión anterior
+        self.disk_cache_checkbox.setChecked(disk_cache_exists())
+        layout.addWidget(self.disk_cache_checkbox)
+        
         return widget
 
+    def toggle_disk_cache(self, enabled):
+        """Activa la caché de listas en disco, o la borra (con su carpeta) al desactivarla"""
+        if enabled:
+            enable_disk_cache()
+        else:
+            clear_cache(disk=True)
+            disable_disk_cache()
+
     def create_actions_section(self):
         widget = QWidget()
         layout = QVBoxLayout(widget)
@@ -1620,11 +1699,14 @@ class App(QMainWindow):
 
     def load_excel(self):
         path, _ = QFileDialog.getOpenFileName(
-            self, "Seleccionar Archivo Excel", "", "Excel (*.xlsx *.xls);;Todos los archivos (*)"
+            self, "Seleccionar Archivo Excel", "", FILE_DIALOG_FILTER
         )
         if path:
             try:
-                self.excel_columns, self.excel_data = get_excel_data(path)
+                # Solo se leen los encabezados; la lista completa se lee en segundo plano al generar
+                self.excel_columns, _ = read_header(path)
+                self.excel_rows = count_records(path)
+                self.excel_path = path
                 self.lbl_excel_path.setText(os.path.basename(path))
                 self.combo_text1.clear()
                 self.combo_text2.clear()
@@ -1647,13 +1729,21 @@ class App(QMainWindow):
                 except:
                     pass
                     
-                self.log_message(f"📊 Lista cargada con {len(self.excel_data)} registros.")
+                if self.excel_rows is not None:
+                    self.log_message(f"📊 Lista cargada con {self.excel_rows} registros.")
+                else:
+                    self.log_message("📊 Lista cargada (los registros se cuentan al generar).")
                 self.log_message(f"📋 Columnas detectadas: {', '.join(self.excel_columns)}")
             
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Error al cargar Excel: {str(e)}")
                 self.log_message(f"❌ Error: {e}")
 
+    def excel_rows_text(self):
+        if self.excel_rows is None:
+            return "registros por contar"
+        return f"{self.excel_rows} registros"
+
     def apply_validation_text(self):
         """Aplica la leyenda de validación personalizada"""
         validation_text = self.validation_text_entry.text().strip()
@@ -1694,8 +1784,8 @@ class App(QMainWindow):
             validation_results.append("❌ No hay plantilla cargada")
     
         # Validar datos Excel
-        if hasattr(self, 'excel_data') and self.excel_data:
-            validation_results.append(f"✅ Excel válido ({len(self.excel_data)} registros)")
+        if self.excel_path:
+            validation_results.append(f"✅ Excel válido ({self.excel_rows_text()})")
             validation_results.append(f"📋 Columnas: {', '.join(self.excel_columns)}")
         else:
             validation_results.append("❌ No hay datos de Excel cargados")
@@ -1745,7 +1835,7 @@ class App(QMainWindow):
             QMessageBox.warning(self, "Archivos Faltantes", "Seleccione una plantilla primero.")
             return
         
-        if not hasattr(self, 'excel_data') or not self.excel_data:
+        if not self.excel_path or not os.path.exists(self.excel_path):
             QMessageBox.warning(self, "Archivos Faltantes", "Cargue un archivo Excel primero.")
             return
         
@@ -1791,10 +1881,20 @@ class App(QMainWindow):
         self.btn_cancel.setEnabled(True)
         self.progress_bar.setValue(0)
 
+        if self.log_file_checkbox.isChecked():
+            log_path = os.path.join(output_dir, LOG_FILENAME)
+            if self.log_buffer.open_file(log_path):
+                self.log_message(f"📝 Registro completo en: {log_path}")
+
+        # La lista completa se lee en segundo plano; mientras tanto el Worker lee los registros del archivo
+        # a medida que los genera, y solo recibe las columnas que usa
+        used_columns = list(placeholder_map.values()) + [c for c in (filename_column, folio_column) if c]
+        excel_data = DeferredRecords(self.excel_path, self.excel_columns).select(list(dict.fromkeys(used_columns)))
+
         # Pasar los parámetros al worker
         self.worker = Worker(
             self.template_path, 
-            self.excel_data, 
+            excel_data, 
             output_dir, 
             font_map, 
             placeholder_map, 
@@ -1803,7 +1903,11 @@ class App(QMainWindow):
             enable_signature,
             enable_folio,
             folio_column,
-            folio_font_map
+            folio_font_map,
+            self.workers_spin.value(),
+            enable_signature and self.batch_signing_checkbox.isChecked(),
+            self.signature_algorithm_combo.currentData(),
+            self.resume_checkbox.isChecked()
         )
     
         self.worker.progress.connect(self.progress_bar.setValue)
@@ -1836,12 +1940,12 @@ class App(QMainWindow):
         else:
             QMessageBox.information(self, "Proceso Finalizado", message)
             self.log_message(f"🎉 {message}")
+        self.log_buffer.flush()
+        self.log_buffer.close_file()
         self.performance_optimizer.optimize_memory()
 
     def log_message(self, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_box.append(f"[{timestamp}] {message}")
-        self.log_box.verticalScrollBar().setValue(self.log_box.verticalScrollBar().maximum())
+        self.log_buffer.append(message)
 
     def open_email_sender(self):
         """Abre el diálogo para enviar constancias por correo"""
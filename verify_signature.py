@@ -12,7 +12,7 @@ from docx import Document
 from pptx import Presentation
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
-from signature import verify_signature, canonicalize_payload, PUBLIC_KEY_PATH
+from signature import verify_signed_metadata, decode_qr_payload, PUBLIC_KEY_PATH
 
 
 def _extract_from_pdf(path):
@@ -122,7 +122,8 @@ def verify_document(path, public_key_path=PUBLIC_KEY_PATH):
     if not payload or not sig:
         return False, "Firma dañada o incompleta", meta
 
-    ok = verify_signature(public_key_path, canonicalize_payload(payload), sig)
+    # Acepta firma individual y firma por lotes (árbol de Merkle)
+    ok = verify_signed_metadata(meta, public_key_path)
     if ok:
         return True, "✅ Firma válida e íntegra", meta
 
@@ -135,3 +136,17 @@ def verify_document(path, public_key_path=PUBLIC_KEY_PATH):
     elif ext in (".pptx", ".ppt"):
         mark_pptx_modified(path, out)
     return False, f"❌ Documento manipulado, se generó {out}", meta
+
+
+def verify_qr_text(qr_text, public_key_path=PUBLIC_KEY_PATH):
+    """
+    Verifica el contenido leído del QR de una constancia.
+    Acepta el formato compacto (RC1:...) y el JSON completo de versiones anteriores.
+    """
+    try:
+        meta = decode_qr_payload(qr_text.strip())
+    except Exception:
+        return False, "Código QR ilegible o con formato desconocido", None
+    if verify_signed_metadata(meta, public_key_path):
+        return True, "✅ Firma válida e íntegra", meta
+    return False, "❌ La firma del código QR no es válida", meta